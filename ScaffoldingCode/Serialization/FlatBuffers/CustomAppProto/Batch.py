@@ -0,0 +1,63 @@
+# automatically generated by the FlatBuffers compiler, do not modify
+
+# namespace: CustomAppProto
+
+import flatbuffers
+from flatbuffers.compat import import_numpy
+np = import_numpy()
+
+class Batch(object):
+    __slots__ = ['_tab']
+
+    @classmethod
+    def GetRootAs(cls, buf, offset=0):
+        n = flatbuffers.encode.Get(flatbuffers.packer.uoffset, buf, offset)
+        x = Batch()
+        x.Init(buf, n + offset)
+        return x
+
+    @classmethod
+    def GetRootAsBatch(cls, buf, offset=0):
+        """This method is deprecated. Please switch to GetRootAs."""
+        return cls.GetRootAs(buf, offset)
+    # Batch
+    def Init(self, buf, pos):
+        self._tab = flatbuffers.table.Table(buf, pos)
+
+    # Batch
+    def Msgs(self, j):
+        o = flatbuffers.number_types.UOffsetTFlags.py_type(self._tab.Offset(4))
+        if o != 0:
+            x = self._tab.Vector(o)
+            x += flatbuffers.number_types.UOffsetTFlags.py_type(j) * 4
+            x = self._tab.Indirect(x)
+            from CustomAppProto.Message import Message
+            obj = Message()
+            obj.Init(self._tab.Bytes, x)
+            return obj
+        return None
+
+    # Batch
+    def MsgsLength(self):
+        o = flatbuffers.number_types.UOffsetTFlags.py_type(self._tab.Offset(4))
+        if o != 0:
+            return self._tab.VectorLen(o)
+        return 0
+
+    # Batch
+    def MsgsIsNone(self):
+        o = flatbuffers.number_types.UOffsetTFlags.py_type(self._tab.Offset(4))
+        return o == 0
+
+def BatchStart(builder): builder.StartObject(1)
+def Start(builder):
+    return BatchStart(builder)
+def BatchAddMsgs(builder, msgs): builder.PrependUOffsetTRelativeSlot(0, flatbuffers.number_types.UOffsetTFlags.py_type(msgs), 0)
+def AddMsgs(builder, msgs):
+    return BatchAddMsgs(builder, msgs)
+def BatchStartMsgsVector(builder, numElems): return builder.StartVector(4, numElems, 4)
+def StartMsgsVector(builder, numElems):
+    return BatchStartMsgsVector(builder, numElems)
+def BatchEnd(builder): return builder.EndObject()
+def End(builder):
+    return BatchEnd(builder)
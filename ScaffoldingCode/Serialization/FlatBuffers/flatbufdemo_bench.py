@@ -0,0 +1,178 @@
+#  Author: Aniruddha Gokhale
+#  Created: Fall 2021
+#  Modified: Fall 2022 (for Computer Networking course)
+#
+#  Purpose: benchmark the cost of FlatBuffers serialization of our custom
+#  message as the vector field grows. We compare the original approach of
+#  prepending the vector one element at a time against writing the
+#  whole vector in bulk, and against patching a prebuilt message template
+#  in place. On the receiving side we compare copying every field
+#  into a native custom message against a lazy view that only reads the seq
+#  num and timestamp. Finally, we send the messages over a local ZMQ
+#  connection with and without copying them in user space.
+#
+#  Here our custom message format comprises a sequence number, a timestamp, a name,
+#  and a data buffer of several uint32 numbers (whose value is not relevant to us)
+
+# The different packages we need in this Python driver code
+import os
+import sys
+import time  # needed for timing measurements
+
+import argparse  # argument parser
+import numpy as np  # for generating the vector contents
+
+import zmq   # for the transfer over ZeroMQ
+
+## the following are our files
+from custom_msg import CustomMessage  # our custom message in native format
+import serialize as sz  # this is from the file serialize.py in the same directory
+
+##################################
+#        Benchmark helpers
+##################################
+
+# time the serialization of the custom message for the given number of
+# iterations and return the average time per message in seconds
+def time_serialize (cm, iters, bulk):
+  start_time = time.perf_counter ()
+  for i in range (iters):
+    buf = sz.serialize (cm, bulk=bulk)
+  end_time = time.perf_counter ()
+  return (end_time - start_time) / iters, buf
+
+# time patching a message template for the given number of iterations and
+# return the average time per message in seconds
+def time_template (cm, iters, with_vec):
+  template = sz.MessageTemplate (cm)
+  start_time = time.perf_counter ()
+  for i in range (iters):
+    buf = template.update (i, cm.ts, cm.vec if with_vec else None)
+  end_time = time.perf_counter ()
+  return (end_time - start_time) / iters
+
+# time the deserialization of the buffer where the consumer only reads the
+# seq num and timestamp, and return the average time per message in seconds
+def time_deserialize (buf, iters, lazy):
+  start_time = time.perf_counter ()
+  for i in range (iters):
+    if lazy:
+      cm = sz.deserialize_view (buf)
+    else:
+      cm = sz.deserialize (buf)
+    seq_num, ts = cm.seq_num, cm.ts
+  end_time = time.perf_counter ()
+  return (end_time - start_time) / iters
+
+# time sending the buffer over a local ZMQ connection and parsing a view of
+# it on the other end (which reads the whole vector), and return the average
+# time per message in seconds. Either the buffer is copied into the zmq
+# message and out of it again, or zmq sends the buffer itself (if it is at
+# least zmq.COPY_THRESHOLD bytes) and we parse the view directly over the
+# received zmq message.
+def time_transfer (buf, iters, zerocopy):
+  context = zmq.Context.instance ()
+  receiver = context.socket (zmq.PAIR)
+  port = receiver.bind_to_random_port ("tcp://127.0.0.1")
+  sender = context.socket (zmq.PAIR)
+  sender.connect ("tcp://127.0.0.1:{}".format (port))
+
+  start_time = time.perf_counter ()
+  for i in range (iters):
+    if zerocopy:
+      sender.send (buf, copy=False)
+      view = sz.deserialize_view (receiver.recv (copy=False).buffer)
+    else:
+      sender.send (buf)
+      view = sz.deserialize_view (receiver.recv ())
+    total = int (view.vec.sum ())
+  end_time = time.perf_counter ()
+
+  sender.close ()
+  receiver.close ()
+  return (end_time - start_time) / iters
+
+##################################
+#        Driver program
+##################################
+
+def driver (name, iters, veclens):
+
+  print ("Driver program: Name = {}, Num Iters = {}, Vector lens = {}".format (name, iters, veclens))
+
+  print ("Serialization")
+  print ("{:>10} {:>14} {:>14} {:>10} {:>12} {:>14} {:>14}".format ("veclen", "loop (secs)", "bulk (secs)", "speedup", "bulk MB/s", "tmpl (secs)", "tmpl+vec (secs)"))
+  bufs = []
+  for vec_len in veclens:
+    # fill up our custom message. The vector is kept as a uint32 numpy array
+    # so that the bulk path does not pay for a list conversion.
+    cm = CustomMessage ()
+    cm.seq_num = 0
+    cm.ts = time.time ()
+    cm.name = name
+    cm.vec = np.random.randint (1, 1000, size=vec_len, dtype=np.uint32)
+
+    # the loop is very slow for long vectors, so scale down its iterations
+    # to keep the total running time reasonable
+    loop_iters = max (1, min (iters, (iters * 1000) // vec_len))
+    loop_time, loop_buf = time_serialize (cm, loop_iters, bulk=False)
+    bulk_time, bulk_buf = time_serialize (cm, iters, bulk=True)
+
+    # both approaches must produce exactly the same bytes
+    assert (loop_buf == bulk_buf)
+
+    # patching a template with and without the vector contents
+    tmpl_time = time_template (cm, iters, with_vec=False)
+    tmpl_vec_time = time_template (cm, iters, with_vec=True)
+
+    print ("{:>10} {:>14.6e} {:>14.6e} {:>9.1f}x {:>12.1f} {:>14.6e} {:>14.6e}".format (vec_len, loop_time, bulk_time, loop_time/bulk_time, len (bulk_buf)/bulk_time/1e6, tmpl_time, tmpl_vec_time))
+    bufs.append ((vec_len, bulk_buf))
+
+  print ("Deserialization (reading only seq num and timestamp)")
+  print ("{:>10} {:>14} {:>14} {:>10}".format ("veclen", "eager (secs)", "view (secs)", "speedup"))
+  for vec_len, buf in bufs:
+    # the eager approach decodes the whole vector, so scale it down as well
+    eager_iters = max (1, min (iters, (iters * 1000) // vec_len))
+    eager_time = time_deserialize (buf, eager_iters, lazy=False)
+    view_time = time_deserialize (buf, iters, lazy=True)
+    print ("{:>10} {:>14.6e} {:>14.6e} {:>9.1f}x".format (vec_len, eager_time, view_time, eager_time/view_time))
+
+  print ("Transfer over ZMQ (tcp on localhost, one message at a time)")
+  print ("{:>10} {:>14} {:>14} {:>10}".format ("veclen", "copy (secs)", "0-copy (secs)", "speedup"))
+  for vec_len, buf in bufs:
+    copy_time = time_transfer (buf, iters, zerocopy=False)
+    zerocopy_time = time_transfer (buf, iters, zerocopy=True)
+    print ("{:>10} {:>14.6e} {:>14.6e} {:>9.1f}x".format (vec_len, copy_time, zerocopy_time, copy_time/zerocopy_time))
+
+##################################
+# Command line parsing
+##################################
+def parseCmdLineArgs ():
+    # parse the command line
+    parser = argparse.ArgumentParser ()
+
+    # add optional arguments
+    parser.add_argument ("-i", "--iters", type=int, default=100, help="Number of iterations per vector length (default: 100)")
+    parser.add_argument ("-l", "--veclen", type=int, nargs="+", default=[20, 100, 1000, 10000, 100000, 1000000], help="One or more lengths of the vector field (default: 20 100 1000 10000 100000 1000000)")
+    parser.add_argument ("-n", "--name", default="FlatBuffer Benchmark", help="Name to include in each message")
+    # parse the args
+    args = parser.parse_args ()
+
+    return args
+
+#------------------------------------------
+# main function
+def main ():
+    """ Main program """
+
+    print("Benchmark program for Flatbuffer serialization")
+
+    # first parse the command line args
+    parsed_args = parseCmdLineArgs ()
+
+    # start the driver code
+    driver (parsed_args.name, parsed_args.iters, parsed_args.veclen)
+
+#----------------------------------------------
+if __name__ == '__main__':
+    main ()
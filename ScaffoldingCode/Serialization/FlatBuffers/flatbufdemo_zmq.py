@@ -14,20 +14,36 @@
 #
 #  Here our custom message format comprises a sequence number, a timestamp, a name,
 #  and a data buffer of several uint32 numbers (whose value is not relevant to us) 
+#
+#  By default every message is copied on its way through: the sender copies
+#  the serialized buffer into a zmq message, and the receiver copies the zmq
+#  message into new bytes before deserializing it (into yet another copy of
+#  every field). In zero-copy mode the sender hands its buffer to zmq as is
+#  and the receiver parses a lazy view directly over the memory of the zmq
+#  message, so a large vector is not copied in user space at all.
+#
+#  The AsyncPeer is the same peer on asyncio sockets (zmq.asyncio), where
+#  sending and receiving are coroutines. While one of them waits, the event
+#  loop runs others, so a single thread can drive hundreds of sessions at
+#  once, next to any other asyncio I/O in the same process, such as the
+#  small HTTP endpoint we serve our metrics on.
 
 # The different packages we need in this Python driver code
 import os
 import sys
 import time  # needed for timing measurements and sleep
+import asyncio  # needed for the asyncio mode
 
 import random  # random number generator
 import argparse  # argument parser
 
 import zmq   # for ZeroMQ
+import zmq.asyncio   # for ZeroMQ sockets on asyncio
 
 ## the following are our files
 from custom_msg import CustomMessage  # our custom message in native format
 import serialize as sz  # this is from the file serialize.py in the same directory
+import msglog  # optional persistent log of received messages
 
 ##################################
 #  The Peer class
@@ -36,12 +52,23 @@ class Peer ():
   def __init__ (self):
     self.req = None  # represents the REQ socket
     self.rep = None  # represents the REP socket
+    self.pool = sz.BuilderPool ()  # our own reusable flatbuffer builders
+    self.logger = None  # if set, a msglog writer for every received request
+    # In zero-copy mode zmq holds on to the buffer we send until its I/O
+    # thread has written it out. Unless we track when that has happened, the
+    # buffer must be one we own and never touch again, so it is a copy of the
+    # builder's output. With tracking, we send the pooled builder's buffer
+    # itself and wait for the previous send to be done before reusing it.
+    self.zerocopy = False
+    self.track = False
+    self.tracker = None  # of our last tracked send, if any
 
-  def configure (self, port):
+  def configure (self, port, context=None):
     try:
-      # every ZMQ session requires a context
-      print ("Obtain the ZMQ context")
-      context = zmq.Context ()   # returns a singleton object
+      # every ZMQ session requires a context, unless we are handed one to share
+      if context is None:
+        print ("Obtain the ZMQ context")
+        context = zmq.Context ()   # returns a singleton object
     except zmq.ZMQError as err:
       print ("ZeroMQ Error obtaining context: {}".format (err))
       raise
@@ -114,19 +141,43 @@ class Peer ():
     self.req.close ()
     self.rep.close ()
 
+  # wait until zmq is done with the buffer of our last tracked send, so that
+  # it may be overwritten
+  def wait_sent (self):
+    if self.tracker is not None:
+      self.tracker.wait ()
+      self.tracker = None
+
+  # hand a buffer to zmq without copying it. A buffer that we will overwrite
+  # later must be tracked. Note that pyzmq still copies buffers smaller than
+  # zmq.COPY_THRESHOLD (64 KB), since setting up a zero-copy message costs more
+  # than copying those; their tracker is done right away.
+  def send_zerocopy (self, buf, track):
+    tracker = self.req.send (buf, copy=False, track=track)
+    if track:
+      self.tracker = tracker
+
   # Use the ZMQ's send_serialized method to send the custom message
   def send_request (self, cm):
     """ Send serialized request"""
     try:
+      if self.zerocopy:
+        # the pooled builder is about to be reused, so our last send must be done
+        print ("ZMQ sending custom message without copying it")
+        self.wait_sent ()
+        self.send_zerocopy (sz.serialize (cm, pool=self.pool, borrow=self.track), self.track)
+        return
+
       # ZMQ supports a send_serialized method which needs the custom message
       # and a callable serialize method. Technically our "serialize" method
       # is a callable and it returns an iterable (i.e., bytearray) but for some
       # reason, is giving a TypeError. On further debugging, it appears that
       # the type needs to be some sort of a list. Thus, we created a wrapper
       # method called serialize_to_frames that simply returns a [] of the
-      # serialized buffer. This works.
+      # serialized buffer. This works. We also hand it our own builder pool
+      # so that sustained sends reuse the same builder buffer.
       print ("ZMQ sending custom message via ZMQ's send_serialized method")
-      self.req.send_serialized (cm, sz.serialize_to_frames)
+      self.req.send_serialized (cm, lambda cm: sz.serialize_to_frames (cm, self.pool))
       # So no need to do the following as an alternative that definitely works.
       #buf = sz.serialize (cm)
       #self.req.send (buf)
@@ -138,6 +189,46 @@ class Peer ():
       raise
 
         
+  # Send an already serialized buffer as is, e.g., one produced by
+  # patching a message template
+  def send_buffer (self, buf):
+    """ Send already serialized request"""
+    try:
+      # a plain send copies the buffer into the zmq message, so the caller
+      # is free to patch it again as soon as we return. Without the copy, the
+      # caller must call wait_sent before patching it again.
+      print ("ZMQ sending already serialized buffer")
+      if self.zerocopy:
+        self.wait_sent ()
+        self.send_zerocopy (buf, True)
+      else:
+        self.req.send (buf)
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error sending buffer: {}".format (err))
+      raise
+    except:
+      print ("Some exception occurred with send {}".format (sys.exc_info()[0]))
+      raise
+
+  # Send a whole batch of custom messages as a single frame
+  def send_batch (self, cms):
+    """ Send serialized batch of requests"""
+    try:
+      # exactly like send_request except that all the messages travel
+      # together in one batch envelope
+      print ("ZMQ sending batch of custom messages via ZMQ's send_serialized method")
+      if self.zerocopy:
+        self.wait_sent ()
+        self.send_zerocopy (sz.serialize_batch (cms, pool=self.pool, borrow=self.track), self.track)
+        return
+      self.req.send_serialized (cms, lambda cms: sz.serialize_batch_to_frames (cms, self.pool))
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error serializing batch: {}".format (err))
+      raise
+    except:
+      print ("Some exception occurred with send_serialized {}".format (sys.exc_info()[0]))
+      raise
+
   # Send the ACK from server to client
   def send_ack (self):
     """ Send ACK"""
@@ -162,9 +253,20 @@ class Peer ():
       print ("ZMQ receiving serialized custom message")
       # Note, in the following, if copy=False, then what is received is
       # a list of frames and not bytes
-      cm = self.rep.recv_serialized (sz.deserialize_from_frames, copy=True)
-      #buf = self.rep.recv ()
-      #cm = sz.deserialize (buf)
+      if self.zerocopy:
+        # the frame owns the received zmq message, and the view we parse
+        # over its memory keeps it alive for as long as the view is in use
+        frame = self.rep.recv (copy=False)
+        if self.logger is not None:
+          self.logger.append_buffer (frame.buffer)
+        cm = sz.deserialize_view (frame.buffer)
+      elif self.logger is None:
+        cm = self.rep.recv_serialized (sz.deserialize_from_frames, copy=True)
+      else:
+        # we need the raw buffer to persist it in our message log
+        buf = self.rep.recv ()
+        self.logger.append_buffer (buf)
+        cm = sz.deserialize (buf)
       return cm
     except zmq.ZMQError as err:
       print ("ZeroMQ Error receiving serialized message: {}".format (err))
@@ -173,6 +275,23 @@ class Peer ():
       print ("Some exception occurred with recv_serialized {}".format (sys.exc_info()[0]))
       raise
 
+  # receive a batch of custom messages. What comes back is a lazy view
+  # that we can iterate over to obtain each message in turn.
+  def recv_batch (self):
+    """ receive serialized batch of requests"""
+    try:
+      print ("ZMQ receiving serialized batch of custom messages")
+      if self.zerocopy:
+        return sz.deserialize_batch (self.rep.recv (copy=False).buffer)
+      batch = self.rep.recv_serialized (sz.deserialize_batch_from_frames, copy=True)
+      return batch
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error receiving serialized batch: {}".format (err))
+      raise
+    except:
+      print ("Some exception occurred with recv_serialized {}".format (sys.exc_info()[0]))
+      raise
+
   # receive the dummy ACK on client side
   def recv_ack (self):
     """ receive dummy ACK"""
@@ -190,25 +309,99 @@ class Peer ():
 
         
         
+##################################
+#  The AsyncPeer class
+##################################
+class AsyncPeer (Peer):
+  """ Same as the Peer but with coroutines sending and receiving """
+
+  # all our async peers share a single asyncio context
+  def configure (self, port, context=None):
+    Peer.configure (self, port, context or zmq.asyncio.Context.instance ())
+
+  # Serialize and send the custom message. The builder's buffer is borrowed
+  # since nothing else can use our pool before the send is done.
+  async def send_request (self, cm):
+    """ Send serialized request"""
+    try:
+      await self.req.send (sz.serialize (cm, pool=self.pool, borrow=True))
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error serializing request: {}".format (err))
+      raise
+    except:
+      print ("Some exception occurred with send {}".format (sys.exc_info()[0]))
+      raise
+
+  # Send the ACK from server to client
+  async def send_ack (self):
+    """ Send ACK"""
+    try:
+      await self.rep.send (b"ACK")
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error sending ACK: {}".format (err))
+      raise
+    except:
+      print ("Some exception occurred with send_ack {}".format (sys.exc_info()[0]))
+      raise
+
+  # receive and deserialize the custom message
+  async def recv_request (self):
+    """ receive serialized request"""
+    try:
+      buf = await self.rep.recv ()
+      return sz.deserialize (buf)
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error receiving serialized message: {}".format (err))
+      raise
+    except:
+      print ("Some exception occurred with recv {}".format (sys.exc_info()[0]))
+      raise
+
+  # receive the dummy ACK on client side
+  async def recv_ack (self):
+    """ receive dummy ACK"""
+    try:
+      return await self.req.recv ()
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error receiving dummy ack: {}".format (err))
+      raise
+    except:
+      print ("Some exception occurred with recv_ack {}".format (sys.exc_info()[0]))
+      raise
+
 ##################################
 #        Driver program
 ##################################
 
-def driver (name, iters, vec_len, port):
+def driver (name, iters, vec_len, port, batch_size=1, use_template=False, log=None, zerocopy=False, track=False):
 
-  print ("Driver program: Name = {}, Num Iters = {}, Vector len = {}, Peer port = {}".format (name, iters, vec_len, port))
+  print ("Driver program: Name = {}, Num Iters = {}, Vector len = {}, Peer port = {}, Batch size = {}, Template = {}, Log = {}, Zero-copy = {}, Track = {}".format (name, iters, vec_len, port, batch_size, use_template, log, zerocopy, track))
 
   # first obtain a peer and initialize it
   print ("Driver program: create and configure a peer object")
   peer = Peer ()
+  peer.zerocopy = zerocopy
+  peer.track = track
   try:
     peer.configure (port)
   except:
     print ("Some exception occurred")
     return
   
+  # in batch mode, every iteration carries several messages in a single frame
+  if batch_size > 1:
+    batch_driver (peer, name, iters, vec_len, batch_size)
+    peer.cleanup ()
+    return
+
+  # persist every received request if asked to
+  if log:
+    print ("Driver program: logging received messages to {}".format (log))
+    peer.logger = msglog.MessageLogWriter (log)
+
   # now send the serialized custom message for the number of desired iterations
   cm = CustomMessage ()   # create this once and reuse it for send/receive
+  template = None   # message template, if we are asked to use one
 
   for i in range (iters):
         
@@ -228,7 +421,15 @@ def driver (name, iters, vec_len, port):
       # now let the peer send the message to its server part
       print ("Peer client sending the serialized message")
       start_time = time.time ()
-      peer.send_request (cm)
+      if use_template:
+        # only the very first message is actually built; after that we
+        # just patch the seq num, timestamp and vector contents in place
+        if template is None:
+          template = sz.MessageTemplate (cm)
+        peer.wait_sent ()  # in zero-copy mode zmq may still be sending it
+        peer.send_buffer (template.fill (cm))
+      else:
+        peer.send_request (cm)
       end_time = time.time ()
       print ("Serialization took {} secs".format (end_time-start_time))
     except:
@@ -237,12 +438,14 @@ def driver (name, iters, vec_len, port):
     try:
       # now let the peer receive the message at the server end
       print ("Peer client sending the serialized message")
+      # (in zero-copy mode this is a read-only view, so we keep our own
+      # custom message for the next iteration)
       start_time = time.time ()
-      cm = peer.recv_request ()
+      rcvd = peer.recv_request ()
       end_time = time.time ()
       print ("Deserialization took {} secs".format (end_time-start_time))
       print ("------ contents of message after deserializing ----------")
-      cm.dump ()
+      rcvd.dump ()
     except:
       return
 
@@ -264,9 +467,156 @@ def driver (name, iters, vec_len, port):
     # extremely fast
     time.sleep (0.050)  # 50 msec
 
-  # we are done. Just cleanup the peer before exiting
+  # we are done. Just cleanup the peer (and our log) before exiting
+  if peer.logger:
+    peer.logger.close ()
   peer.cleanup ()
   
+# Same as the driver loop above except that every iteration sends a batch of
+# messages in one frame, so the framing, syscall and ACK round trip costs are
+# shared by all the messages in the batch.
+def batch_driver (peer, name, iters, vec_len, batch_size):
+
+  for i in range (iters):
+
+    # fill up a fresh batch of custom messages
+    cms = []
+    for k in range (batch_size):
+      cm = CustomMessage ()
+      cm.seq_num = i*batch_size + k # this will be our sequence number
+      cm.ts = time.time ()  # current time
+      cm.name = name # assigned name
+      cm.vec = [random.randint (1, 1000) for j in range (vec_len)]
+      cms.append (cm)
+    print ("-----Iteration: {} sending batch of {} messages ----------".format (i, batch_size))
+
+    try:
+      # now let the peer send the batch to its server part
+      print ("Peer client sending the serialized batch")
+      start_time = time.time ()
+      peer.send_batch (cms)
+      end_time = time.time ()
+      print ("Serialization took {} secs".format (end_time-start_time))
+    except:
+      return
+
+    try:
+      # now let the peer receive the batch at the server end and walk
+      # through it lazily, one message at a time
+      print ("Peer server receiving the serialized batch")
+      start_time = time.time ()
+      batch = peer.recv_batch ()
+      end_time = time.time ()
+      print ("Deserialization took {} secs".format (end_time-start_time))
+      print ("------ contents of batch after deserializing ----------")
+      for cm in batch:
+        cm.dump ()
+    except:
+      return
+
+    try:
+      # one ACK for the whole batch
+      print ("Peer server sending ACK")
+      peer.send_ack ()
+    except:
+      return
+
+    try:
+      print ("Peer client receiving the ACK")
+      peer.recv_ack ()
+    except:
+      return
+
+    # sleep a while before we send the next batch so it is not
+    # extremely fast
+    time.sleep (0.050)  # 50 msec
+
+##################################
+#        asyncio driver
+##################################
+
+# the given percentile (0-100) of an already sorted list of values
+def percentile (values, p):
+  if not values:
+    return 0.0
+  return values[min (len (values)-1, int (len (values) * p / 100.0))]
+
+# Serve our metrics over HTTP in the plain text format of Prometheus, i.e.,
+# one "name value" per line, e.g., "curl localhost:8000/metrics". It runs on
+# the same event loop as the sessions and by default only local clients can
+# reach it.
+async def serve_metrics (metrics, port, intf="127.0.0.1"):
+  async def handle (reader, writer):
+    await reader.readuntil (b"\r\n\r\n")  # we answer whatever is asked
+    body = "".join ("{} {}\n".format (name, value) for name, value in metrics.items ())
+    writer.write ("HTTP/1.0 200 OK\r\nContent-Type: text/plain\r\nContent-Length: {}\r\n\r\n{}".format (len (body), body).encode ())
+    await writer.drain ()
+    writer.close ()
+
+  print ("Serving metrics on http://{}:{}/metrics".format (intf, port))
+  return await asyncio.start_server (handle, intf, port)
+
+# one session: the same exchange as in the driver above, over its own peer,
+# recording the latency of each round
+async def session (peer, name, iters, vec_len, interval, metrics, latencies):
+  cm = CustomMessage ()
+  cm.name = name
+  for i in range (iters):
+    cm.seq_num = i
+    cm.ts = time.time ()
+    cm.vec = [random.randint (1, 1000) for j in range (vec_len)]
+
+    start_time = time.perf_counter ()
+    await peer.send_request (cm)
+    rcvd = await peer.recv_request ()
+    await peer.send_ack ()
+    await peer.recv_ack ()
+    latencies.append (time.perf_counter () - start_time)
+    metrics["messages_total"] += 1
+
+    # while we sleep, the other sessions get to run
+    await asyncio.sleep (interval)
+
+  metrics["sessions_active"] -= 1
+
+# Run many sessions at once on one event loop, each with a peer of its own
+# on consecutive ports starting at the given one. We only print a summary
+# at the end, since printing every message would dominate.
+async def async_driver (name, iters, vec_len, port, sessions, interval, metrics_port=None, metrics_intf="127.0.0.1"):
+
+  print ("Async driver: {} sessions on ports {} to {}, {} iterations each, interval {} secs".format (sessions, port, port+sessions-1, iters, interval))
+
+  metrics = {"sessions_active": sessions, "messages_total": 0}
+  server = await serve_metrics (metrics, metrics_port, metrics_intf) if metrics_port else None
+
+  peers = []
+  try:
+    for k in range (sessions):
+      peer = AsyncPeer ()
+      peer.configure (port + k)
+      peers.append (peer)
+  except:
+    print ("Some exception occurred")
+    for peer in peers:
+      peer.cleanup ()
+    return
+
+  latencies = []
+  start_time = time.perf_counter ()
+  await asyncio.gather (*[session (peer, name, iters, vec_len, interval, metrics, latencies) for peer in peers])
+  end_time = time.perf_counter ()
+
+  latencies.sort ()
+  print ("{} sessions exchanged {} messages in {:.3f} secs, i.e., {:.1f} msgs/sec".format (sessions, len (latencies), end_time-start_time, len (latencies)/(end_time-start_time)))
+  print ("round trip (msecs): p50 {:.3f}, p90 {:.3f}, p99 {:.3f}, max {:.3f}".format (
+    percentile (latencies, 50)*1e3, percentile (latencies, 90)*1e3, percentile (latencies, 99)*1e3,
+    latencies[-1]*1e3 if latencies else 0.0))
+
+  if server:
+    server.close ()
+  for peer in peers:
+    peer.cleanup ()
+
 ##################################
 # Command line parsing
 ##################################
@@ -279,6 +629,15 @@ def parseCmdLineArgs ():
     parser.add_argument ("-l", "--veclen", type=int, default=20, help="Length of the vector field (default: 20; contents are irrelevant)")
     parser.add_argument ("-n", "--name", default="FlatBuffer ZMQ Demo", help="Name to include in each message")
     parser.add_argument ("-p", "--port", type=int, default=5555, help="Port where the server part of the peer listens and client side connects to (default: 5555)")
+    parser.add_argument ("-b", "--batch", type=int, default=1, help="Number of messages to carry in each frame (default: 1, i.e., no batching)")
+    parser.add_argument ("-t", "--template", action="store_true", help="Build the message once and patch it in place for every subsequent send")
+    parser.add_argument ("-z", "--zerocopy", action="store_true", help="Send and receive without copying the message in user space")
+    parser.add_argument ("-k", "--track", action="store_true", help="In zero-copy mode, track sends so that the builder's own buffer can be sent rather than a copy of it")
+    parser.add_argument ("-a", "--sessions", type=int, default=0, help="Run this many sessions concurrently on one asyncio event loop, on consecutive ports (default: 0, i.e., the blocking peer)")
+    parser.add_argument ("--interval_ms", type=float, default=50, help="With sessions, msecs each session sleeps between messages (default: 50)")
+    parser.add_argument ("--metrics_port", type=int, default=None, help="With sessions, serve metrics over HTTP on this port")
+    parser.add_argument ("--metrics_intf", default="127.0.0.1", help="With sessions, interface to serve metrics on (default: 127.0.0.1, i.e., local clients only)")
+    parser.add_argument ("-g", "--log", default=None, help="Append every received message to this message log (not used in batch mode)")
     # parse the args
     args = parser.parse_args ()
 
@@ -295,7 +654,10 @@ def main ():
   parsed_args = parseCmdLineArgs ()
     
   # start the driver code
-  driver (parsed_args.name, parsed_args.iters, parsed_args.veclen, parsed_args.port)
+  if parsed_args.sessions:
+    asyncio.run (async_driver (parsed_args.name, parsed_args.iters, parsed_args.veclen, parsed_args.port, parsed_args.sessions, parsed_args.interval_ms/1000.0, parsed_args.metrics_port, parsed_args.metrics_intf))
+    return
+  driver (parsed_args.name, parsed_args.iters, parsed_args.veclen, parsed_args.port, parsed_args.batch, parsed_args.template, parsed_args.log, parsed_args.zerocopy, parsed_args.track)
 
 #----------------------------------------------
 if __name__ == '__main__':
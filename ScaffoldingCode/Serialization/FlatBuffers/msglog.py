@@ -0,0 +1,340 @@
+#  Author: Aniruddha Gokhale
+#  Created: Fall 2021
+#  Modified: Fall 2022 (for Computer Networking course)
+#
+#  Purpose: an append-only log of FlatBuffers messages so that everything we
+#  send or receive can be persisted and replayed later (e.g., for load tests
+#  or debugging).
+#
+#  The log file is simply a sequence of size-prefixed FlatBuffers records,
+#  i.e., a 4-byte little endian length followed by the serialized Message,
+#  padded to an 8-byte boundary. Alongside it we keep a sidecar index file
+#  (<log>.idx) with one fixed-size entry per record holding the seq num, the
+#  timestamp, the size and the offset of that record in the log.
+#
+#  Writes are made durable in group commits: rather than an fsync per record,
+#  we fsync once for every so many records or so many seconds, whichever comes
+#  first. A timer commits the tail of a burst once the writer goes quiet, so
+#  a record is never left unsynced for much longer than the interval.
+#
+#  A crash can leave a torn write behind: a partial index entry, index
+#  entries whose records did not fully make it into the log, or records that
+#  made it into the log but not into the index (the log is synced first). The
+#  writer recovers from this when it reopens a log. Since the records are
+#  self-describing, it rebuilds the index entries of the complete records
+#  beyond the index (or of all records, if the index is missing) by walking
+#  their size prefixes, and cuts off only what is left of a torn record.
+#
+#  The reader memory maps both the log and the index, so even multi-GB logs
+#  are never loaded into memory. Lookups binary search the index and every
+#  record handed out is a lazy CustomMessageView directly over the mapped
+#  log, i.e., nothing is copied.
+#
+#  Running this file directly dumps (parts of) a log.
+
+import os
+import sys
+import time   # for group commit intervals
+import threading  # for the group commit timer
+import mmap   # for mapping the log into memory
+import struct  # for the size prefix and index entries
+import argparse  # argument parser
+
+import numpy as np  # to search the index
+
+## the following are our files
+import serialize as sz  # this is from the file serialize.py in the same directory
+import CustomAppProto.Message as msg   # this is the generated code by the flatc compiler
+
+# each index entry: seq num, record size, timestamp and log offset. The
+# struct is used for writing and the numpy dtype for reading.
+INDEX_ENTRY = struct.Struct ("<IIdQ")
+INDEX_DTYPE = np.dtype ([("seq_no", "<u4"), ("size", "<u4"), ("ts", "<f8"), ("offset", "<u8")])
+
+# the size prefix in front of each record, and the alignment of records
+SIZE_PREFIX = struct.Struct ("<I")
+ALIGNMENT = 8
+
+# name of the sidecar index file for the given log
+def index_path (path):
+  return path + ".idx"
+
+##################################
+#  The log writer
+##################################
+class MessageLogWriter ():
+  """ Append-only writer of size-prefixed FlatBuffers records """
+
+  def __init__ (self, path, sync_every=64, sync_interval=0.050):
+    self.path = path
+    self.sync_every = sync_every        # fsync after this many records
+    self.sync_interval = sync_interval  # or after this many seconds
+    self.log = open (path, "ab")
+    self.idx = open (index_path (path), "ab")
+    self.recover ()
+    self.offset = self.log.tell ()      # where the next record goes
+    self.pending = 0                    # records since the last commit
+    self.last_sync = time.monotonic ()
+    self.timer = None                   # commits the tail of a burst
+    self.lock = threading.Lock ()       # the timer commits from its own thread
+
+  # Bring the log and its index back in line: first drop a partial index
+  # entry and entries whose record is not (fully) in the log, then index the
+  # complete records beyond the last indexed one, and finally cut off the
+  # torn record, if any, at the end of the log.
+  def recover (self):
+    log_size = os.fstat (self.log.fileno ()).st_size
+    count = os.fstat (self.idx.fileno ()).st_size // INDEX_DTYPE.itemsize
+    end = 0
+    if count:
+      index = np.fromfile (index_path (self.path), dtype=INDEX_DTYPE, count=count)
+      # entries are in log order, so only a trailing run can be incomplete
+      while count and (int (index[count-1]["offset"]) + SIZE_PREFIX.size + int (index[count-1]["size"]) > log_size):
+        count -= 1
+      if count:
+        size = SIZE_PREFIX.size + int (index[count-1]["size"])
+        end = int (index[count-1]["offset"]) + size + (-size % ALIGNMENT)
+    self.idx.truncate (count * INDEX_DTYPE.itemsize)
+    self.idx.seek (0, os.SEEK_END)
+
+    # walk the size prefixes of the records the index does not know about
+    entries = []
+    with open (self.path, "rb") as f:
+      while end + SIZE_PREFIX.size <= log_size:
+        f.seek (end)
+        size, = SIZE_PREFIX.unpack (f.read (SIZE_PREFIX.size))
+        if (size < SIZE_PREFIX.size) or (end + SIZE_PREFIX.size + size > log_size):
+          break   # a torn record, or the zeros a crash can leave behind
+        buf = f.read (size)
+        try:
+          # the root offset must point inside the record
+          if not (SIZE_PREFIX.size <= SIZE_PREFIX.unpack_from (buf)[0] < size):
+            break
+          packet = msg.Message.GetRootAs (buf, 0)
+          entries.append (INDEX_ENTRY.pack (packet.SeqNo (), size, packet.Ts (), end))
+        except:
+          break   # not a record we can read, so the log ends here
+        end += SIZE_PREFIX.size + size + (-(SIZE_PREFIX.size + size) % ALIGNMENT)
+
+    if entries:
+      print ("Recovered the index entries of {} records of {}".format (len (entries), self.path))
+      self.idx.write (b"".join (entries))
+    self.log.truncate (min (end, log_size))
+    # truncating does not move the file position, which we use as the offset
+    self.log.seek (0, os.SEEK_END)
+    if entries or (end < log_size):
+      self.log.flush ()
+      os.fsync (self.log.fileno ())
+      self.idx.flush ()
+      os.fsync (self.idx.fileno ())
+
+  # append an already serialized Message (e.g., what we just received)
+  def append_buffer (self, buf):
+    # we need the seq num and timestamp for the index
+    packet = msg.Message.GetRootAs (buf, 0)
+    size = len (buf)
+    pad = -(SIZE_PREFIX.size + size) % ALIGNMENT
+
+    with self.lock:
+      self.log.write (SIZE_PREFIX.pack (size))
+      self.log.write (buf)
+      if pad:
+        self.log.write (bytes (pad))
+      self.idx.write (INDEX_ENTRY.pack (packet.SeqNo (), size, packet.Ts (), self.offset))
+      self.offset += SIZE_PREFIX.size + size + pad
+
+      # group commit when enough records or enough time has gone by. The
+      # first record after a commit starts the timer, in case nothing else
+      # comes along.
+      self.pending += 1
+      if (self.pending >= self.sync_every) or (time.monotonic () - self.last_sync >= self.sync_interval):
+        self._commit ()
+      elif self.timer is None:
+        self.timer = threading.Timer (self.sync_interval, self.flush)
+        self.timer.daemon = True
+        self.timer.start ()
+
+  # append a custom message in native format
+  def append (self, cm):
+    # the borrowed buffer is consumed (written) before the next serialize
+    self.append_buffer (sz.serialize (cm, borrow=True))
+
+  # make everything appended so far durable
+  def commit (self):
+    with self.lock:
+      self._commit ()
+
+  # commit if there is anything left to commit (this is what the timer runs)
+  def flush (self):
+    with self.lock:
+      if self.pending and not self.log.closed:
+        self._commit ()
+
+  # The log goes first so that the index never points at records that are
+  # not on disk. The caller holds the lock.
+  def _commit (self):
+    if self.timer is not None:
+      self.timer.cancel ()
+      self.timer = None
+    self.log.flush ()
+    os.fsync (self.log.fileno ())
+    self.idx.flush ()
+    os.fsync (self.idx.fileno ())
+    self.pending = 0
+    self.last_sync = time.monotonic ()
+
+  def close (self):
+    with self.lock:
+      self._commit ()
+      self.log.close ()
+      self.idx.close ()
+
+##################################
+#  The log reader
+##################################
+class MessageLogReader ():
+  """ Memory-mapped reader of a message log and its index """
+
+  def __init__ (self, path):
+    self.path = path
+    self.log_mm = None
+    self.index = np.empty (0, dtype=INDEX_DTYPE)
+    self.refresh ()
+
+  # (re)map the log and its index, e.g., to see records appended since we
+  # last looked. Index entries for records that did not fully make it into
+  # the log (say, after a crash) are ignored.
+  def refresh (self):
+    log_size = os.path.getsize (self.path)
+    with open (self.path, "rb") as f:
+      self.log_mm = mmap.mmap (f.fileno (), 0, access=mmap.ACCESS_READ) if log_size else b""
+
+    count = os.path.getsize (index_path (self.path)) // INDEX_DTYPE.itemsize
+    if count:
+      index = np.memmap (index_path (self.path), dtype=INDEX_DTYPE, mode="r", shape=(count,))
+      # entries are in log order, so only a trailing run can be incomplete
+      while count and (int (index[count-1]["offset"]) + SIZE_PREFIX.size + int (index[count-1]["size"]) > log_size):
+        count -= 1
+      self.index = index[:count]
+    else:
+      self.index = np.empty (0, dtype=INDEX_DTYPE)
+
+    # Seq nums and timestamps are normally appended in increasing order, so
+    # we can binary search them. A log holding, say, several runs of the same
+    # sender (or a clock that went back) is not sorted and is scanned instead.
+    self.sorted = {field: bool (np.all (self.index[field][1:] >= self.index[field][:-1])) for field in ("seq_no", "ts")}
+
+  def __len__ (self):
+    return len (self.index)
+
+  # the record at the given position in the log, as a zero-copy view
+  def __getitem__ (self, i):
+    offset = int (self.index[i]["offset"])
+    return sz.CustomMessageView (msg.Message.GetRootAs (self.log_mm, offset + SIZE_PREFIX.size))
+
+  def __iter__ (self):
+    for i in range (len (self)):
+      yield self[i]
+
+  # positions of the records whose field (seq_no or ts) is in [lo, hi), in
+  # log order
+  def positions (self, field, lo, hi):
+    values = self.index[field]
+    if self.sorted[field]:
+      return range (int (np.searchsorted (values, lo, side="left")), int (np.searchsorted (values, hi, side="left")))
+    return np.flatnonzero ((values >= lo) & (values < hi))
+
+  # position of the (first) record with the given seq num, or -1
+  def find_seq (self, seq_no):
+    matches = self.positions ("seq_no", seq_no, seq_no + 1)
+    return int (matches[0]) if len (matches) else -1
+
+  # random lookup by seq num
+  def lookup (self, seq_no):
+    i = self.find_seq (seq_no)
+    if i < 0:
+      raise KeyError ("seq num {} is not in the log".format (seq_no))
+    return self[i]
+
+  # all records with seq_from <= seq num < seq_to
+  def scan_seq (self, seq_from, seq_to):
+    for i in self.positions ("seq_no", seq_from, seq_to):
+      yield self[int (i)]
+
+  # all records with ts_from <= timestamp < ts_to
+  def scan_ts (self, ts_from, ts_to):
+    for i in self.positions ("ts", ts_from, ts_to):
+      yield self[int (i)]
+
+  # Views handed out by the reader point directly into the mapped log, so
+  # they must not be used once the reader is closed. (If a vector obtained
+  # from a view is still around, the mapping cannot be closed yet and is
+  # released once that vector goes away.)
+  def close (self):
+    self.index = np.empty (0, dtype=INDEX_DTYPE)
+    if isinstance (self.log_mm, mmap.mmap):
+      try:
+        self.log_mm.close ()
+      except BufferError:
+        pass
+    self.log_mm = None
+
+##################################
+#        Driver program
+##################################
+
+def driver (args):
+
+  print ("Driver program: Log = {}".format (args.log))
+
+  reader = MessageLogReader (args.log)
+  print ("Log holds {} records".format (len (reader)))
+
+  if args.seq is not None:
+    print ("Looking up seq num {}".format (args.seq))
+    reader.lookup (args.seq).dump ()
+  elif args.from_ts is not None or args.to_ts is not None:
+    ts_from = args.from_ts if args.from_ts is not None else float ("-inf")
+    ts_to = args.to_ts if args.to_ts is not None else float ("inf")
+    print ("Scanning timestamps in [{}, {})".format (ts_from, ts_to))
+    for cm in reader.scan_ts (ts_from, ts_to):
+      cm.dump ()
+  else:
+    for cm in reader:
+      cm.dump ()
+
+  reader.close ()
+
+##################################
+# Command line parsing
+##################################
+def parseCmdLineArgs ():
+    # parse the command line
+    parser = argparse.ArgumentParser ()
+
+    # add arguments
+    parser.add_argument ("log", help="Message log file to read")
+    parser.add_argument ("-s", "--seq", type=int, default=None, help="Only show the record with this seq num")
+    parser.add_argument ("-f", "--from_ts", type=float, default=None, help="Only show records with a timestamp at or after this one")
+    parser.add_argument ("-t", "--to_ts", type=float, default=None, help="Only show records with a timestamp before this one")
+    # parse the args
+    args = parser.parse_args ()
+
+    return args
+
+#------------------------------------------
+# main function
+def main ():
+    """ Main program """
+
+    print("Dump program for Flatbuffer message logs")
+
+    # first parse the command line args
+    parsed_args = parseCmdLineArgs ()
+
+    # start the driver code
+    driver (parsed_args)
+
+#----------------------------------------------
+if __name__ == '__main__':
+    main ()
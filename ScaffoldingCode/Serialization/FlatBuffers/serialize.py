@@ -19,59 +19,234 @@ import sys
 sys.path.append(os.path.join (os.path.dirname(__file__), '/home/gokhale/Apps/flatbuffers/python'))
 import flatbuffers    # this is the flatbuffers package we import
 import time   # we need this get current time
+import threading  # builder pools keep one builder per thread
+from array import array  # the vector field may also arrive as an array ('I')
 import numpy as np  # to use in our vector field
 
 import zmq   # we need this for additional constraints provided by the zmq serialization
 
 from custom_msg import CustomMessage  # our custom message in native format
 import CustomAppProto.Message as msg   # this is the generated code by the flatc compiler
+import CustomAppProto.Batch as batch   # generated code for the batch envelope
+
+# convert whatever we were handed for the vector field into a uint32 numpy
+# array without copying it if we can avoid it. A numpy array of the right dtype
+# or an array ('I') of 4-byte items is simply viewed as is; anything else
+# (e.g., a plain Python list) gets converted in one shot by numpy.
+def as_uint32_array (vec):
+    """ view/convert the vector field as a uint32 numpy array """
+    if isinstance (vec, np.ndarray) and vec.dtype == np.uint32:
+        return vec
+    if isinstance (vec, array) and vec.itemsize == 4:
+        return np.frombuffer (vec, dtype=np.uint32)
+    return np.asarray (vec, dtype=np.uint32)
+
+# This is how the sample code in Flatbuffers describes building a vector, i.e.,
+# one element at a time in reverse order. Every element costs us a trip
+# through the interpreter, so this gets slow for long vectors. We retain it
+# so the benchmark can compare it against the bulk approach below.
+def build_data_vector_loop (builder, vec):
+    """ build the data vector one element at a time """
+    msg.StartDataVector (builder, len (vec))
+    for i in reversed (range (len (vec))):
+        builder.PrependUint32 (vec[i])
+    return builder.EndVector ()
+
+# Here the entire vector is written into the builder's buffer in one
+# operation (essentially a memcpy) using the numpy support in flatbuffers.
+# The bytes that result are identical to the loop approach.
+def build_data_vector_bulk (builder, vec):
+    """ build the data vector in one bulk copy """
+    return builder.CreateNumpyVector (as_uint32_array (vec))
+
+# Allocating a fresh builder for every message means its buffer starts tiny
+# and is grown by repeated doubling (and copying) until the message fits. A
+# builder pool instead keeps one builder per thread and simply resets it for
+# the next message, so the buffer stays at its high water mark and no further
+# allocation or regrowth happens once the largest message size has been seen.
+# A pool can be shared by all threads (each gets its own builder), or a Peer
+# can own its own pool.
+class BuilderPool ():
+    """ Reusable flatbuffers builders, one per thread """
+
+    def __init__ (self, initial_size=1024):
+        self.initial_size = initial_size  # starting capacity for a new builder
+        self.local = threading.local ()   # holds this thread's builder
+
+    # obtain this thread's builder, reset and ready for the next message
+    def acquire (self):
+        builder = getattr (self.local, "builder", None)
+        if builder is None:
+            builder = flatbuffers.Builder (self.initial_size)
+            self.local.builder = builder
+        else:
+            builder.Clear ()   # keeps the underlying buffer and its capacity
+        return builder
+
+    # capacity of this thread's builder buffer (0 if none allocated yet)
+    def capacity (self):
+        builder = getattr (self.local, "builder", None)
+        return 0 if builder is None else len (builder.Bytes)
+
+# the pool used by serialize when the caller does not supply its own
+default_pool = BuilderPool ()
+
+# build one Message table inside the builder and return its offset. The name
+# string must already have been created in the builder since flatbuffers does
+# not allow nesting the creation of one object inside another.
+def build_message (builder, cm, name_field, bulk=True):
+    # serialize our dummy array.
+    if bulk:
+        data = build_data_vector_bulk (builder, cm.vec)
+    else:
+        data = build_data_vector_loop (builder, cm.vec)
+    
+    # let us create the serialized msg by adding contents to it.
+    # Our custom msg consists of a seq num, timestamp, name, and an array of uint32s
+    msg.Start (builder)  # serialization starts with the "Start" method
+    msg.AddSeqNo (builder, cm.seq_num)
+    msg.AddTs (builder, cm.ts)   # serialize current timestamp
+    msg.AddName (builder, name_field)  # serialize the name
+    msg.AddData (builder, data)  # serialize the dummy data
+    return msg.End (builder)  # get the topic of all these fields
+
+# finish the buffer with the given root and hand out the result per the
+# ownership rule described for serialize below
+def finish_output (builder, root, borrow):
+    # end the serialization process
+    builder.Finish (root)
+
+    # get the serialized buffer, either borrowed from the builder or copied
+    if borrow:
+        return memoryview (builder.Bytes)[builder.Head ():]
+    return builder.Output ()
 
 # This is the method we will invoke from our driver program
 # Note that if you have have multiple different message types, we could have
 # separate such serialize/deserialize methods, or a single method can check what
 # type of message it is and accordingly take actions.
-def serialize (cm):
+#
+# By default the data vector is written in bulk; pass bulk=False to use
+# the original element-by-element loop.
+#
+# The builder comes from a pool (default_pool unless one is passed). The
+# ownership rule for the result is as follows:
+#   borrow=False (default): we return a copy of the serialized bytes which the
+#       caller owns outright.
+#   borrow=True: we return a memoryview into the pooled builder's buffer, which
+#       avoids the copy. The view is only valid until the next serialize call
+#       on the same thread with the same pool, so it must be consumed (e.g.,
+#       sent with a copying zmq send) before then.
+def serialize (cm, bulk=True, pool=None, borrow=False):
     # first obtain the builder object that is used to create an in-memory representation
     # of the serialized object from the custom message
-    builder = flatbuffers.Builder (0);
+    builder = (pool or default_pool).acquire ()
 
     # create the name string for the name field using
     # the parameter we passed
     name_field = builder.CreateString (cm.name)
     
-    # serialize our dummy array. The sample code in Flatbuffers
-    # describes doing this in reverse order
-    msg.StartDataVector (builder, len (cm.vec))
-    for i in reversed (range (len (cm.vec))):
-        builder.PrependUint32 (cm.vec[i])
-    data = builder.EndVector ()
-    
-    # let us create the serialized msg by adding contents to it.
-    # Our custom msg consists of a seq num, timestamp, name, and an array of uint32s
-    msg.Start (builder)  # serialization starts with the "Start" method
-    msg.AddSeqNo (builder, cm.seq_num)
-    msg.AddTs (builder, cm.ts)   # serialize current timestamp
-    msg.AddName (builder, name_field)  # serialize the name
-    msg.AddData (builder, data)  # serialize the dummy data
-    serialized_msg = msg.End (builder)  # get the topic of all these fields
+    # build the message itself and return the serialized buffer to the caller
+    serialized_msg = build_message (builder, cm, name_field, bulk)
+    return finish_output (builder, serialized_msg, borrow)
 
-    # end the serialization process
-    builder.Finish (serialized_msg)
+# serialize a whole list of custom messages into a single Batch buffer. The
+# same name is typically repeated in every message, so we store each distinct
+# name only once as a shared string. The bulk, pool and borrow arguments
+# behave exactly as for serialize.
+def serialize_batch (cms, bulk=True, pool=None, borrow=False):
+    builder = (pool or default_pool).acquire ()
 
-    # get the serialized buffer
-    buf = builder.Output ()
+    # build each message, reusing the name strings that were already written
+    offsets = []
+    for cm in cms:
+        name_field = builder.CreateSharedString (cm.name)
+        offsets.append (build_message (builder, cm, name_field, bulk))
 
-    # return this serialized buffer to the caller
-    return buf
+    # the vector of messages is built in reverse order like any other vector
+    batch.StartMsgsVector (builder, len (offsets))
+    for off in reversed (offsets):
+        builder.PrependUOffsetTRelative (off)
+    msgs = builder.EndVector ()
+
+    # now the batch envelope itself
+    batch.Start (builder)
+    batch.AddMsgs (builder, msgs)
+    serialized_batch = batch.End (builder)
+
+    return finish_output (builder, serialized_batch, borrow)
+
+# When consecutive messages have the same shape (same name, same vector
+# length) and differ only in the seq num, timestamp and perhaps the vector
+# contents, there is no need to rebuild the buffer each time. A message
+# template builds the buffer once and then patches those fields in place for
+# every subsequent message, turning serialization into a few stores.
+#
+# The python code generated by flatc does not include mutators for table
+# fields, so we use the generated accessors once to find where each field
+# lives in the buffer and then overwrite it there directly.
+#
+# Note that update always hands back the same bytearray. It is ready to be
+# sent as is, but since it is overwritten by the next update, it must be sent
+# with a copying send (the zmq default) or the send must have completed.
+class MessageTemplate ():
+    """ Serialized message whose scalar fields and vector are patched in place """
+
+    def __init__ (self, cm):
+        builder = flatbuffers.Builder (1024)
+
+        # fields equal to their default (e.g., a seq num of 0) are normally left
+        # out of the buffer altogether, but we need every field to be present
+        # so that it can be patched later.
+        builder.ForceDefaults (True)
+        name_field = builder.CreateString (cm.name)
+        builder.Finish (build_message (builder, cm, name_field))
+        self.buf = bytearray (builder.Output ())
+
+        # locate the scalar fields and the vector using the generated code
+        packet = msg.Message.GetRootAs (self.buf, 0)
+        tab = packet._tab
+        self.seq_no_pos = tab.Pos + tab.Offset (4)
+        self.ts_pos = tab.Pos + tab.Offset (6)
+        self.vec = packet.DataAsNumpy ()   # writable view into self.buf
+        self.name = cm.name
+
+    # patch the scalar fields and, optionally, the vector contents. The vector
+    # must have exactly the length the template was built with.
+    def update (self, seq_num, ts, vec=None):
+        flatbuffers.packer.uint32.pack_into (self.buf, self.seq_no_pos, seq_num)
+        flatbuffers.packer.float64.pack_into (self.buf, self.ts_pos, ts)
+        if vec is not None:
+            if len (vec) != len (self.vec):
+                raise ValueError ("template holds a vector of length {} but got {}".format (len (self.vec), len (vec)))
+            self.vec[:] = vec
+        return self.buf
+
+    # same as update but taking a custom message which must have the same
+    # shape as the one the template was built from
+    def fill (self, cm, with_vec=True):
+        if cm.name != self.name:
+            raise ValueError ("template was built for name {} but got {}".format (self.name, cm.name))
+        return self.update (cm.seq_num, cm.ts, cm.vec if with_vec else None)
 
 # serialize the custom message to iterable frame objects needed by zmq
-def serialize_to_frames (cm):
+def serialize_to_frames (cm, pool=None):
   """ serialize into an interable format """
   # We had to do it this way because the send_serialized method of zmq under the hood
   # relies on send_multipart, which needs a list or sequence of frames. The easiest way
   # to get an iterable out of the serialized buffer is to enclose it inside []
+  #
+  # Since send_serialized copies the frame into a zmq message before returning
+  # (it sends with copy=True by default), we can safely borrow the pooled
+  # builder's buffer here instead of making our own copy first.
   print ("serialize custom message to iterable list")
-  return [serialize (cm)]
+  return [serialize (cm, pool=pool, borrow=True)]
+
+# same as above but for a list of custom messages sent as one batch
+def serialize_batch_to_frames (cms, pool=None):
+  """ serialize a batch into an interable format """
+  print ("serialize batch of {} custom messages to iterable list".format (len (cms)))
+  return [serialize_batch (cms, pool=pool, borrow=True)]
   
   
 # deserialize the incoming serialized structure into native data type
@@ -97,6 +272,91 @@ def deserialize (buf):
 
     return cm
     
+# A read-only view of a received message that is backed directly by the
+# received buffer. Nothing is decoded up front; each field is fetched from the
+# buffer only when it is read. This is handy when most consumers only look at,
+# say, the seq num and timestamp, and never need the (potentially huge) vector.
+# The vector is handed out as a read-only numpy array that points into the
+# buffer itself, i.e., no copy is made. The buffer must therefore stay alive and
+# unmodified for as long as the view (or its vector) is in use.
+class CustomMessageView ():
+    """ Lazy, read-only view of a serialized custom message """
+    __slots__ = ['packet']
+
+    def __init__ (self, packet):
+        self.packet = packet  # the generated Message table over the buffer
+
+    @property
+    def seq_num (self):
+        return self.packet.SeqNo ()
+
+    @property
+    def ts (self):
+        return self.packet.Ts ()
+
+    @property
+    def name (self):
+        return self.packet.Name ()
+
+    @property
+    def vec (self):
+        # DataAsNumpy returns 0 if the vector was never written
+        if self.packet.DataIsNone ():
+            return np.empty (0, dtype=np.uint32)
+        vec = self.packet.DataAsNumpy ()
+        vec.flags.writeable = False  # the view is read-only
+        return vec
+
+    # materialize all the fields into our native representation
+    def to_custom_msg (self):
+        cm = CustomMessage ()
+        cm.seq_num = self.seq_num
+        cm.ts = self.ts
+        cm.name = self.name
+        cm.vec = self.vec.tolist ()
+        return cm
+
+    def dump (self):
+        print ("Dumping contents of Custom Message View")
+        print ("  Seq Num: {}".format (self.seq_num))
+        print ("  Timestamp: {}".format (self.ts))
+        print ("  Name: {}".format (self.name))
+        print ("  Vector type = {}".format (type (self.vec)))
+        print ("  Vector: {}".format (self.vec))
+
+# deserialize the incoming serialized structure into a lazy view rather than
+# copying every field into a new native custom message
+def deserialize_view (buf):
+    return CustomMessageView (msg.Message.GetRootAs (buf, 0))
+
+# A lazy view over a received Batch buffer. Nothing is decoded until we index
+# into or iterate over the batch, and each message handed out is itself a
+# lazy CustomMessageView over the same buffer.
+class BatchView ():
+    """ Lazy, read-only view of a serialized batch of custom messages """
+    __slots__ = ['packet']
+
+    def __init__ (self, packet):
+        self.packet = packet  # the generated Batch table over the buffer
+
+    def __len__ (self):
+        return self.packet.MsgsLength ()
+
+    def __getitem__ (self, j):
+        if j < 0:
+            j += len (self)
+        if j < 0 or j >= len (self):
+            raise IndexError ("batch index out of range")
+        return CustomMessageView (self.packet.Msgs (j))
+
+    def __iter__ (self):
+        for j in range (len (self)):
+            yield CustomMessageView (self.packet.Msgs (j))
+
+# deserialize the incoming batch buffer into a lazy view of its messages
+def deserialize_batch (buf):
+    return BatchView (batch.Batch.GetRootAs (buf, 0))
+
 # deserialize from frames
 def deserialize_from_frames (recvd_seq):
   """ This is invoked on list of frames by zmq """
@@ -112,4 +372,11 @@ def deserialize_from_frames (recvd_seq):
   # assuming only one frame in the received sequence, we just send this deserialized
   # custom message
   return cm
-    
+
+# deserialize a batch from frames
+def deserialize_batch_from_frames (recvd_seq):
+  """ This is invoked on list of frames by zmq """
+
+  # as with a single message, a batch travels as exactly one frame
+  assert (len (recvd_seq) == 1)
+  return deserialize_batch (recvd_seq[0])
@@ -0,0 +1,166 @@
+#  Author: Aniruddha Gokhale
+#  Created: Fall 2022
+#
+#  Purpose: pluggable JSON backends for our serialization code.
+#
+#  The standard library json package is always available but it is not the
+#  fastest JSON implementation around. Here we wrap the faster third party
+#  packages (orjson, ujson and simdjson) behind a common interface and pick
+#  the best one that happens to be installed, falling back on the standard
+#  library otherwise. Every backend produces bytes directly, so there is no
+#  separate UTF-8 encoding step before handing the result to ZMQ, and every
+#  backend knows how to deal with a numpy uint32 vector.
+#
+#  If you want to try the faster backends, install them via pip, e.g.,
+#      python3 -m pip install orjson ujson pysimdjson
+
+import json  # the standard library JSON package
+
+from custom_msg import CustomMessage  # our custom message in native format
+
+# numpy is optional; we only need it to recognize numpy vectors
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+# each of the following is optional
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+try:
+  import ujson
+except ImportError:
+  ujson = None
+
+try:
+  import simdjson
+except ImportError:
+  simdjson = None
+
+# convert a numpy vector (or numpy scalar) into something any JSON package
+# can deal with
+def to_native (obj):
+  if np is not None:
+    if isinstance (obj, np.ndarray):
+      return obj.tolist ()
+    if isinstance (obj, np.generic):
+      return obj.item ()
+  raise TypeError ("Object of type {} is not JSON serializable".format (type (obj).__name__))
+
+##################################
+#  The backends
+##################################
+
+# The standard library backend. Every other backend derives from this one and
+# replaces only what it does differently.
+class StdlibBackend ():
+  """ JSON backend using the standard library """
+  name = "stdlib"
+  numpy_native = False  # can the backend encode numpy vectors by itself?
+
+  # in our native format the vector is typically a list but may also be a
+  # numpy array; hand it over in a form the backend can deal with
+  def vector (self, vec):
+    if self.numpy_native or isinstance (vec, list):
+      return vec
+    return to_native (vec) if (np is not None and isinstance (vec, np.ndarray)) else list (vec)
+
+  # convert a Python object to JSON bytes
+  def dumps (self, obj):
+    return json.dumps (obj, separators=(",", ":"), default=to_native).encode ("utf-8")
+
+  # convert JSON bytes (or str) to a Python object
+  def loads (self, buf):
+    return json.loads (buf)
+
+  # serialize our custom message into JSON bytes
+  def encode (self, cm):
+    # create a JSON representation from the original data structure
+    json_buf = {
+      "seq_num": cm.seq_num,
+      "timestamp": cm.ts,
+      "name": cm.name,
+      "vector": self.vector (cm.vec)
+      }
+    return self.dumps (json_buf)
+
+  # deserialize JSON bytes into our custom message
+  def decode (self, buf):
+    # get the json representation from the incoming buffer
+    json_buf = self.loads (buf)
+
+    # now retrieve the native data structure out of it.
+    cm = CustomMessage ()
+    cm.seq_num = json_buf["seq_num"]
+    cm.ts = json_buf["timestamp"]
+    cm.name = json_buf["name"]
+    cm.vec = json_buf["vector"]
+    return cm
+
+# orjson is the fastest of the lot for both directions and natively
+# serializes numpy arrays
+class OrjsonBackend (StdlibBackend):
+  """ JSON backend using orjson """
+  name = "orjson"
+  numpy_native = True
+
+  def dumps (self, obj):
+    return orjson.dumps (obj, option=orjson.OPT_SERIALIZE_NUMPY, default=to_native)
+
+  def loads (self, buf):
+    return orjson.loads (buf)
+
+# ujson returns str, so we still encode, but both directions are much faster
+# than the standard library
+class UjsonBackend (StdlibBackend):
+  """ JSON backend using ujson """
+  name = "ujson"
+
+  def dumps (self, obj):
+    return ujson.dumps (obj).encode ("utf-8")
+
+  def loads (self, buf):
+    return ujson.loads (buf)
+
+# simdjson is a parser only, so encoding stays with the standard library
+class SimdjsonBackend (StdlibBackend):
+  """ JSON backend using simdjson for parsing """
+  name = "simdjson"
+
+  def loads (self, buf):
+    return simdjson.loads (buf)
+
+# all the backends we know about, in order of preference, along with the
+# package each one needs
+BACKENDS = [
+  (OrjsonBackend, orjson),
+  (UjsonBackend, ujson),
+  (SimdjsonBackend, simdjson),
+  (StdlibBackend, json),
+  ]
+
+# names of the backends whose packages are installed, best first
+def available_backends ():
+  return [cls.name for cls, pkg in BACKENDS if pkg is not None]
+
+# backends are stateless, so we create each one only once
+instances = {}
+
+# obtain the backend with the given name, or the best available one if no
+# name is given
+def get_backend (name=None):
+  if name is None:
+    name = available_backends ()[0]
+  if name not in instances:
+    for cls, pkg in BACKENDS:
+      if cls.name == name:
+        if pkg is None:
+          raise ValueError ("JSON backend {} is not installed".format (name))
+        instances[name] = cls ()
+        break
+    else:
+      raise ValueError ("Unknown JSON backend {}".format (name))
+  return instances[name]
@@ -19,14 +19,15 @@ import argparse  # argument parser
 ## the following are our files
 from custom_msg import CustomMessage  # our custom message in native format
 import serialize as sz  # this is from the file serialize.py in the same directory
+import json_backend as jb  # the pluggable JSON backends
 
 ##################################
 #        Driver program
 ##################################
 
-def driver (name, iters, vec_len):
+def driver (name, iters, vec_len, backend=None):
 
-  print ("Driver program: Name = {}, Num Iters = {}, Vector len = {}".format (name, iters, vec_len))
+  print ("Driver program: Name = {}, Num Iters = {}, Vector len = {}, Backend = {}".format (name, iters, vec_len, backend))
     
   # now publish our information for the number of desired iterations
   cm = CustomMessage ()   # create this once and reuse it for send/receive
@@ -46,14 +47,14 @@ def driver (name, iters, vec_len):
     # up the data structure and serializes it into the buffer
     print ("serialize the message")
     start_time = time.time ()
-    buf = sz.serialize (cm)
+    buf = sz.serialize (cm, backend)
     end_time = time.time ()
     print ("Serialization took {} secs".format (end_time-start_time))
 
     # now deserialize and see if it is printing the right thing
     print ("deserialize the message")
     start_time = time.time ()
-    cm = sz.deserialize (buf)
+    cm = sz.deserialize (buf, backend)
     end_time = time.time ()
     print ("Deserialization took {} secs".format (end_time-start_time))
 
@@ -65,6 +66,33 @@ def driver (name, iters, vec_len):
     time.sleep (0.050)  # 50 msec
 
 
+# Compare the throughput of every installed JSON backend. Unlike the driver
+# above, nothing is printed or slept on inside the timed loops.
+def compare (name, iters, vec_len):
+
+  print ("Comparing JSON backends: Name = {}, Num Iters = {}, Vector len = {}".format (name, iters, vec_len))
+
+  # the same message is used for every backend
+  cm = CustomMessage ()
+  cm.seq_num = 0
+  cm.ts = time.time ()
+  cm.name = name
+  cm.vec = [random.randint (1, 1000) for j in range (vec_len)]
+
+  print ("{:>10} {:>16} {:>16} {:>12}".format ("backend", "encode msgs/s", "decode msgs/s", "encode MB/s"))
+  for backend in jb.available_backends ():
+    start_time = time.perf_counter ()
+    for i in range (iters):
+      buf = sz.serialize (cm, backend)
+    encode_time = time.perf_counter () - start_time
+
+    start_time = time.perf_counter ()
+    for i in range (iters):
+      cm2 = sz.deserialize (buf, backend)
+    decode_time = time.perf_counter () - start_time
+
+    print ("{:>10} {:>16.1f} {:>16.1f} {:>12.1f}".format (backend, iters/encode_time, iters/decode_time, len (buf)*iters/encode_time/1e6))
+
 ##################################
 # Command line parsing
 ##################################
@@ -76,6 +104,8 @@ def parseCmdLineArgs ():
     parser.add_argument ("-i", "--iters", type=int, default=10, help="Number of iterations to run (default: 10)")
     parser.add_argument ("-l", "--veclen", type=int, default=20, help="Length of the vector field (default: 20; contents are irrelevant)")
     parser.add_argument ("-n", "--name", default="FlatBuffer Local Demo", help="Name to include in each message")
+    parser.add_argument ("-b", "--backend", default=None, choices=jb.available_backends (), help="JSON backend to use, one of those installed (default: the fastest one)")
+    parser.add_argument ("-c", "--compare", action="store_true", help="Instead of the demo, compare the throughput of all installed JSON backends")
     # parse the args
     args = parser.parse_args ()
 
@@ -91,8 +121,11 @@ def main ():
     # first parse the command line args
     parsed_args = parseCmdLineArgs ()
     
-   # start the driver code
-    driver (parsed_args.name, parsed_args.iters, parsed_args.veclen)
+   # start the driver code (or the comparison)
+    if parsed_args.compare:
+      compare (parsed_args.name, parsed_args.iters, parsed_args.veclen)
+    else:
+      driver (parsed_args.name, parsed_args.iters, parsed_args.veclen, parsed_args.backend)
 
 #----------------------------------------------
 if __name__ == '__main__':
@@ -14,34 +14,44 @@
 #
 #  Here our custom message format comprises a sequence number, a timestamp, a name,
 #  and a data buffer of several uint32 numbers (whose value is not relevant to us) 
+#
+#  The AsyncPeer is the same peer on asyncio sockets (zmq.asyncio), where
+#  sending and receiving are coroutines, so that a single thread can drive
+#  hundreds of sessions at once along with other asyncio I/O, such as the
+#  small HTTP endpoint we serve our metrics on.
 
 # The different packages we need in this Python driver code
 import os
 import sys
 import time  # needed for timing measurements and sleep
+import asyncio  # needed for the asyncio mode
 
 import random  # random number generator
 import argparse  # argument parser
 
 import zmq   # for ZeroMQ
+import zmq.asyncio   # for ZeroMQ sockets on asyncio
 
 ## the following are our files
 from custom_msg import CustomMessage  # our custom message in native format
 import serialize as sz  # this is from the file serialize.py in the same directory
+import json_backend as jb  # the pluggable JSON backends
 
 ##################################
 #  The Peer class
 ##################################
 class Peer ():
-  def __init__ (self):
+  def __init__ (self, backend=None):
     self.req = None  # represents the REQ socket
     self.rep = None  # represents the REP socket
+    self.backend = backend  # JSON backend to use (None means best available)
 
-  def configure (self, port):
+  def configure (self, port, context=None):
     try:
-      # every ZMQ session requires a context
-      print ("Obtain the ZMQ context")
-      context = zmq.Context ()   # returns a singleton object
+      # every ZMQ session requires a context, unless we are handed one to share
+      if context is None:
+        print ("Obtain the ZMQ context")
+        context = zmq.Context ()   # returns a singleton object
     except zmq.ZMQError as err:
       print ("ZeroMQ Error obtaining context: {}".format (err))
       raise
@@ -118,15 +128,17 @@ class Peer ():
   def send_request (self, cm):
     """ Send serialized request"""
     try:
-      # Use ZMQ's send_json method to send the jsonified buffer
-      print ("ZMQ sending custom message via ZMQ's send_json method")
-      buf = sz.serialize (cm)
-      self.req.send_json (buf)
+      # Our serialize method already hands us JSON bytes, so we send them as
+      # is. (ZMQ's send_json method would run its own json.dumps on top, i.e.,
+      # encode the JSON a second time.)
+      print ("ZMQ sending custom message via ZMQ's send method")
+      buf = sz.serialize (cm, self.backend)
+      self.req.send (buf)
     except zmq.ZMQError as err:
       print ("ZeroMQ Error serializing request: {}".format (err))
       raise
     except:
-      print ("Some exception occurred with send_json {}".format (sys.exc_info()[0]))
+      print ("Some exception occurred with send {}".format (sys.exc_info()[0]))
       raise
 
         
@@ -148,10 +160,10 @@ class Peer ():
   def recv_request (self):
     """ receive serialized request"""
     try:
-      # use ZMQ's recv_json method
+      # receive the JSON bytes and hand them to our deserialize method
       print ("ZMQ receiving serialized custom message as json and then deserialize")
-      buf = self.rep.recv_json ()
-      cm = sz.deserialize (buf)
+      buf = self.rep.recv ()
+      cm = sz.deserialize (buf, self.backend)
       return cm
     except zmq.ZMQError as err:
       print ("ZeroMQ Error receiving serialized message: {}".format (err))
@@ -160,6 +172,34 @@ class Peer ():
       print ("Some exception occurred with recv_serialized {}".format (sys.exc_info()[0]))
       raise
 
+  # Send a frame holding many messages as newline delimited JSON
+  def send_stream (self, frame):
+    """ Send NDJSON frame"""
+    try:
+      print ("ZMQ sending NDJSON frame of {} bytes".format (len (frame)))
+      self.req.send (frame)
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error sending NDJSON frame: {}".format (err))
+      raise
+    except:
+      print ("Some exception occurred with send {}".format (sys.exc_info()[0]))
+      raise
+
+  # Receive an NDJSON frame. What we hand back is a generator that yields
+  # the messages one by one as it parses them.
+  def recv_stream (self):
+    """ receive NDJSON frame"""
+    try:
+      print ("ZMQ receiving NDJSON frame")
+      frame = self.rep.recv ()
+      return sz.deserialize_ndjson (frame, self.backend)
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error receiving NDJSON frame: {}".format (err))
+      raise
+    except:
+      print ("Some exception occurred with recv {}".format (sys.exc_info()[0]))
+      raise
+
   # receive the dummy ACK on client side
   def recv_ack (self):
     """ receive dummy ACK"""
@@ -176,23 +216,88 @@ class Peer ():
 
         
         
+##################################
+#  The AsyncPeer class
+##################################
+class AsyncPeer (Peer):
+  """ Same as the Peer but with coroutines sending and receiving """
+
+  # all our async peers share a single asyncio context
+  def configure (self, port, context=None):
+    Peer.configure (self, port, context or zmq.asyncio.Context.instance ())
+
+  # send the JSON bytes of the custom message
+  async def send_request (self, cm):
+    """ Send serialized request"""
+    try:
+      await self.req.send (sz.serialize (cm, self.backend))
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error serializing request: {}".format (err))
+      raise
+    except:
+      print ("Some exception occurred with send {}".format (sys.exc_info()[0]))
+      raise
+
+  # Send the ACK from server to client
+  async def send_ack (self):
+    """ Send ACK"""
+    try:
+      await self.rep.send (b"ACK")
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error sending ACK: {}".format (err))
+      raise
+    except:
+      print ("Some exception occurred with send_ack {}".format (sys.exc_info()[0]))
+      raise
+
+  # receive the JSON bytes and deserialize them
+  async def recv_request (self):
+    """ receive serialized request"""
+    try:
+      buf = await self.rep.recv ()
+      return sz.deserialize (buf, self.backend)
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error receiving serialized message: {}".format (err))
+      raise
+    except:
+      print ("Some exception occurred with recv_serialized {}".format (sys.exc_info()[0]))
+      raise
+
+  # receive the dummy ACK on client side
+  async def recv_ack (self):
+    """ receive dummy ACK"""
+    try:
+      return await self.req.recv ()
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error receiving dummy ack: {}".format (err))
+      raise
+    except:
+      print ("Some exception occurred with recv_ack {}".format (sys.exc_info()[0]))
+      raise
+
 ##################################
 #        Driver program
 ##################################
 
-def driver (name, iters, vec_len, port):
+def driver (name, iters, vec_len, port, backend=None, stream=False, flush_bytes=64*1024, flush_ms=10, gap_ms=0):
 
-  print ("Driver program: Name = {}, Num Iters = {}, Vector len = {}, Peer port = {}".format (name, iters, vec_len, port))
+  print ("Driver program: Name = {}, Num Iters = {}, Vector len = {}, Peer port = {}, Backend = {}, Stream = {}".format (name, iters, vec_len, port, backend, stream))
 
   # first obtain a peer and initialize it
   print ("Driver program: create and configure a peer object")
-  peer = Peer ()
+  peer = Peer (backend)
   try:
     peer.configure (port)
   except:
     print ("Some exception occurred")
     return
   
+  # in streaming mode, many messages are packed into every frame
+  if stream:
+    stream_driver (peer, name, iters, vec_len, flush_bytes, flush_ms/1000.0, gap_ms/1000.0)
+    peer.cleanup ()
+    return
+
   # now send the serialized custom message for the number of desired iterations
   cm = CustomMessage ()   # create this once and reuse it for send/receive
 
@@ -253,6 +358,157 @@ def driver (name, iters, vec_len, port):
   # we are done. Just cleanup the peer before exiting
   peer.cleanup ()
   
+# Streaming mode: the messages are packed as newline delimited JSON into
+# frames that are sent once they are big enough or old enough. Each frame
+# still takes one REQ/REP exchange, but that cost is now shared by all the
+# messages in the frame. There is no per message printing or sleeping here
+# since this is the mode for high volumes.
+def stream_driver (peer, name, iters, vec_len, flush_bytes, flush_delay, gap=0.0):
+
+  print ("Stream driver: flush at {} bytes or {} secs, {} secs between messages".format (flush_bytes, flush_delay, gap))
+
+  batcher = sz.NDJSONBatcher (flush_bytes, flush_delay, peer.backend)
+  stats = {"frames": 0, "received": 0}
+  start_time = time.time ()
+
+  # send the frame from the client part and receive it at the server part,
+  # which then works through the messages as they get parsed
+  def send_frame (frame):
+    peer.send_stream (frame)
+    count = 0
+    for rcvd in peer.recv_stream ():
+      count += 1
+    print ("Frame {}: {} bytes, {} messages, last seq num = {}".format (stats["frames"], len (frame), count, rcvd.seq_num))
+    stats["frames"] += 1
+    stats["received"] += count
+
+    # one ACK for the whole frame
+    peer.send_ack ()
+    peer.recv_ack ()
+
+  try:
+    next_msg = time.monotonic ()
+    for i in range (iters):
+      # Wait for the next message to come along. While we wait, the pending
+      # frame may become due, in which case it is sent right away rather
+      # than when the next message shows up.
+      while True:
+        wait = next_msg - time.monotonic ()
+        left = batcher.time_left ()
+        if left is None or left > wait:
+          break
+        time.sleep (left)
+        send_frame (batcher.flush ())
+      if wait > 0:
+        time.sleep (wait)
+      next_msg = time.monotonic () + gap
+
+      # fill up a custom message and add it to the pending frame
+      cm = CustomMessage ()
+      cm.seq_num = i # this will be our sequence number
+      cm.ts = time.time ()  # current time
+      cm.name = name # assigned name
+      cm.vec = [random.randint (1, 1000) for j in range (vec_len)]
+      frame = batcher.add (cm)
+      if frame is not None:
+        send_frame (frame)
+
+    # we are done, so send whatever is still pending
+    frame = batcher.flush ()
+    if frame is not None:
+      send_frame (frame)
+  except:
+    return
+
+  end_time = time.time ()
+  print ("Streamed {} messages in {} frames in {} secs ({} msgs/sec)".format (stats["received"], stats["frames"], end_time-start_time, stats["received"]/(end_time-start_time)))
+
+##################################
+#        asyncio driver
+##################################
+
+# the given percentile (0-100) of an already sorted list of values
+def percentile (values, p):
+  if not values:
+    return 0.0
+  return values[min (len (values)-1, int (len (values) * p / 100.0))]
+
+# Serve our metrics over HTTP in the plain text format of Prometheus, i.e.,
+# one "name value" per line, e.g., "curl localhost:8000/metrics". It runs on
+# the same event loop as the sessions and by default only local clients can
+# reach it.
+async def serve_metrics (metrics, port, intf="127.0.0.1"):
+  async def handle (reader, writer):
+    await reader.readuntil (b"\r\n\r\n")  # we answer whatever is asked
+    body = "".join ("{} {}\n".format (name, value) for name, value in metrics.items ())
+    writer.write ("HTTP/1.0 200 OK\r\nContent-Type: text/plain\r\nContent-Length: {}\r\n\r\n{}".format (len (body), body).encode ())
+    await writer.drain ()
+    writer.close ()
+
+  print ("Serving metrics on http://{}:{}/metrics".format (intf, port))
+  return await asyncio.start_server (handle, intf, port)
+
+# one session: the same exchange as in the driver above, over its own peer,
+# recording the latency of each round
+async def session (peer, name, iters, vec_len, interval, metrics, latencies):
+  cm = CustomMessage ()
+  cm.name = name
+  for i in range (iters):
+    cm.seq_num = i
+    cm.ts = time.time ()
+    cm.vec = [random.randint (1, 1000) for j in range (vec_len)]
+
+    start_time = time.perf_counter ()
+    await peer.send_request (cm)
+    rcvd = await peer.recv_request ()
+    await peer.send_ack ()
+    await peer.recv_ack ()
+    latencies.append (time.perf_counter () - start_time)
+    metrics["messages_total"] += 1
+
+    # while we sleep, the other sessions get to run
+    await asyncio.sleep (interval)
+
+  metrics["sessions_active"] -= 1
+
+# Run many sessions at once on one event loop, each with a peer of its own
+# on consecutive ports starting at the given one. We only print a summary
+# at the end, since printing every message would dominate.
+async def async_driver (name, iters, vec_len, port, sessions, interval, backend=None, metrics_port=None, metrics_intf="127.0.0.1"):
+
+  print ("Async driver: {} sessions on ports {} to {}, {} iterations each, interval {} secs, Backend = {}".format (sessions, port, port+sessions-1, iters, interval, backend))
+
+  metrics = {"sessions_active": sessions, "messages_total": 0}
+  server = await serve_metrics (metrics, metrics_port, metrics_intf) if metrics_port else None
+
+  peers = []
+  try:
+    for k in range (sessions):
+      peer = AsyncPeer (backend)
+      peer.configure (port + k)
+      peers.append (peer)
+  except:
+    print ("Some exception occurred")
+    for peer in peers:
+      peer.cleanup ()
+    return
+
+  latencies = []
+  start_time = time.perf_counter ()
+  await asyncio.gather (*[session (peer, name, iters, vec_len, interval, metrics, latencies) for peer in peers])
+  end_time = time.perf_counter ()
+
+  latencies.sort ()
+  print ("{} sessions exchanged {} messages in {:.3f} secs, i.e., {:.1f} msgs/sec".format (sessions, len (latencies), end_time-start_time, len (latencies)/(end_time-start_time)))
+  print ("round trip (msecs): p50 {:.3f}, p90 {:.3f}, p99 {:.3f}, max {:.3f}".format (
+    percentile (latencies, 50)*1e3, percentile (latencies, 90)*1e3, percentile (latencies, 99)*1e3,
+    latencies[-1]*1e3 if latencies else 0.0))
+
+  if server:
+    server.close ()
+  for peer in peers:
+    peer.cleanup ()
+
 ##################################
 # Command line parsing
 ##################################
@@ -265,6 +521,15 @@ def parseCmdLineArgs ():
     parser.add_argument ("-l", "--veclen", type=int, default=20, help="Length of the vector field (default: 20; contents are irrelevant)")
     parser.add_argument ("-n", "--name", default="FlatBuffer ZMQ Demo", help="Name to include in each message")
     parser.add_argument ("-p", "--port", type=int, default=5555, help="Port where the server part of the peer listens and client side connects to (default: 5555)")
+    parser.add_argument ("-s", "--stream", action="store_true", help="Streaming mode: pack many messages as newline delimited JSON into each frame")
+    parser.add_argument ("--flush_bytes", type=int, default=64*1024, help="In streaming mode, send a frame once it reaches this many bytes (default: 65536)")
+    parser.add_argument ("--flush_ms", type=float, default=10, help="In streaming mode, send a frame once its oldest message is this many msecs old (default: 10)")
+    parser.add_argument ("--gap_ms", type=float, default=0, help="In streaming mode, msecs between messages, e.g., to see frames flushed by time (default: 0)")
+    parser.add_argument ("-a", "--sessions", type=int, default=0, help="Run this many sessions concurrently on one asyncio event loop, on consecutive ports (default: 0, i.e., the blocking peer)")
+    parser.add_argument ("--interval_ms", type=float, default=50, help="With sessions, msecs each session sleeps between messages (default: 50)")
+    parser.add_argument ("--metrics_port", type=int, default=None, help="With sessions, serve metrics over HTTP on this port")
+    parser.add_argument ("--metrics_intf", default="127.0.0.1", help="With sessions, interface to serve metrics on (default: 127.0.0.1, i.e., local clients only)")
+    parser.add_argument ("-b", "--backend", default=None, choices=jb.available_backends (), help="JSON backend to use, one of those installed (default: the fastest one)")
     # parse the args
     args = parser.parse_args ()
 
@@ -281,7 +546,10 @@ def main ():
   parsed_args = parseCmdLineArgs ()
     
   # start the driver code
-  driver (parsed_args.name, parsed_args.iters, parsed_args.veclen, parsed_args.port)
+  if parsed_args.sessions:
+    asyncio.run (async_driver (parsed_args.name, parsed_args.iters, parsed_args.veclen, parsed_args.port, parsed_args.sessions, parsed_args.interval_ms/1000.0, parsed_args.backend, parsed_args.metrics_port, parsed_args.metrics_intf))
+    return
+  driver (parsed_args.name, parsed_args.iters, parsed_args.veclen, parsed_args.port, parsed_args.backend, parsed_args.stream, parsed_args.flush_bytes, parsed_args.flush_ms, parsed_args.gap_ms)
 
 #----------------------------------------------
 if __name__ == '__main__':
@@ -11,38 +11,96 @@
 import os
 import sys
 
-import json # JSON package
+import time # for the flush time threshold
 
 from custom_msg import CustomMessage  # our custom message in native format
+import json_backend as jb  # the pluggable JSON backends
 
 # This is the method we will invoke from our driver program to convert a data structure
-# in native format to JSON
-def serialize (cm):
-
-  # create a JSON representation from the original data structure
-  json_buf = {
-    "seq_num": cm.seq_num,
-    "timestamp": cm.ts,
-    "name": cm.name,
-    "vector": cm.vec
-    }
-  
+# in native format to JSON.
+#
+# The actual JSON encoding is done by a backend (see json_backend.py). Unless
+# one is named, we use the fastest one that is installed, falling back on the
+# standard library json package. Either way what comes back is bytes that
+# can be sent as is.
+def serialize (cm, backend=None):
+
+  # create a JSON representation from the original data structure and
   # return the underlying jsonified buffer
-  return json.dumps (json_buf)
+  return jb.get_backend (backend).encode (cm)
 
 # deserialize the incoming serialized structure into native data type
-def deserialize (buf):
+def deserialize (buf, backend=None):
+
+  # get the json representation from the incoming buffer and retrieve
+  # the native data structure out of it.
+  return jb.get_backend (backend).decode (buf)
+
+# For high volume streams (e.g., log shipping) sending one JSON document per
+# exchange is wasteful. Instead we pack many messages into one frame as
+# newline delimited JSON (NDJSON), i.e., one JSON document per line. None of
+# our backends ever emit a raw newline inside a document (newlines within
+# strings are escaped), so a newline always marks the end of a message.
+#
+# A frame is flushed as soon as it reaches a size threshold or its oldest
+# message has waited for a time threshold, whichever comes first. add ()
+# takes care of the size, but once the producer goes quiet nothing gets
+# added, so whoever waits for the next message must not wait longer than
+# time_left () and then flush the frame if it is due ().
+class NDJSONBatcher ():
+  """ Packs serialized messages into NDJSON frames """
+
+  def __init__ (self, max_bytes=64*1024, max_delay=0.010, backend=None):
+    self.max_bytes = max_bytes  # flush once the frame is at least this big
+    self.max_delay = max_delay  # or once its oldest message is this old (secs)
+    self.backend = backend      # JSON backend to use (None means best available)
+    self.lines = []             # serialized messages waiting to be sent
+    self.size = 0               # bytes in the pending frame
+    self.started = None         # when the oldest pending message was added
+
+  # add a message; if that fills the frame up, the frame is returned and
+  # must be sent by the caller, else None is returned
+  def add (self, cm):
+    if not self.lines:
+      self.started = time.monotonic ()
+    line = serialize (cm, self.backend)
+    self.lines.append (line)
+    self.size += len (line) + 1
+    if self.size >= self.max_bytes or self.due ():
+      return self.flush ()
+    return None
+
+  # has the oldest pending message waited long enough?
+  def due (self):
+    return bool (self.lines) and (time.monotonic () - self.started >= self.max_delay)
+
+  # secs until the pending frame is due, or None if nothing is pending
+  def time_left (self):
+    if not self.lines:
+      return None
+    return max (0.0, self.started + self.max_delay - time.monotonic ())
 
-  # get the json representation from the incoming buffer
-  json_buf = json.loads (buf)
+  # the pending frame (and reset for the next one), or None if empty
+  def flush (self):
+    if not self.lines:
+      return None
+    self.lines.append (b"")  # so that the last line also ends in a newline
+    frame = b"\n".join (self.lines)
+    self.lines = []
+    self.size = 0
+    self.started = None
+    return frame
 
-  # now retrieve the native data structure out of it.
-  cm = CustomMessage ()
-  cm.seq_num = json_buf["seq_num"]
-  cm.ts = json_buf["timestamp"]
-  cm.name = json_buf["name"]
-  cm.vec = json_buf["vector"]
+# Incrementally decode an NDJSON frame, yielding each message as soon as its
+# line has been parsed, so the frame is never turned into a list of messages.
+def deserialize_ndjson (frame, backend=None):
+  start = 0
+  end = frame.find (b"\n")
+  while end >= 0:
+    if end > start:  # skip blank lines
+      yield deserialize (frame[start:end], backend)
+    start = end + 1
+    end = frame.find (b"\n", start)
+  if start < len (frame):  # tolerate a missing final newline
+    yield deserialize (frame[start:], backend)
 
-  return cm
-    
-    
@@ -0,0 +1,247 @@
+#  Author: Aniruddha Gokhale
+#  Created: Fall 2022
+#
+#  Purpose: a small pure-Python MessagePack encoder/decoder that we fall
+#  back on when the msgpack package is not installed.
+#
+#  MessagePack is a compact binary, schemaless format: like JSON, every value
+#  carries its own type, but numbers are stored in binary and small values
+#  take a single byte. The format is described at
+#
+#           https://github.com/msgpack/msgpack/blob/master/spec.md
+#
+#  We support the types that matter to us (nil, booleans, integers, floats,
+#  strings, binary, arrays and maps). What we produce can be read by the real
+#  msgpack package and vice versa.
+#
+#  Running this file directly checks that we produce exactly the same bytes
+#  as the msgpack package (if installed) and read back the same objects.
+
+import struct  # to pack binary numbers
+
+# big endian packers for the various widths
+UINT8 = struct.Struct (">B")
+UINT16 = struct.Struct (">H")
+UINT32 = struct.Struct (">I")
+UINT64 = struct.Struct (">Q")
+INT8 = struct.Struct (">b")
+INT16 = struct.Struct (">h")
+INT32 = struct.Struct (">i")
+INT64 = struct.Struct (">q")
+FLOAT32 = struct.Struct (">f")
+FLOAT64 = struct.Struct (">d")
+
+##################################
+#  Encoding
+##################################
+
+# append the encoding of an integer
+def pack_int (obj, out):
+  if 0 <= obj < 0x80:
+    out.append (obj)                 # positive fixint
+  elif -0x20 <= obj < 0:
+    out.append (obj & 0xff)          # negative fixint
+  elif obj >= 0:
+    if obj <= 0xff:
+      out += b"\xcc" + UINT8.pack (obj)
+    elif obj <= 0xffff:
+      out += b"\xcd" + UINT16.pack (obj)
+    elif obj <= 0xffffffff:
+      out += b"\xce" + UINT32.pack (obj)
+    elif obj <= 0xffffffffffffffff:
+      out += b"\xcf" + UINT64.pack (obj)
+    else:
+      raise OverflowError ("integer {} is too large for MessagePack".format (obj))
+  else:
+    if obj >= -0x80:
+      out += b"\xd0" + INT8.pack (obj)
+    elif obj >= -0x8000:
+      out += b"\xd1" + INT16.pack (obj)
+    elif obj >= -0x80000000:
+      out += b"\xd2" + INT32.pack (obj)
+    elif obj >= -0x8000000000000000:
+      out += b"\xd3" + INT64.pack (obj)
+    else:
+      raise OverflowError ("integer {} is too small for MessagePack".format (obj))
+
+# append the header of a str/bin/array/map of the given length. The fix
+# variant (if any) holds lengths up to fix_max in the low bits of fix_tag.
+def pack_header (n, out, fix_tag, fix_max, tag8, tag16, tag32):
+  if n <= fix_max:
+    out.append (fix_tag | n)
+  elif tag8 is not None and n <= 0xff:
+    out += tag8 + UINT8.pack (n)
+  elif n <= 0xffff:
+    out += tag16 + UINT16.pack (n)
+  else:
+    out += tag32 + UINT32.pack (n)
+
+# append the encoding of an array of integers. If every value is a positive
+# fixint, the whole array is its own encoding, which saves us a Python level
+# loop for the common case of small numbers. bytes () would also take bools
+# (and other int-like values), which must keep their own encoding, so the
+# shortcut is only for arrays of plain ints.
+def pack_int_array (obj, out):
+  pack_header (len (obj), out, 0x90, 0x0f, None, b"\xdc", b"\xdd")
+  if set (map (type, obj)) == {int}:
+    try:
+      out += bytes (obj)  # fails unless every value is in 0..255
+      if max (obj, default=0) < 0x80:
+        return
+      del out[-len (obj):]
+    except ValueError:
+      pass
+  for x in obj:
+    pack_obj (x, out)
+
+# append the encoding of any supported object
+def pack_obj (obj, out):
+  if obj is None:
+    out.append (0xc0)
+  elif obj is True:
+    out.append (0xc3)
+  elif obj is False:
+    out.append (0xc2)
+  elif isinstance (obj, int):
+    pack_int (obj, out)
+  elif isinstance (obj, float):
+    out += b"\xcb" + FLOAT64.pack (obj)
+  elif isinstance (obj, str):
+    data = obj.encode ("utf-8")
+    pack_header (len (data), out, 0xa0, 0x1f, b"\xd9", b"\xda", b"\xdb")
+    out += data
+  elif isinstance (obj, (bytes, bytearray, memoryview)):
+    pack_header (len (obj), out, 0, -1, b"\xc4", b"\xc5", b"\xc6")
+    out += obj
+  elif isinstance (obj, (list, tuple)):
+    if obj and isinstance (obj[0], int) and not isinstance (obj[0], bool):
+      pack_int_array (obj, out)
+    else:
+      pack_header (len (obj), out, 0x90, 0x0f, None, b"\xdc", b"\xdd")
+      for x in obj:
+        pack_obj (x, out)
+  elif isinstance (obj, dict):
+    pack_header (len (obj), out, 0x80, 0x0f, None, b"\xde", b"\xdf")
+    for k, v in obj.items ():
+      pack_obj (k, out)
+      pack_obj (v, out)
+  else:
+    raise TypeError ("Object of type {} cannot be serialized".format (type (obj).__name__))
+
+# serialize an object into MessagePack bytes
+def packb (obj):
+  out = bytearray ()
+  pack_obj (obj, out)
+  return bytes (out)
+
+##################################
+#  Decoding
+##################################
+
+# decode the object starting at index i and return it along with the index
+# just past it
+def unpack_obj (buf, i):
+  tag = buf[i]
+  i += 1
+  if tag < 0x80:                     # positive fixint
+    return tag, i
+  if tag >= 0xe0:                    # negative fixint
+    return tag - 0x100, i
+  if 0xa0 <= tag <= 0xbf:            # fixstr
+    n = tag & 0x1f
+    return str (buf[i:i+n], "utf-8"), i + n
+  if 0x90 <= tag <= 0x9f:            # fixarray
+    return unpack_array (buf, i, tag & 0x0f)
+  if 0x80 <= tag <= 0x8f:            # fixmap
+    return unpack_map (buf, i, tag & 0x0f)
+  if tag == 0xc0:
+    return None, i
+  if tag == 0xc2:
+    return False, i
+  if tag == 0xc3:
+    return True, i
+  if tag in SCALARS:
+    packer = SCALARS[tag]
+    return packer.unpack_from (buf, i)[0], i + packer.size
+  if tag in LENGTHS:
+    kind, packer = LENGTHS[tag]
+    n = packer.unpack_from (buf, i)[0]
+    i += packer.size
+    if kind == "str":
+      return str (buf[i:i+n], "utf-8"), i + n
+    if kind == "bin":
+      return bytes (buf[i:i+n]), i + n
+    if kind == "array":
+      return unpack_array (buf, i, n)
+    return unpack_map (buf, i, n)
+  raise ValueError ("Unsupported MessagePack type 0x{:02x}".format (tag))
+
+def unpack_array (buf, i, n):
+  items = []
+  for k in range (n):
+    item, i = unpack_obj (buf, i)
+    items.append (item)
+  return items, i
+
+def unpack_map (buf, i, n):
+  items = {}
+  for k in range (n):
+    key, i = unpack_obj (buf, i)
+    items[key], i = unpack_obj (buf, i)
+  return items, i
+
+# the fixed size scalars, by their tag
+SCALARS = {
+  0xca: FLOAT32, 0xcb: FLOAT64,
+  0xcc: UINT8, 0xcd: UINT16, 0xce: UINT32, 0xcf: UINT64,
+  0xd0: INT8, 0xd1: INT16, 0xd2: INT32, 0xd3: INT64,
+  }
+
+# the variable length types, by their tag, along with the packer of their length
+LENGTHS = {
+  0xc4: ("bin", UINT8), 0xc5: ("bin", UINT16), 0xc6: ("bin", UINT32),
+  0xd9: ("str", UINT8), 0xda: ("str", UINT16), 0xdb: ("str", UINT32),
+  0xdc: ("array", UINT16), 0xdd: ("array", UINT32),
+  0xde: ("map", UINT16), 0xdf: ("map", UINT32),
+  }
+
+# deserialize MessagePack bytes (or any bytes-like object) into an object
+def unpackb (buf):
+  buf = memoryview (buf)
+  obj, i = unpack_obj (buf, 0)
+  if i != len (buf):
+    raise ValueError ("Extra data after the MessagePack object")
+  return obj
+
+##################################
+#  Interoperability check
+##################################
+
+# objects covering every type and size class we encode
+def check_cases ():
+  return [
+    None, True, False, 0, 127, 128, 255, 256, 65535, 65536, 2**32, 2**64-1,
+    -1, -32, -33, -128, -129, -2**15, -2**31-1, -2**63, 1.5, -0.0,
+    "", "x"*31, "x"*32, "x"*256, "x"*65536, b"", b"y"*256, b"y"*65536,
+    [], list (range (15)), list (range (16)), list (range (200)), list (range (70000)),
+    [1, True], [True, 1], [0, False, 1, True], [1, 2, -3, 300, 2**40, True],
+    [1, 2.5, "z", None], {}, {"a": 1, "b": [1, True, None]}, {i: i for i in range (20)},
+    ]
+
+def check ():
+  try:
+    import msgpack
+  except ImportError:
+    print ("The msgpack package is not installed, nothing to compare against")
+    return
+  failures = 0
+  for obj in check_cases ():
+    ours, theirs = packb (obj), msgpack.packb (obj, use_bin_type=True)
+    if ours != theirs or unpackb (theirs) != obj or type (unpackb (ours)) is not type (obj) \
+       or (isinstance (obj, list) and list (map (type, unpackb (ours))) != list (map (type, obj))):
+      failures += 1
+      print ("Mismatch for {!r:.60}: ours {!r:.40}, msgpack {!r:.40}".format (obj, bytes (ours[:20]), theirs[:20]))
+  print ("{} of {} cases match the msgpack package".format (len (check_cases ()) - failures, len (check_cases ())))
+
+if __name__ == '__main__':
+  check ()
@@ -0,0 +1,100 @@
+#  Author: Aniruddha Gokhale
+#  Created: Fall 2022
+#
+#  Purpose: demonstrate serialization of user-defined packet structure
+#  using MessagePack
+#
+#  Here our packet or message format comprises a sequence number, a timestamp,
+#  and a data buffer of several uint32 numbers (whose value is not relevant to us)
+#
+#  Like JSON, MessagePack needs no schema: every value carries its own type.
+#  Unlike JSON, it is a compact binary format, so numbers are not converted to
+#  and from text. We use the msgpack package if it is installed and otherwise
+#  fall back on our own pure-Python implementation in purepack.py. Both produce
+#  exactly the same bytes.
+
+import os
+import sys
+
+from custom_msg import CustomMessage  # our custom message in native format
+
+# use the msgpack package if we have it, else our own implementation
+try:
+  import msgpack
+  implementation = "msgpack"
+except ImportError:
+  msgpack = None
+  import purepack
+  implementation = "purepack"
+
+# numpy is optional; we only need it to recognize numpy vectors
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+# the MessagePack encoder and decoder we will be using
+if msgpack is not None:
+  def packb (obj):
+    return msgpack.packb (obj, use_bin_type=True)
+
+  def unpackb (buf):
+    return msgpack.unpackb (buf, raw=False)
+else:
+  packb = purepack.packb
+  unpackb = purepack.unpackb
+
+# This is the method we will invoke from our driver program to convert a data structure
+# in native format to MessagePack
+def serialize (cm):
+
+  # a numpy vector is handed over as a list of plain ints
+  vec = cm.vec
+  if np is not None and isinstance (vec, np.ndarray):
+    vec = vec.tolist ()
+
+  # create a MessagePack map from the original data structure. We use the
+  # same keys as our JSON representation.
+  mp_buf = {
+    "seq_num": cm.seq_num,
+    "timestamp": cm.ts,
+    "name": cm.name,
+    "vector": vec
+    }
+
+  # return the underlying serialized bytes
+  return packb (mp_buf)
+
+# serialize the custom message to iterable frame objects needed by zmq
+def serialize_to_frames (cm):
+  """ serialize into an interable format """
+  # the send_serialized method of zmq relies on send_multipart, which needs a
+  # list of frames, so we enclose our single buffer inside []
+  print ("serialize custom message to iterable list")
+  return [serialize (cm)]
+
+# deserialize the incoming serialized structure into native data type
+def deserialize (buf):
+
+  # get the map from the incoming buffer
+  mp_buf = unpackb (buf)
+
+  # now retrieve the native data structure out of it.
+  cm = CustomMessage ()
+  cm.seq_num = mp_buf["seq_num"]
+  cm.ts = mp_buf["timestamp"]
+  cm.name = mp_buf["name"]
+  cm.vec = mp_buf["vector"]
+
+  return cm
+
+# deserialize from frames
+def deserialize_from_frames (recvd_seq):
+  """ This is invoked on list of frames by zmq """
+
+  # since we send only one frame, that is what we expect to receive
+  assert (len (recvd_seq) == 1)
+  print ("received data over the wire = {}".format (recvd_seq[0]))
+  cm = deserialize (recvd_seq[0])  # hand it to our deserialize method
+
+  return cm
@@ -0,0 +1,112 @@
+#  Author: Aniruddha Gokhale
+#  Created: Fall 2023
+#
+#  Purpose: admission control for the threaded gRPC server, so that under
+#  overload it keeps serving what it can in time rather than queueing
+#  everything until every client times out.
+#
+#  The threaded server hands every RPC to a thread from its pool. When the
+#  RPCs come in faster than the pool can serve them, they wait in the pool's
+#  queue, which has no bound. The queue and with it the latency then grow
+#  until the clients give up, and by the time the server gets to an RPC its
+#  client may no longer be waiting for it. The server keeps doing work that
+#  nobody wants and the goodput (useful responses per sec) collapses.
+#
+#  We protect the server in three ways:
+#     concurrency limit: gRPC itself rejects new RPCs with RESOURCE_EXHAUSTED
+#                        once maximum_concurrent_rpcs are in progress (this is
+#                        the -c option of the server)
+#     queue delay:       an interceptor notes when each RPC arrives. If the
+#                        RPC has waited longer than a target by the time a
+#                        thread gets to it, we reject it with RESOURCE_EXHAUSTED
+#                        right away rather than serving it late. Rejecting is
+#                        cheap, so the queue drains quickly and the RPCs
+#                        behind it are served in time.
+#     deadlines:         an RPC whose client deadline has already passed is
+#                        dropped with DEADLINE_EXCEEDED without doing the work
+#  The counts of accepted and shed RPCs are printed on shutdown or on SIGUSR1.
+
+import sys
+import time  # needed for timing measurements
+import threading  # needed to protect the counters
+
+import grpc   # for gRPC
+
+##################################
+#  Counters
+##################################
+class AdmissionStats ():
+  """ Counts of the RPCs we accepted and those we shed """
+
+  def __init__ (self, name):
+    self.name = name  # say, server
+    self.accepted = 0
+    self.shed_queue = 0     # waited longer than the target
+    self.shed_deadline = 0  # the client had given up already
+    self.lock = threading.Lock ()
+
+  def count (self, attr):
+    with self.lock:
+      setattr (self, attr, getattr (self, attr) + 1)
+
+  # Print the counts. As with our RPC stats, this may run in a signal handler,
+  # so it reads the counts without the lock.
+  def dump (self, file=sys.stdout):
+    shed = self.shed_queue + self.shed_deadline
+    total = self.accepted + shed
+    print ("------ {} admission control ------".format (self.name), file=file)
+    print ("accepted {}, shed {} ({:.1f}%): {} over the queue delay target, {} past their deadline".format (
+      self.accepted, shed, 100.0*shed/max (1, total), self.shed_queue, self.shed_deadline), file=file)
+    file.flush ()
+
+##################################
+#  Server interceptor
+##################################
+
+# wrap a synchronous method handler so that its behavior first decides
+# whether to serve the RPC at all
+def admitted_handler (handler, admission, arrival):
+
+  # abort the RPC if it is too late for it, else count it as accepted
+  def admit (context):
+    if context.time_remaining () is not None and context.time_remaining () <= 0:
+      admission.stats.count ("shed_deadline")
+      context.abort (grpc.StatusCode.DEADLINE_EXCEEDED, "deadline expired while queued")
+    if admission.target and time.perf_counter () - arrival > admission.target:
+      admission.stats.count ("shed_queue")
+      context.abort (grpc.StatusCode.RESOURCE_EXHAUSTED, "server overloaded, try again later")
+    admission.stats.count ("accepted")
+
+  if handler.unary_unary or handler.stream_unary:
+    behavior = handler.unary_unary or handler.stream_unary
+
+    def admitted (request, context):
+      admit (context)
+      return behavior (request, context)
+
+    field = "unary_unary" if handler.unary_unary else "stream_unary"
+  else:
+    behavior = handler.unary_stream or handler.stream_stream
+
+    def admitted (request, context):
+      admit (context)
+      yield from behavior (request, context)
+
+    field = "unary_stream" if handler.unary_stream else "stream_stream"
+
+  return handler._replace (**{field: admitted})
+
+class AdmissionInterceptor (grpc.ServerInterceptor):
+  """ Sheds RPCs that queued too long or whose deadline has passed """
+
+  def __init__ (self, stats, target):
+    self.stats = stats
+    self.target = target  # queue delay target in secs; None or 0 to not shed on it
+
+  # this is invoked as soon as an RPC arrives, before it is handed to a thread
+  def intercept_service (self, continuation, handler_call_details):
+    arrival = time.perf_counter ()
+    handler = continuation (handler_call_details)
+    if handler is None:
+      return None
+    return admitted_handler (handler, self, arrival)
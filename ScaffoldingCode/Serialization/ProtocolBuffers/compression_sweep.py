@@ -0,0 +1,214 @@
+#  Author: Aniruddha Gokhale
+#  Created: Fall 2023
+#
+#  Purpose: sweep over the gRPC compression settings and vector sizes to find
+#  out where compression starts to pay off. For every combination we report
+#     wire bytes: what actually goes over the TCP connection per call in
+#                 either direction (including HTTP/2 framing), as counted by
+#                 a small proxy we put between the client and the server
+#     CPU time:   per call, of this (client) process and of the server process
+#     latency:    end-to-end, per call
+#
+#  The server is started as a separate process (protobufdemo_grpc_server.py)
+#  for every compression setting. Its CPU time is read from /proc, so that
+#  part only works on Linux.
+
+# The different packages we need in this Python driver code
+import os
+import sys
+import time  # needed for timing measurements
+import socket  # needed for the proxy
+import selectors  # needed for the proxy
+import threading  # the proxy runs in a thread of its own
+import subprocess  # needed to start the server
+
+import argparse  # argument parser
+import numpy as np  # for the vector contents
+
+import grpc   # for gRPC
+
+# import generated packages
+import schema_pb2 as spb
+import schema_pb2_grpc as spb_grpc
+
+# our numpy conversion helpers for the request data
+import numpy_conv as nc
+
+# the compression algorithms we can choose from
+from protobufdemo_grpc_client import COMPRESSION
+
+##################################
+#  Byte counting TCP proxy
+##################################
+class ByteCountingProxy (threading.Thread):
+  """ Forwards connections to the server while counting the bytes """
+
+  def __init__ (self, port, server_port):
+    threading.Thread.__init__ (self, daemon=True)
+    self.server_port = server_port
+    self.listener = socket.create_server (("localhost", port))
+    self.sent = 0       # client to server
+    self.received = 0   # server to client
+    self.cpu = 0.0      # CPU time of this thread, to keep it out of the client's
+    self.stopped = False
+
+  def run (self):
+    sel = selectors.DefaultSelector ()
+    sel.register (self.listener, selectors.EVENT_READ, None)
+    while not self.stopped:
+      for key, events in sel.select (timeout=0.1):
+        if key.data is None:
+          # a new connection from the client, which we connect to the server
+          conn, addr = self.listener.accept ()
+          upstream = socket.create_connection (("localhost", self.server_port))
+          for sock in (conn, upstream):
+            sock.setsockopt (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+          sel.register (conn, selectors.EVENT_READ, (upstream, True))
+          sel.register (upstream, selectors.EVENT_READ, (conn, False))
+        else:
+          peer, upwards = key.data
+          data = key.fileobj.recv (1 << 16)
+          if not data:
+            # one side is gone, so close both
+            for sock in (key.fileobj, peer):
+              sel.unregister (sock)
+              sock.close ()
+            continue
+          peer.sendall (data)
+          if upwards:
+            self.sent += len (data)
+          else:
+            self.received += len (data)
+      self.cpu = time.thread_time ()
+
+  def reset (self):
+    self.sent = self.received = 0
+
+  def stop (self):
+    self.stopped = True
+    self.join ()
+    self.listener.close ()
+
+##################################
+#  Server process
+##################################
+
+# CPU time (user + system, in secs) consumed so far by the given process
+def process_cpu (pid):
+  try:
+    with open ("/proc/{}/stat".format (pid)) as f:
+      # the command name may contain spaces, so split after its closing paren
+      fields = f.read ().rsplit (")", 1)[1].split ()
+    return (int (fields[11]) + int (fields[12])) / os.sysconf ("SC_CLK_TCK")
+  except (OSError, ValueError, IndexError):
+    return float ("nan")
+
+# start the server with the given compression and wait until it serves
+def start_server (port, compression):
+  here = os.path.dirname (os.path.abspath (__file__))
+  server = subprocess.Popen ([sys.executable, os.path.join (here, "protobufdemo_grpc_server.py"), "-q", "--no_stats", "-z", compression, "-p", str (port)],
+                             stdout=subprocess.DEVNULL, cwd=here)
+  with grpc.insecure_channel ("localhost:" + str (port)) as channel:
+    grpc.channel_ready_future (channel).result (timeout=30)
+  return server
+
+def stop_server (server):
+  server.terminate ()  # the server stops cleanly on SIGTERM
+  server.wait ()
+
+##################################
+#  The sweep
+##################################
+
+# run the calls for one setting and vector size and return the number of
+# calls and the per-call wire bytes each way, client and server CPU time, and
+# latencies. The server CPU time only advances in clock ticks (typically 10
+# msecs), so we keep calling for at least min_secs, even past iters calls,
+# for it to span enough ticks to be meaningful per call.
+def measure (stub, proxy, server, req, iters, min_secs):
+  stub.method (req)  # warm up, i.e., connection setup is not counted
+  proxy.reset ()
+  latencies = []
+  client_cpu = time.process_time () - proxy.cpu
+  server_cpu = process_cpu (server.pid)
+  end_time = time.perf_counter () + min_secs
+  while len (latencies) < iters or time.perf_counter () < end_time:
+    start_time = time.perf_counter ()
+    stub.method (req)
+    latencies.append (time.perf_counter () - start_time)
+  server_cpu = process_cpu (server.pid) - server_cpu
+  client_cpu = time.process_time () - proxy.cpu - client_cpu
+  calls = len (latencies)
+  latencies.sort ()
+  return (calls, proxy.sent / calls, proxy.received / calls, client_cpu / calls, server_cpu / calls,
+          latencies[calls // 2], sum (latencies) / calls)
+
+def driver (veclens, iters, port, proxy_port, settings, raw, min_secs):
+
+  print ("Driver program: Vector lens = {}, Num Iters = {}, Min secs = {}, Server port = {}, Proxy port = {}, Compression = {}, Vector field = {}".format (veclens, iters, min_secs, port, proxy_port, settings, "data_raw" if raw else "data"))
+
+  proxy = ByteCountingProxy (proxy_port, port)
+  proxy.start ()
+
+  # the same vectors for every setting
+  requests = []
+  for vec_len in veclens:
+    req = spb.Request (seq_no=0, ts=time.time (), name="ProtoBuf Compression Sweep")
+    nc.set_data (req, np.random.randint (1, 1000, size=vec_len, dtype=np.uint32), raw)
+    requests.append ((vec_len, req))
+
+  print ("{:>8} {:>10} {:>8} {:>14} {:>14} {:>14} {:>14} {:>12} {:>12}".format ("setting", "veclen", "calls", "req B/call", "resp B/call", "client us/call", "server us/call", "p50 ms", "mean ms"))
+  for setting in settings:
+    server = start_server (port, setting)
+    try:
+      # the requests go through the proxy with the chosen compression
+      with grpc.insecure_channel ("localhost:" + str (proxy_port), compression=COMPRESSION[setting]) as channel:
+        stub = spb_grpc.DummyServiceStub (channel)
+        for vec_len, req in requests:
+          # large vectors take long, so scale down their iterations
+          n = max (5, min (iters, (iters * 10000) // max (1, vec_len)))
+          calls, sent, received, client_cpu, server_cpu, p50, mean = measure (stub, proxy, server, req, n, min_secs)
+          print ("{:>8} {:>10} {:>8} {:>14.0f} {:>14.0f} {:>14.1f} {:>14.1f} {:>12.3f} {:>12.3f}".format (setting, vec_len, calls, sent, received, client_cpu*1e6, server_cpu*1e6, p50*1e3, mean*1e3))
+    finally:
+      stop_server (server)
+
+  proxy.stop ()
+
+##################################
+# Command line parsing
+##################################
+def parseCmdLineArgs ():
+    # parse the command line
+    parser = argparse.ArgumentParser ()
+
+    # add optional arguments
+    parser.add_argument ("-i", "--iters", type=int, default=200, help="Number of calls per setting and vector length, scaled down for long vectors (default: 200)")
+    parser.add_argument ("-l", "--veclen", type=int, nargs="+", default=[20, 1000, 10000, 100000, 1000000], help="One or more lengths of the vector field (default: 20 1000 10000 100000 1000000)")
+    parser.add_argument ("-s", "--min_secs", type=float, default=2.0, help="Keep calling for at least this many secs per setting and vector length, so the server CPU time spans many clock ticks (default: 2)")
+    parser.add_argument ("-z", "--compression", choices=list (COMPRESSION), nargs="+", default=list (COMPRESSION), help="Compression settings to sweep over (default: all)")
+    # the raw bytes are what the numpy helpers make fast, so they are the default
+    parser.add_argument ("-r", "--raw", action="store_true", default=True, help="Send the vector as raw little endian bytes in data_raw (the default)")
+    parser.add_argument ("--packed", dest="raw", action="store_false", help="Send the vector in the repeated data field instead")
+    parser.add_argument ("-p", "--port", type=int, default=5577, help="Port where the server listens (default: 5577)")
+    parser.add_argument ("-x", "--proxy_port", type=int, default=5578, help="Port where the byte counting proxy listens (default: 5578)")
+    # parse the args
+    args = parser.parse_args ()
+
+    return args
+
+#------------------------------------------
+# main function
+def main ():
+  """ Main program """
+
+  print("Compression sweep for Protocol Buffers with gRPC")
+
+  # first parse the command line args
+  parsed_args = parseCmdLineArgs ()
+
+  # start the driver code
+  driver (parsed_args.veclen, parsed_args.iters, parsed_args.port, parsed_args.proxy_port, parsed_args.compression, parsed_args.raw, parsed_args.min_secs)
+
+#----------------------------------------------
+if __name__ == '__main__':
+    main ()
@@ -0,0 +1,51 @@
+#  Author: Aniruddha Gokhale
+#  Created: Fall 2023
+#
+#  Purpose: fast conversion between numpy uint32 arrays and the data carried
+#  by our Request message.
+#
+#  The data can travel in one of two fields of the Request:
+#    data:     a (packed) repeated uint32 field. Reading it into numpy is a
+#              bulk copy, but filling it still goes value by value, which
+#              gets expensive for large vectors. Worse, protobuf only fills it
+#              quickly from a list, so a numpy vector is first turned into one,
+#              which makes this path slower than just keeping a list around
+#              (about 2x at 100000 values; extend () on the array is slower
+#              still).
+#    data_raw: a bytes field holding the same values as little endian
+#              uint32s. Filling it is a single memory copy and reading it
+#              needs no copy at all since numpy can look at the bytes
+#              directly.
+#  On the wire, both cost the same four bytes per value (or less for the
+#  packed field when values are small, as it uses varints).
+#
+#  So the speedup comes only from data_raw; the data field is supported so
+#  that either side can talk to peers that use it.
+
+import numpy as np
+
+# the layout of data_raw, regardless of the byte order of this machine
+RAW_DTYPE = np.dtype ("<u4")
+
+# fill in the data of the request from a numpy array (or any sequence of
+# uint32 values), either in the repeated field or as raw bytes
+def set_data (req, vec, raw=False):
+  if raw:
+    req.ClearField ("data")
+    req.data_raw = np.ascontiguousarray (vec, dtype=RAW_DTYPE).tobytes ()
+  else:
+    req.ClearField ("data_raw")
+    # assigning a list is the fastest way to fill a repeated field, even
+    # counting the conversion from numpy. Still, it is slower than the
+    # original list approach, so use raw when speed matters.
+    req.data[:] = vec.tolist () if isinstance (vec, np.ndarray) else vec
+
+# obtain the data of the request as a numpy uint32 array, whichever field it
+# came in. For data_raw, the array is a read-only view over the bytes of the
+# request, so it must be copied if it needs to outlive the request.
+def get_data (req):
+  if req.data_raw:
+    if len (req.data_raw) % RAW_DTYPE.itemsize:
+      raise ValueError ("data_raw holds {} bytes, which is not a whole number of uint32s".format (len (req.data_raw)))
+    return np.frombuffer (req.data_raw, dtype=RAW_DTYPE)
+  return np.array (req.data, dtype=np.uint32)
@@ -0,0 +1,142 @@
+#  Author: Aniruddha Gokhale
+#  Created: Fall 2023
+#
+#  Purpose: benchmark the cost of getting the vector of our Request in and
+#  out of Protocol Buffers as the vector grows. We compare the original
+#  approach of going through Python lists against our numpy conversion
+#  helpers, for both the repeated data field and the raw data_raw bytes field.
+#  Only the raw field is faster than the lists when encoding; numpy into the
+#  repeated field has to go through a list anyway, so it is slower. The
+#  speedup column is therefore that of the raw field over the lists.
+#
+#  Encoding covers filling in the request and serializing it; decoding covers
+#  parsing the request and obtaining the vector from it.
+
+# The different packages we need in this Python driver code
+import os
+import sys
+import time  # needed for timing measurements
+
+import argparse  # argument parser
+import numpy as np  # for generating the vector contents
+
+# import generated packages
+import schema_pb2 as spb
+
+# our numpy conversion helpers for the request data
+import numpy_conv as nc
+
+##################################
+#        Benchmark helpers
+##################################
+
+# every request carries the same timestamp so that the approaches can be
+# checked for producing the same bytes
+TS = time.time ()
+
+# the original approach: the vector is a list and the repeated field is
+# turned back into a list on the receiving side
+def encode_list (vec):
+  req = spb.Request (seq_no=0, ts=TS, name="ProtoBuf Benchmark")
+  req.data[:] = vec
+  return req.SerializeToString ()
+
+def decode_list (buf):
+  req = spb.Request.FromString (buf)
+  return list (req.data)
+
+# our numpy helpers, with either field
+def encode_numpy (vec, raw):
+  req = spb.Request (seq_no=0, ts=TS, name="ProtoBuf Benchmark")
+  nc.set_data (req, vec, raw)
+  return req.SerializeToString ()
+
+def decode_numpy (buf):
+  req = spb.Request.FromString (buf)
+  return nc.get_data (req)
+
+# time the given function for the given number of iterations and return the
+# average time per call in seconds along with the last result
+def time_it (func, iters, *args):
+  start_time = time.perf_counter ()
+  for i in range (iters):
+    result = func (*args)
+  end_time = time.perf_counter ()
+  return (end_time - start_time) / iters, result
+
+##################################
+#        Driver program
+##################################
+
+def driver (iters, veclens):
+
+  print ("Driver program: Num Iters = {}, Vector lens = {}".format (iters, veclens))
+
+  header = "{:>10} {:>14} {:>16} {:>16} {:>12}".format ("veclen", "list (secs)", "numpy data (s)", "numpy raw (s)", "raw speedup")
+  row = "{:>10} {:>14.6e} {:>16.6e} {:>16.6e} {:>11.1f}x"
+
+  results = []
+  print ("Encoding")
+  print (header)
+  for vec_len in veclens:
+    vec = np.random.randint (1, 1000, size=vec_len, dtype=np.uint32)
+    vec_list = vec.tolist ()  # the original code already has a list
+
+    # the list based approaches are slow for long vectors, so scale down
+    # their iterations to keep the total running time reasonable
+    slow_iters = max (1, min (iters, (iters * 10000) // vec_len))
+    list_time, list_buf = time_it (encode_list, slow_iters, vec_list)
+    packed_time, packed_buf = time_it (encode_numpy, slow_iters, vec, False)
+    raw_time, raw_buf = time_it (encode_numpy, iters, vec, True)
+
+    # the list and numpy approaches must produce exactly the same bytes
+    assert (list_buf == packed_buf)
+
+    print (row.format (vec_len, list_time, packed_time, raw_time, list_time/raw_time))
+    results.append ((vec_len, vec, packed_buf, raw_buf))
+
+  print ("Decoding")
+  print (header)
+  for vec_len, vec, packed_buf, raw_buf in results:
+    slow_iters = max (1, min (iters, (iters * 10000) // vec_len))
+    list_time, list_vec = time_it (decode_list, slow_iters, packed_buf)
+    packed_time, packed_vec = time_it (decode_numpy, iters, packed_buf)
+    raw_time, raw_vec = time_it (decode_numpy, iters, raw_buf)
+
+    # all approaches must recover the original vector
+    assert (list_vec == vec.tolist ())
+    assert (np.array_equal (packed_vec, vec) and np.array_equal (raw_vec, vec))
+
+    print (row.format (vec_len, list_time, packed_time, raw_time, list_time/raw_time))
+
+##################################
+# Command line parsing
+##################################
+def parseCmdLineArgs ():
+    # parse the command line
+    parser = argparse.ArgumentParser ()
+
+    # add optional arguments
+    parser.add_argument ("-i", "--iters", type=int, default=100, help="Number of iterations per vector length (default: 100)")
+    parser.add_argument ("-l", "--veclen", type=int, nargs="+", default=[20, 1000, 100000, 1000000], help="One or more lengths of the vector field (default: 20 1000 100000 1000000)")
+    # parse the args
+    args = parser.parse_args ()
+
+    return args
+
+#------------------------------------------
+# main function
+def main ():
+  """ Main program """
+
+  print("Benchmark program for Protocol Buffers vector conversion")
+
+  # first parse the command line args
+  parsed_args = parseCmdLineArgs ()
+
+  # start the driver code
+  driver (parsed_args.iters, parsed_args.veclen)
+
+#----------------------------------------------
+if __name__ == '__main__':
+    main ()
@@ -9,6 +9,33 @@
 
 # This one implements the client functionality
 #
+# The client can talk to the server in one of three modes:
+#   unary:  one RPC per message, i.e., a full round trip per message
+#   stream: a single client streaming RPC carrying all the messages, which
+#           the server acknowledges once at the end
+#   bidi:   a single bidirectional streaming RPC where the server sends back
+#           periodic cumulative acknowledgements while the messages flow
+#   pipelined: one RPC per message as in unary, but without waiting for the
+#           response before sending the next one; up to a window of RPCs
+#           are in flight at a time, so throughput scales with the window
+#           rather than being capped at one message per round trip
+#   batch:  messages are collected into batches, each sent as a single unary
+#           call once it is full or its oldest message has waited long
+#           enough, for when streams are not an option (e.g., proxies)
+#   hedged: one RPC per message to one of several server replicas; if it
+#           has not answered within a percentile of the recent latencies, the
+#           same request goes to the next replica as well and whichever
+#           answers first wins, while the other call is cancelled
+# Only the streaming modes can get anywhere near line rate with small messages.
+#
+# Unless turned off, an interceptor records the latency and request and
+# response bytes of every call (see rpc_stats.py) and prints a summary at
+# the end or on SIGUSR1.
+#
+# Requests can be compressed (gzip or deflate), either for every call on the
+# channel or per call, where the latter overrides the former. See
+# compression_sweep.py for the trade-off between bandwidth and CPU.
+#
 
 # Note that this code mimics what we did with FlatBufs+ZeroMQ but this time
 # we mix Protocol Buffers and gRPC
@@ -17,9 +44,13 @@
 import os
 import sys
 import time  # needed for timing measurements and sleep
+import threading  # needed to bound the in-flight window
+import queue  # needed to wait for the first of the hedged calls
+import collections  # needed for the recent latencies
 
 import random  # random number generator
 import argparse  # argument parser
+import numpy as np  # for the vector contents
 
 import logging
 
@@ -29,24 +60,384 @@ import grpc   # for gRPC
 import schema_pb2 as spb
 import schema_pb2_grpc as spb_grpc
 
+# our numpy conversion helpers for the request data
+import numpy_conv as nc
+
+# our latency and size interceptors
+import rpc_stats
+
+# the compression algorithms we can choose from
+COMPRESSION = {"none": grpc.Compression.NoCompression,
+               "deflate": grpc.Compression.Deflate,
+               "gzip": grpc.Compression.Gzip}
+
+##################################
+#        Streaming helpers
+##################################
+
+# generator of the requests we stream to the server. gRPC pulls requests
+# from it as fast as the stream can carry them, so there is no sleep here.
+# Since gRPC may still hold on to a request we have handed over, every
+# request is a new object, copied from a template whose data is converted
+# only once; the data contents stay the same throughout.
+def generate_requests (name, iters, vec_len, raw=False):
+  template = spb.Request (name=name)
+  nc.set_data (template, np.random.randint (1, 1000, size=vec_len, dtype=np.uint32), raw)
+  for i in range (iters):
+    req = spb.Request ()
+    req.CopyFrom (template)
+    req.seq_no = i
+    req.ts = time.time ()
+    yield req
+
+# client streaming: send all requests over a single RPC and wait for the
+# acknowledgement at the end
+def stream_driver (stub, name, iters, vec_len, raw=False, compression=None):
+  print ("Peer client streaming {} requests".format (iters))
+  start_time = time.time ()
+  ack = stub.stream_method (generate_requests (name, iters, vec_len, raw), compression=compression)
+  end_time = time.time ()
+  print ("Server acknowledged {} requests, {} bytes, last seq no: {}".format (ack.count, ack.num_bytes, ack.last_seq_no))
+  print ("streaming took {} secs, i.e., {:.1f} msgs/sec".format (end_time-start_time, ack.count/(end_time-start_time)))
+
+# bidirectional streaming: send all requests over a single RPC while reading
+# the periodic acknowledgements coming back
+def bidi_driver (stub, name, iters, vec_len, raw=False, compression=None):
+  print ("Peer client streaming {} requests with periodic acks".format (iters))
+  start_time = time.time ()
+  ack = spb.Ack ()
+  for ack in stub.bidi_method (generate_requests (name, iters, vec_len, raw), compression=compression):
+    print ("Ack: {} requests, {} bytes, last seq no: {}, after {} secs".format (ack.count, ack.num_bytes, ack.last_seq_no, time.time ()-start_time))
+  end_time = time.time ()
+  print ("streaming took {} secs, i.e., {:.1f} msgs/sec".format (end_time-start_time, ack.count/(end_time-start_time)))
+
+##################################
+#        Pipelining helpers
+##################################
+
+# the given percentile (0-100) of an already sorted list of values
+def percentile (values, p):
+  if not values:
+    return 0.0
+  return values[min (len (values)-1, int (len (values) * p / 100.0))]
+
+# print a summary of the per-call latencies (in secs)
+def print_latencies (latencies):
+  latencies = sorted (latencies)
+  print ("latency (msecs): min {:.3f}, p50 {:.3f}, p90 {:.3f}, p99 {:.3f}, p99.9 {:.3f}, max {:.3f}".format (
+    latencies[0]*1e3 if latencies else 0.0,
+    percentile (latencies, 50)*1e3, percentile (latencies, 90)*1e3,
+    percentile (latencies, 99)*1e3, percentile (latencies, 99.9)*1e3,
+    latencies[-1]*1e3 if latencies else 0.0))
+
+# pipelined unary calls: every request is issued as a future without waiting
+# for the previous ones to complete, but no more than window of them may be
+# in flight at a time. As each call completes, its callback (run on a gRPC
+# thread) records the latency and frees up a slot in the window. With a
+# timeout, every call has that deadline and the goodput counts only the
+# calls that succeeded, i.e., in time.
+#
+# With a rate, the calls are issued at that many per sec regardless of how
+# fast they complete (as long as the window allows), i.e., the load is open
+# loop like that of many independent clients. This is what overloads a server
+# when the rate exceeds what it can serve.
+def pipelined_driver (stub, name, iters, vec_len, window, raw=False, compression=None, timeout=None, rate=None):
+  print ("Peer client pipelining {} requests with a window of {}, timeout {} secs, rate {} msgs/sec".format (iters, window, timeout, rate))
+  slots = threading.BoundedSemaphore (window)
+  latencies = []  # appending to a list is thread safe
+  errors = []
+
+  def call_done (future, call_start):
+    latencies.append (time.perf_counter () - call_start)
+    if future.exception () is not None:
+      errors.append (future.code ())
+    slots.release ()
+
+  start_time = time.perf_counter ()
+  for i, req in enumerate (generate_requests (name, iters, vec_len, raw)):
+    if rate:
+      # wait until this call is due
+      pause = start_time + i/rate - time.perf_counter ()
+      if pause > 0:
+        time.sleep (pause)
+    slots.acquire ()  # wait for a slot in the window
+    call_start = time.perf_counter ()
+    future = stub.method.future (req, timeout=timeout, compression=compression)
+    future.add_done_callback (lambda f, t=call_start: call_done (f, t))
+
+  # wait for the calls still in flight by taking over the whole window
+  for i in range (window):
+    slots.acquire ()
+  end_time = time.perf_counter ()
+
+  print ("pipelining took {} secs, i.e., {:.1f} msgs/sec, {} failed calls".format (end_time-start_time, iters/(end_time-start_time), len (errors)))
+  if errors:
+    print ("failed calls by status: {}".format (", ".join ("{} {}".format (code.name, errors.count (code)) for code in set (errors))))
+  print ("goodput: {:.1f} successful calls/sec".format ((iters-len (errors))/(end_time-start_time)))
+  print_latencies (latencies)
+
+##################################
+#        Batching helpers
+##################################
+
+# Collects requests into a BatchRequest and sends it as a single unary call
+# once it holds max_items requests or its oldest request has waited for
+# max_delay secs, whichever comes first. The deadline is watched by a thread
+# of its own so that a partial batch goes out even if no more requests come.
+class Batcher ():
+  """ Client side batcher of requests """
+
+  def __init__ (self, stub, max_items, max_delay, compression=None):
+    self.stub = stub
+    self.max_items = max_items
+    self.max_delay = max_delay
+    self.compression = compression
+    self.batch = spb.BatchRequest ()
+    self.deadline = None  # when the current batch must go out
+    self.cond = threading.Condition ()
+    self.closed = False
+    self.acked = 0        # requests acknowledged by the server
+    self.batches = 0      # batches sent
+    self.latencies = []   # per batch
+    self.flusher = threading.Thread (target=self.watch_deadline, daemon=True)
+    self.flusher.start ()
+
+  # add a request (which is copied) to the current batch
+  def add (self, req):
+    with self.cond:
+      self.batch.items.append (req)
+      if len (self.batch.items) == 1:
+        self.deadline = time.perf_counter () + self.max_delay
+        self.cond.notify ()
+      batch = self.take () if len (self.batch.items) >= self.max_items else None
+    if batch:
+      self.send (batch)
+
+  # take the current batch for sending and start a new one. Must be called
+  # with the lock held.
+  def take (self):
+    batch = self.batch
+    self.batch = spb.BatchRequest ()
+    self.deadline = None
+    return batch
+
+  # send a batch; this happens outside the lock so that requests can be
+  # added to the next batch in the meantime
+  def send (self, batch):
+    start_time = time.perf_counter ()
+    ack = self.stub.batch_method (batch, compression=self.compression)
+    self.latencies.append (time.perf_counter () - start_time)
+    with self.cond:
+      self.acked += ack.count
+      self.batches += 1
+
+  # the thread sending out batches whose deadline has passed
+  def watch_deadline (self):
+    while True:
+      with self.cond:
+        while not self.closed and (self.deadline is None or self.deadline > time.perf_counter ()):
+          self.cond.wait (None if self.deadline is None else self.deadline - time.perf_counter ())
+        if self.closed:
+          return
+        batch = self.take ()
+      self.send (batch)
+
+  # send whatever is left and stop the deadline thread
+  def close (self):
+    with self.cond:
+      self.closed = True
+      self.cond.notify ()
+      batch = self.take () if len (self.batch.items) else None
+    self.flusher.join ()
+    if batch:
+      self.send (batch)
+
+# batching: add all requests to a batcher, which sends them in batches
+def batch_driver (stub, name, iters, vec_len, max_items, max_delay, raw=False, compression=None):
+  print ("Peer client batching {} requests, up to {} per batch or {} secs".format (iters, max_items, max_delay))
+  batcher = Batcher (stub, max_items, max_delay, compression)
+  start_time = time.perf_counter ()
+  for req in generate_requests (name, iters, vec_len, raw):
+    batcher.add (req)
+  batcher.close ()
+  end_time = time.perf_counter ()
+  print ("batching took {} secs, i.e., {:.1f} msgs/sec; {} batches, {} requests acknowledged".format (end_time-start_time, iters/(end_time-start_time), batcher.batches, batcher.acked))
+  print_latencies (batcher.latencies)
+
+##################################
+#        Hedging helpers
+##################################
+
+# Sends every request to one replica (round robin) and, if it has not
+# answered within the hedge delay, to the next replica as well. The first
+# successful response wins and the other call is cancelled. The hedge delay
+# follows the given percentile of the recent call latencies (but is never
+# less than min_delay), so only about (100 - pct)% of the calls get hedged.
+#
+# Since the loser is cancelled, we never learn how long it would have taken.
+# To find out what hedging saves, we leave the slow call running instead for
+# a sample of the calls the hedge won and compare the two.
+class Hedger ():
+  """ Client side hedging of unary calls across replicas """
+
+  def __init__ (self, stubs, pct, min_delay, sample=0.1, compression=None, history=1000, update_every=100):
+    self.stubs = stubs
+    self.pct = pct
+    self.min_delay = min_delay
+    self.sample = sample
+    self.compression = compression
+    self.update_every = update_every  # recompute the delay every so many calls
+    self.delay = min_delay  # until we have seen some latencies
+    self.recent = collections.deque (maxlen=history)
+    self.next = 0          # replica for the next call
+    self.calls = 0
+    self.hedged = 0        # calls for which we sent a hedge
+    self.hedge_won = 0     # ... and the hedge answered first
+    self.latencies = []    # of every call
+    self.saved = []        # on the sampled calls the hedge won
+    self.shadowed = []     # the slow calls we let run for the sample
+
+  # make the call and return the response of whichever replica answers first
+  def call (self, req):
+    primary = self.next
+    self.next = (self.next + 1) % len (self.stubs)
+
+    # the futures put themselves in here as they complete
+    done = queue.Queue ()
+    start_time = time.perf_counter ()
+    calls = [self.stubs[primary].method.future (req, compression=self.compression)]
+    calls[0].add_done_callback (done.put)
+
+    try:
+      winner = done.get (timeout=self.delay)
+    except queue.Empty:
+      # too slow, so hedge with the next replica (if there is one)
+      winner = None
+      if len (self.stubs) > 1:
+        self.hedged += 1
+        calls.append (self.stubs[(primary + 1) % len (self.stubs)].method.future (req, compression=self.compression))
+        calls[1].add_done_callback (done.put)
+      winner = done.get ()
+
+    # a failed call only loses if the other one may still succeed
+    if winner.exception () is not None and len (calls) > 1:
+      winner = done.get ()
+    latency = time.perf_counter () - start_time
+
+    # cancel the loser, unless we sample what it would have taken
+    for call in calls:
+      if call is winner:
+        continue
+      if call is calls[0] and random.random () < self.sample:
+        call.add_done_callback (lambda f, t=start_time+latency: self.shadow_done (f, t))
+        self.shadowed.append (call)
+      else:
+        call.cancel ()
+    if winner is not calls[0]:
+      self.hedge_won += 1
+
+    self.record (latency)
+    return winner.result ()
+
+  # the slow call of a sampled hedge is done; it would have taken this long
+  # beyond the hedge
+  def shadow_done (self, future, won_at):
+    if future.exception () is None:
+      self.saved.append (time.perf_counter () - won_at)
+
+  # keep track of the latencies and move the hedge delay along with them
+  def record (self, latency):
+    self.calls += 1
+    self.latencies.append (latency)
+    self.recent.append (latency)
+    if self.calls % self.update_every == 0:
+      self.delay = max (self.min_delay, percentile (sorted (self.recent), self.pct))
+
+  # print what hedging did for us
+  def report (self):
+    # wait for the slow calls we sampled
+    for call in self.shadowed:
+      try:
+        call.result ()
+      except:
+        pass
+    print ("hedged {} of {} calls ({:.1f}%), the hedge answered first {} times; current hedge delay {:.3f} msecs".format (
+      self.hedged, self.calls, 100.0*self.hedged/max (1, self.calls), self.hedge_won, self.delay*1e3))
+    if self.saved:
+      mean = sum (self.saved) / len (self.saved)
+      print ("latency saved when the hedge won (msecs, {} sampled): mean {:.3f}, max {:.3f}; about {:.3f} secs in total".format (
+        len (self.saved), mean*1e3, max (self.saved)*1e3, mean*self.hedge_won))
+    print_latencies (self.latencies)
+
+# hedged unary calls, one at a time, across the replicas
+def hedged_driver (stubs, name, iters, vec_len, pct, min_delay, sample, raw=False, compression=None):
+  print ("Peer client sending {} requests to {} replicas, hedging after the p{} latency".format (iters, len (stubs), pct))
+  hedger = Hedger (stubs, pct, min_delay, sample, compression)
+  errors = 0
+  start_time = time.perf_counter ()
+  for req in generate_requests (name, iters, vec_len, raw):
+    try:
+      hedger.call (req)
+    except grpc.RpcError:
+      errors += 1
+  end_time = time.perf_counter ()
+  print ("hedging took {} secs, i.e., {:.1f} msgs/sec, {} failed calls".format (end_time-start_time, iters/(end_time-start_time), errors))
+  hedger.report ()
+
 ##################################
 #        Driver program
 ##################################
 
-def driver (name, iters, vec_len, port):
+def driver (name, iters, vec_len, port, mode="unary", window=1, raw=False, with_stats=True, compression="none", call_compression=None, batch_size=100, batch_delay=0.010,
+            endpoints=None, hedge_pct=95.0, hedge_min_delay=0.001, hedge_sample=0.1, timeout=None, rate=None):
+
+  # the replicas we talk to; only the hedged mode uses more than the first
+  endpoints = endpoints or ["localhost:" + str (port)]
+
+  print ("Driver program: Name = {}, Num Iters = {}, Vector len = {}, Endpoints = {}, Mode = {}, Compression = {}".format (name, iters, vec_len, endpoints, mode, call_compression or compression))
 
-  print ("Driver program: Name = {}, Num Iters = {}, Vector len = {}, Peer port = {}".format (name, iters, vec_len, port))
+  # per-call compression (if any) overrides that of the channel
+  call_compression = COMPRESSION[call_compression] if call_compression else None
+
+  # per-call latency and size stats, printed at the end or on SIGUSR1
+  stats = rpc_stats.RpcStats ("client") if with_stats else None
+  if stats:
+    stats.dump_on_signal ()
 
   # first obtain a peer and initialize it
   print ("Driver program: create handle to the client and then run the code")
   try:
 
-    # Use the insecure channel to establish connection with server
-    print ("Instantiate insecure channel")
-    channel = grpc.insecure_channel ("localhost:" + str (port))
+    # Use an insecure channel to establish connection with each server
+    stubs = []
+    for endpoint in endpoints:
+      print ("Instantiate insecure channel to {}".format (endpoint))
+      channel = grpc.insecure_channel (endpoint, compression=COMPRESSION[compression])
+
+      # every call made on the channel goes through our interceptor
+      if stats:
+        channel = grpc.intercept_channel (channel, rpc_stats.ClientStatsInterceptor (stats))
+
+      print ("Obtain a proxy object to the server")
+      stubs.append (spb_grpc.DummyServiceStub (channel))
+    stub = stubs[0]
 
-    print ("Obtain a proxy object to the server")
-    stub = spb_grpc.DummyServiceStub (channel)
+    # the streaming modes send everything over a single RPC
+    if mode == "stream":
+      stream_driver (stub, name, iters, vec_len, raw, call_compression)
+      return
+    elif mode == "bidi":
+      bidi_driver (stub, name, iters, vec_len, raw, call_compression)
+      return
+    elif mode == "pipelined":
+      pipelined_driver (stub, name, iters, vec_len, window, raw, call_compression, timeout, rate)
+      return
+    elif mode == "batch":
+      batch_driver (stub, name, iters, vec_len, batch_size, batch_delay, raw, call_compression)
+      return
+    elif mode == "hedged":
+      hedged_driver (stubs, name, iters, vec_len, hedge_pct, hedge_min_delay, hedge_sample, raw, call_compression)
+      return
 
     # now send the serialized custom message for the number of desired iterations
     print ("Allocate the Request object that we will then populate in every iteration")
@@ -57,13 +448,15 @@ def driver (name, iters, vec_len, port):
       req.seq_no = i # this will be our sequence number
       req.ts = time.time ()  # current time
       req.name = name # assigned name
-      req.data[:] = [random.randint (1, 1000) for j in range (vec_len)]
+      # the data goes either into the repeated field or, with raw, into the
+      # bytes field as little endian uint32s
+      nc.set_data (req, np.random.randint (1, 1000, size=vec_len, dtype=np.uint32), raw)
       print ("-----Iteration: {} contents of message before sending\n{} ----------".format (i, req))
 
       # now let the client send the message to its server part
       print ("Peer client sending the serialized message")
       start_time = time.time ()
-      resp = stub.method (req)
+      resp = stub.method (req, compression=call_compression)
       end_time = time.time ()
       print ("sending/receiving took {} secs".format (end_time-start_time))
 
@@ -73,6 +466,9 @@ def driver (name, iters, vec_len, port):
 
   except:
     return
+  finally:
+    if stats:
+      stats.dump ()
 
   
 ##################################
@@ -87,6 +483,20 @@ def parseCmdLineArgs ():
     parser.add_argument ("-l", "--veclen", type=int, default=20, help="Length of the vector field (default: 20; contents are irrelevant)")
     parser.add_argument ("-n", "--name", default="ProtoBuf gRPC Demo", help="Name to include in each message")
     parser.add_argument ("-p", "--port", type=int, default=5577, help="Port where the server part of the peer listens and client side connects to (default: 5577)")
+    parser.add_argument ("-e", "--endpoints", nargs="+", default=None, help="One or more host:port of server replicas; only the hedged mode uses more than the first (default: localhost:<port>)")
+    parser.add_argument ("-m", "--mode", choices=["unary", "stream", "bidi", "pipelined", "batch", "hedged"], default="unary", help="One RPC per message, all messages over a client streaming or bidirectional streaming RPC, one RPC per message with several in flight, one RPC per batch of messages, or one RPC per message hedged across replicas (default: unary)")
+    parser.add_argument ("-z", "--compression", choices=list (COMPRESSION), default="none", help="Compression of every request on the channel (default: none)")
+    parser.add_argument ("--call_compression", choices=list (COMPRESSION), default=None, help="Compression of each request, overriding that of the channel")
+    parser.add_argument ("--no_stats", action="store_true", help="Do not record per-call latency and size stats")
+    parser.add_argument ("-r", "--raw", action="store_true", help="Send the vector as raw little endian bytes rather than as a repeated field")
+    parser.add_argument ("-b", "--batch_size", type=int, default=100, help="Maximum number of requests per batch in batch mode (default: 100)")
+    parser.add_argument ("--batch_ms", type=float, default=10.0, help="Maximum msecs a request waits for its batch to fill up in batch mode (default: 10)")
+    parser.add_argument ("--hedge_pct", type=float, default=95.0, help="In hedged mode, hedge a call once it takes longer than this percentile of the recent latencies (default: 95)")
+    parser.add_argument ("--hedge_min_ms", type=float, default=1.0, help="In hedged mode, never hedge before this many msecs (default: 1)")
+    parser.add_argument ("--hedge_sample", type=float, default=0.1, help="In hedged mode, fraction of the calls won by the hedge whose slow call is not cancelled, to measure the latency saved (default: 0.1)")
+    parser.add_argument ("-t", "--timeout_ms", type=float, default=None, help="In pipelined mode, the deadline of every call in msecs (default: none)")
+    parser.add_argument ("--rate", type=float, default=None, help="In pipelined mode, issue this many calls per sec regardless of how fast they complete (default: as fast as the window allows)")
+    parser.add_argument ("-w", "--window", type=int, default=16, help="Maximum number of RPCs in flight in pipelined mode (default: 16)")
     
     # parse the args
     args = parser.parse_args ()
@@ -104,7 +514,9 @@ def main ():
   parsed_args = parseCmdLineArgs ()
     
   # start the driver code
-  driver (parsed_args.name, parsed_args.iters, parsed_args.veclen, parsed_args.port)
+  driver (parsed_args.name, parsed_args.iters, parsed_args.veclen, parsed_args.port, parsed_args.mode, parsed_args.window, parsed_args.raw, not parsed_args.no_stats, parsed_args.compression, parsed_args.call_compression, parsed_args.batch_size, parsed_args.batch_ms/1000.0,
+          parsed_args.endpoints, parsed_args.hedge_pct, parsed_args.hedge_min_ms/1000.0, parsed_args.hedge_sample,
+          parsed_args.timeout_ms/1000.0 if parsed_args.timeout_ms else None, parsed_args.rate)
 
 #----------------------------------------------
 if __name__ == '__main__':
@@ -11,6 +11,42 @@
 #  which can don both roles.  When writing code for distributed client and
 #  server, just separate the two pieces.
 #
+#  The server can run in one of two modes:
+#    threaded: the classic gRPC server, which hands every RPC to a thread from
+#              a pool. At most as many RPCs as there are worker threads are
+#              served at a time and thread switching dominates at high rates.
+#    async:    the grpc.aio server, where every RPC is a coroutine on a single
+#              asyncio event loop, so thousands of RPCs can be in flight at once
+#              from one process.
+#  In both modes the number of concurrent RPCs can be capped, beyond which
+#  gRPC rejects new RPCs with RESOURCE_EXHAUSTED. In threaded mode the server
+#  also sheds RPCs that waited too long for a thread or whose client deadline
+#  has passed (see admission.py), so that under overload it keeps answering
+#  in time whatever it can.
+#
+#  Besides the unary method, the service has a client streaming and a
+#  bidirectional streaming method, plus a batch method taking many requests
+#  in one unary call; all of them are served in either mode and the client
+#  picks which one to use.
+#
+#  Either way, one Python process is limited by the GIL to about one core. In
+#  pre-fork mode (more than one process), we start that many worker processes,
+#  each running its own server bound to the same port with SO_REUSEPORT so
+#  that the kernel spreads incoming connections across them. The workers keep
+#  their request counts in shared memory and the parent periodically reports
+#  the aggregate. Ctrl-C (or SIGTERM) on the parent shuts everything down.
+#
+#  Unless turned off, interceptors record per-method queueing, handler and
+#  total latencies and the request and response bytes (see rpc_stats.py).
+#  Their summaries are printed on shutdown or on SIGUSR1.
+#
+#  Responses can be compressed (gzip or deflate). Compressed requests are
+#  accepted regardless; that is up to the client.
+#
+#  To play with tail latency (e.g., hedged requests on the client), the unary
+#  method can be made to stall every now and then, as if this replica were
+#  occasionally slow, e.g., due to garbage collection or a noisy neighbor.
+#
 
 # Note that this code mimics what we did with FlatBufs+ZeroMQ but this time
 # we mix Protocol Buffers and gRPC
@@ -19,6 +55,10 @@
 import os
 import sys
 import time  # needed for timing measurements and sleep
+import asyncio  # needed for the async server mode
+import signal  # needed for clean shutdown
+import threading  # needed to protect the request count
+import multiprocessing  # needed for the pre-fork mode
 
 import random  # random number generator
 import argparse  # argument parser
@@ -31,19 +71,90 @@ import grpc   # for gRPC
 import schema_pb2 as spb
 import schema_pb2_grpc as spb_grpc
 
+# our numpy conversion helpers for the request data
+import numpy_conv as nc
+
+# our latency and size interceptors
+import rpc_stats
+
+# our admission control interceptor
+import admission
+
+# gRPC core queues incoming RPCs until the application asks for them and, by
+# default, starts cancelling them once about a thousand are queued. That
+# defeats the purpose of serving thousands of concurrent RPCs, so we raise
+# the limit well beyond that. Our own cap on concurrent RPCs (if any) is
+# enforced separately via maximum_concurrent_rpcs.
+MAX_PENDING_RPCS = 100000
+SERVER_OPTIONS = [("grpc.server.max_pending_requests", MAX_PENDING_RPCS),
+                  ("grpc.server.max_pending_requests_hard_limit", MAX_PENDING_RPCS)]
+
+# the compression algorithms we can choose from
+COMPRESSION = {"none": grpc.Compression.NoCompression,
+               "deflate": grpc.Compression.Deflate,
+               "gzip": grpc.Compression.Gzip}
+
 ##################################
 #  The Service implementation class
 ##################################
 class ServiceHandler (spb_grpc.DummyServiceServicer):
-  
+
+  def __init__ (self, verbose=True, ack_every=100, counts=None, slot=0, delay_prob=0.0, delay=0.0):
+    self.verbose = verbose  # printing every request is costly at high rates
+    self.ack_every = ack_every  # acknowledge every so many streamed requests
+    # with this probability, a unary request stalls for delay secs
+    self.delay_prob = delay_prob
+    self.delay = delay
+    # number of requests handled so far, kept in counts[slot] so that in
+    # pre-fork mode the parent can read it out of shared memory
+    self.counts = counts if counts is not None else [0]
+    self.slot = slot
+    self.lock = threading.Lock ()
+
+  # count the request(s) we have handled
+  def count_request (self, n=1):
+    with self.lock:
+      self.counts[self.slot] += n
+
+  # account for a streamed request in the cumulative acknowledgement
+  def record (self, ack, request):
+    if self.verbose:
+      print ("Received streamed request - seq no: {}, timestamp: {}, name: {}, data: {}".format (request.seq_no, request.ts, request.name, nc.get_data (request)))
+    self.count_request ()
+    ack.count += 1
+    ack.last_seq_no = request.seq_no
+    ack.num_bytes += request.ByteSize ()
+
+  # how long this request should stall, if at all
+  def stall (self):
+    if self.delay_prob and random.random () < self.delay_prob:
+      return self.delay
+    return 0.0
+
+  # a snapshot of the cumulative acknowledgement to send out while we keep
+  # updating the original
+  def snapshot (self, ack):
+    reply = spb.Ack ()
+    reply.CopyFrom (ack)
+    return reply
+
   # Implement the method message that gets called on us via an upcall
   # Note, we have to use the same name for the method because it must be an
   # overridden method
   def method (self, request, context):
     """ Handle request message """
     try:
-      # here, let us just print what we got.
-      print ("Received request - seq no: {}, timestamp: {}, name: {}, data: {}".format (request.seq_no, request.ts, request.name, request.data))
+      # here, let us just print what we got. The data comes as a numpy
+      # array, whichever field the client used, and is only decoded when
+      # we print it.
+      if self.verbose:
+        print ("Received request - seq no: {}, timestamp: {}, name: {}, data: {}".format (request.seq_no, request.ts, request.name, nc.get_data (request)))
+      self.count_request ()
+
+      # simulate an occasionally slow replica
+      delay = self.stall ()
+      if delay:
+        time.sleep (delay)
 
       # Now send response
       resp = spb.Response ()  # allocate the response object. Note it is empty
@@ -52,26 +163,206 @@ class ServiceHandler (spb_grpc.DummyServiceServicer):
       print ("Some exception occurred handling method {}".format (sys.exc_info()[0]))
       raise
 
+  # Client streaming: we get an iterator over the requests of the stream and
+  # return a single acknowledgement for all of them once the stream ends.
+  def stream_method (self, request_iterator, context):
+    """ Handle a stream of request messages """
+    try:
+      ack = spb.Ack ()
+      for request in request_iterator:
+        self.record (ack, request)
+
+      print ("Stream ended - {} requests, {} bytes, last seq no: {}".format (ack.count, ack.num_bytes, ack.last_seq_no))
+      return ack
+    except:
+      print ("Some exception occurred handling stream_method {}".format (sys.exc_info()[0]))
+      raise
+
+  # Bidirectional streaming: as requests come in, we send back a cumulative
+  # acknowledgement every so many of them, plus a final one for the rest
+  # when the stream ends. Being a generator, every ack we yield is sent right
+  # away while we continue reading requests.
+  def bidi_method (self, request_iterator, context):
+    """ Handle a stream of request messages with periodic acks """
+    try:
+      ack = spb.Ack ()
+      for request in request_iterator:
+        self.record (ack, request)
+        if ack.count % self.ack_every == 0:
+          yield self.snapshot (ack)
+
+      if ack.count % self.ack_every:
+        yield ack
+      print ("Stream ended - {} requests, {} bytes, last seq no: {}".format (ack.count, ack.num_bytes, ack.last_seq_no))
+    except:
+      print ("Some exception occurred handling bidi_method {}".format (sys.exc_info()[0]))
+      raise
+
+  # Batching: a single unary call carrying many requests. We go over the
+  # items in place, i.e., every item refers to its part of the batch we
+  # received rather than being copied out of it, and keep the bookkeeping
+  # per batch rather than per item.
+  def batch_method (self, request, context):
+    """ Handle a batch of request messages """
+    try:
+      # the data is only decoded for printing, so nothing is created per
+      # item otherwise
+      if self.verbose:
+        for item in request.items:
+          print ("Received batched request - seq no: {}, timestamp: {}, name: {}, data: {}".format (item.seq_no, item.ts, item.name, nc.get_data (item)))
+
+      count = len (request.items)
+      self.count_request (count)
+      return spb.Ack (count=count, last_seq_no=request.items[-1].seq_no if count else 0, num_bytes=request.ByteSize ())
+    except:
+      print ("Some exception occurred handling batch_method {}".format (sys.exc_info()[0]))
+      raise
+
+##################################
+#  The async Service implementation class
+##################################
+class AsyncServiceHandler (ServiceHandler):
+
+  # Same as above, except that the upcall is a coroutine run by the event loop
+  # of the grpc.aio server rather than by a thread from the pool. If the
+  # handler needs to wait for something (say, a database), it must await it
+  # so that the loop can serve other RPCs in the meantime.
+  async def method (self, request, context):
+    """ Handle request message """
+    try:
+      # here, let us just print what we got. The data comes as a numpy
+      # array, whichever field the client used, and is only decoded when
+      # we print it.
+      if self.verbose:
+        print ("Received request - seq no: {}, timestamp: {}, name: {}, data: {}".format (request.seq_no, request.ts, request.name, nc.get_data (request)))
+      self.count_request ()
+
+      # simulate an occasionally slow replica, without blocking the loop
+      delay = self.stall ()
+      if delay:
+        await asyncio.sleep (delay)
+
+      # Now send response
+      resp = spb.Response ()  # allocate the response object. Note it is empty
+      return resp   # note that this is what is supposed to be returned
+    except:
+      print ("Some exception occurred handling method {}".format (sys.exc_info()[0]))
+      raise
+
+  # Same as above, except that the stream of requests is an async iterator
+  async def stream_method (self, request_iterator, context):
+    """ Handle a stream of request messages """
+    try:
+      ack = spb.Ack ()
+      async for request in request_iterator:
+        self.record (ack, request)
+
+      print ("Stream ended - {} requests, {} bytes, last seq no: {}".format (ack.count, ack.num_bytes, ack.last_seq_no))
+      return ack
+    except:
+      print ("Some exception occurred handling stream_method {}".format (sys.exc_info()[0]))
+      raise
+
+  # Same as above, except as an async generator
+  async def bidi_method (self, request_iterator, context):
+    """ Handle a stream of request messages with periodic acks """
+    try:
+      ack = spb.Ack ()
+      async for request in request_iterator:
+        self.record (ack, request)
+        if ack.count % self.ack_every == 0:
+          yield self.snapshot (ack)
+
+      if ack.count % self.ack_every:
+        yield ack
+      print ("Stream ended - {} requests, {} bytes, last seq no: {}".format (ack.count, ack.num_bytes, ack.last_seq_no))
+    except:
+      print ("Some exception occurred handling bidi_method {}".format (sys.exc_info()[0]))
+      raise
+
+  # Same as above, except as a coroutine
+  async def batch_method (self, request, context):
+    """ Handle a batch of request messages """
+    try:
+      # the data is only decoded for printing, so nothing is created per
+      # item otherwise
+      if self.verbose:
+        for item in request.items:
+          print ("Received batched request - seq no: {}, timestamp: {}, name: {}, data: {}".format (item.seq_no, item.ts, item.name, nc.get_data (item)))
+
+      count = len (request.items)
+      self.count_request (count)
+      return spb.Ack (count=count, last_seq_no=request.items[-1].seq_no if count else 0, num_bytes=request.ByteSize ())
+    except:
+      print ("Some exception occurred handling batch_method {}".format (sys.exc_info()[0]))
+      raise
+
 ##################################
 #        Driver program
 ##################################
 
-def driver (port):
+# print whichever of the given stats we keep
+def dump_stats (*all_stats):
+  for stats in all_stats:
+    if stats:
+      stats.dump ()
+
+def driver (port, mode="threaded", max_workers=10, max_rpcs=None, verbose=True, ack_every=100, procs=1, with_stats=True, compression="none", delay_prob=0.0, delay=0.0, queue_target=None):
+
+  print ("Driver program: Port = {}, Mode = {}, Max workers = {}, Max concurrent RPCs = {}, Queue delay target = {}, Processes = {}, Compression = {}, Slow requests = {} x {} secs".format (port, mode, max_workers, max_rpcs, queue_target, procs, compression, delay_prob, delay))
+
+  # in pre-fork mode the parent only supervises the worker processes
+  if procs > 1:
+    prefork_driver (port, mode, max_workers, max_rpcs, verbose, ack_every, procs, with_stats, compression, delay_prob, delay, queue_target)
+    return
+
+  # per-RPC latency and size stats plus (in threaded mode) the counts of
+  # accepted and shed RPCs, printed on the way out or on SIGUSR1
+  stats = rpc_stats.RpcStats ("server") if with_stats else None
+  admitted = admission.AdmissionStats ("server") if mode == "threaded" else None
+  signal.signal (signal.SIGUSR1, lambda signum, frame: dump_stats (stats, admitted))
+
+  serve (port, mode, max_workers, max_rpcs, verbose, ack_every, stats=stats, compression=compression, delay_prob=delay_prob, delay=delay, admitted=admitted, queue_target=queue_target)
+
+  dump_stats (stats, admitted)
 
-  print ("Driver program: Port = {}".format (port))
+# run a server in the given mode until it is terminated. In pre-fork mode,
+# this is what every worker process runs, with its own slot in the shared
+# request counts and the port shared via SO_REUSEPORT.
+def serve (port, mode, max_workers, max_rpcs, verbose, ack_every, counts=None, slot=0, reuseport=False, stats=None, compression="none", delay_prob=0.0, delay=0.0, admitted=None, queue_target=None):
+
+  options = SERVER_OPTIONS + ([("grpc.so_reuseport", 1)] if reuseport else [])
+  compression = COMPRESSION[compression]  # applies to all our responses
+
+  # the async server runs on an event loop of its own
+  if mode == "async":
+    try:
+      asyncio.run (async_driver (port, max_rpcs, verbose, ack_every, counts, slot, options, stats, compression, delay_prob, delay))
+    except KeyboardInterrupt:
+      pass
+    except:
+      print ("Some exception occurred {}".format (sys.exc_info()[0]))
+    return
 
   # run the program
   print ("Driver program: create and run the server")
 
   try:
   
-    # Create a server handle
+    # Create a server handle. The number of worker threads bounds how many
+    # RPCs are served at a time; maximum_concurrent_rpcs bounds how many may
+    # be in progress (including those waiting for a thread). The interceptors
+    # see every RPC as it arrives; the stats come first so that they also
+    # cover the RPCs that admission control sheds.
     print ("Create a server handle")
-    server = grpc.server (futures.ThreadPoolExecutor (max_workers=10))
+    interceptors = [rpc_stats.ServerStatsInterceptor (stats)] if stats else []
+    if admitted:
+      interceptors.append (admission.AdmissionInterceptor (admitted, queue_target))
+    server = grpc.server (futures.ThreadPoolExecutor (max_workers=max_workers), options=options, maximum_concurrent_rpcs=max_rpcs, interceptors=interceptors, compression=compression)
 
     # Now create our message handler object
     print ("Instantiate our service handler")
-    handler = ServiceHandler ()
+    handler = ServiceHandler (verbose, ack_every, counts, slot, delay_prob, delay)
 
     # Make the binding between the stub and the handler
     print ("Make the connection between our handler class and server")
@@ -83,12 +374,111 @@ def driver (port):
     print ("Start the server")
     server.start()
 
+    # on SIGTERM, let in-progress RPCs finish (for up to a second) and
+    # return from waiting below
+    signal.signal (signal.SIGTERM, lambda signum, frame: server.stop (1))
+
     print("Server started, listening on {}".format (port))
     server.wait_for_termination()
 
   except:
     print ("Some exception occurred {}".format (sys.exc_info()[0]))
     return
+
+# the async counterpart of the above, run on the asyncio event loop
+async def async_driver (port, max_rpcs, verbose, ack_every, counts=None, slot=0, options=SERVER_OPTIONS, stats=None, compression=None, delay_prob=0.0, delay=0.0):
+
+  print ("Driver program: create and run the async server")
+
+  # Create an async server handle. There is no thread pool; every RPC is a
+  # coroutine and maximum_concurrent_rpcs (if given) caps how many of them
+  # may be in progress at once.
+  print ("Create an async server handle")
+  interceptors = [rpc_stats.AsyncServerStatsInterceptor (stats)] if stats else None
+  server = grpc.aio.server (options=options, maximum_concurrent_rpcs=max_rpcs, interceptors=interceptors, compression=compression)
+
+  # Now create our message handler object
+  print ("Instantiate our async service handler")
+  handler = AsyncServiceHandler (verbose, ack_every, counts, slot, delay_prob, delay)
+
+  # Make the binding between the stub and the handler. The same generated
+  # function works for the async server.
+  print ("Make the connection between our handler class and server")
+  spb_grpc.add_DummyServiceServicer_to_server (handler, server)
+
+  print ("Add port to our server")
+  server.add_insecure_port ("[::]:" + str (port))
+
+  print ("Start the server")
+  await server.start ()
+
+  # on SIGTERM, stop the server, which ends the wait below
+  asyncio.get_running_loop ().add_signal_handler (signal.SIGTERM, lambda: asyncio.ensure_future (server.stop (1)))
+
+  print ("Async server started, listening on {}".format (port))
+  try:
+    await server.wait_for_termination ()
+  finally:
+    # let in-progress RPCs finish (for up to a second) on the way out
+    await server.stop (1)
+
+# the entry point of each worker process in pre-fork mode. Ctrl-C reaches
+# the whole process group, so the workers ignore it and leave it to the
+# parent to stop them with SIGTERM.
+def prefork_worker (slot, counts, port, mode, max_workers, max_rpcs, verbose, ack_every, with_stats, compression, delay_prob, delay, queue_target):
+  signal.signal (signal.SIGINT, signal.SIG_IGN)
+
+  # every worker keeps stats of its own
+  stats = rpc_stats.RpcStats ("server worker {}".format (slot)) if with_stats else None
+  admitted = admission.AdmissionStats ("server worker {}".format (slot)) if mode == "threaded" else None
+  signal.signal (signal.SIGUSR1, lambda signum, frame: dump_stats (stats, admitted))
+
+  serve (port, mode, max_workers, max_rpcs, verbose, ack_every, counts, slot, reuseport=True, stats=stats, compression=compression, delay_prob=delay_prob, delay=delay, admitted=admitted, queue_target=queue_target)
+
+  dump_stats (stats, admitted)
+
+# Pre-fork mode: start the worker processes and report their aggregate
+# request counts until we are told to stop. Note that the workers must be
+# forked before this process creates any gRPC objects of its own.
+def prefork_driver (port, mode, max_workers, max_rpcs, verbose, ack_every, procs, with_stats=True, compression="none", delay_prob=0.0, delay=0.0, queue_target=None, report_interval=5.0):
+
+  # one request count per worker, in shared memory. Each worker only ever
+  # writes its own slot, so no lock is needed across processes.
+  counts = multiprocessing.RawArray ("Q", procs)
+
+  print ("Start {} worker processes".format (procs))
+  workers = []
+  for slot in range (procs):
+    worker = multiprocessing.Process (target=prefork_worker, args=(slot, counts, port, mode, max_workers, max_rpcs, verbose, ack_every, with_stats, compression, delay_prob, delay, queue_target))
+    worker.start ()
+    workers.append (worker)
+
+  # treat SIGTERM like Ctrl-C so that both shut down cleanly
+  signal.signal (signal.SIGTERM, signal.default_int_handler)
+
+  # pass SIGUSR1 on to the workers so that they dump their stats
+  signal.signal (signal.SIGUSR1, lambda signum, frame: [os.kill (worker.pid, signum) for worker in workers if worker.is_alive ()])
+
+  try:
+    last_total = 0
+    last_time = time.time ()
+    while any (worker.is_alive () for worker in workers):
+      time.sleep (report_interval)
+      total = sum (counts)
+      now = time.time ()
+      if total != last_total:
+        print ("Requests handled: {} in total ({:.1f}/sec), per worker {}".format (total, (total-last_total)/(now-last_time), list (counts)))
+      last_total, last_time = total, now
+  except KeyboardInterrupt:
+    pass
+  finally:
+    print ("Stop the worker processes")
+    for worker in workers:
+      if worker.is_alive ():
+        worker.terminate ()  # i.e., SIGTERM
+    for worker in workers:
+      worker.join ()
+    print ("Requests handled: {} in total, per worker {}".format (sum (counts), list (counts)))
   
   
 ##################################
@@ -100,6 +490,17 @@ def parseCmdLineArgs ():
 
     # add optional arguments
     parser.add_argument ("-p", "--port", type=int, default=5577, help="Port where the server part of the peer listens and client side connects to (default: 5577)")
+    parser.add_argument ("-m", "--mode", choices=["threaded", "async"], default="threaded", help="Serve RPCs from a thread pool or from an asyncio event loop (default: threaded)")
+    parser.add_argument ("-w", "--workers", type=int, default=10, help="Number of worker threads in threaded mode (default: 10)")
+    parser.add_argument ("-c", "--max_rpcs", type=int, default=None, help="Maximum number of concurrent RPCs, beyond which new ones are rejected (default: no limit)")
+    parser.add_argument ("--queue_ms", type=float, default=None, help="In threaded mode, reject RPCs that waited longer than this many msecs for a thread with RESOURCE_EXHAUSTED (default: never)")
+    parser.add_argument ("-a", "--ack_every", type=int, default=100, help="On a bidirectional stream, acknowledge every so many requests (default: 100)")
+    parser.add_argument ("-n", "--procs", type=int, default=1, help="Number of server processes sharing the port; more than one enables pre-fork mode (default: 1)")
+    parser.add_argument ("-z", "--compression", choices=list (COMPRESSION), default="none", help="Compression of our responses (default: none)")
+    parser.add_argument ("--no_stats", action="store_true", help="Do not record per-RPC latency and size stats")
+    parser.add_argument ("--slow_prob", type=float, default=0.0, help="Probability that a unary request stalls, to simulate a slow replica (default: 0)")
+    parser.add_argument ("--slow_ms", type=float, default=50.0, help="How many msecs a stalled request takes (default: 50)")
+    parser.add_argument ("-q", "--quiet", action="store_true", help="Do not print every request received, e.g., when benchmarking")
     
     # parse the args
     args = parser.parse_args ()
@@ -117,7 +518,8 @@ def main ():
   parsed_args = parseCmdLineArgs ()
     
   # start the driver code
-  driver (parsed_args.port)
+  driver (parsed_args.port, parsed_args.mode, parsed_args.workers, parsed_args.max_rpcs, not parsed_args.quiet, parsed_args.ack_every, parsed_args.procs, not parsed_args.no_stats, parsed_args.compression, parsed_args.slow_prob, parsed_args.slow_ms/1000.0,
+          parsed_args.queue_ms/1000.0 if parsed_args.queue_ms else None)
 
 #----------------------------------------------
 if __name__ == '__main__':
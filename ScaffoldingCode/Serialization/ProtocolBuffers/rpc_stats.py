@@ -0,0 +1,338 @@
+#  Author: Aniruddha Gokhale
+#  Created: Fall 2023
+#
+#  Purpose: gRPC client and server interceptors that record where the time
+#  goes for each RPC, and how many bytes go over the wire.
+#
+#  On the server, the interceptor sees every RPC as soon as it arrives, i.e.,
+#  before it waits for a thread from the pool. From that we record, per method,
+#     queue:   arrival until our handler starts (waiting for a thread, plus
+#              parsing the request)
+#     handler: time spent in our handler
+#     total:   arrival until the handler is done
+#  On the client we record the total latency of each call as the client sees
+#  it. Both sides count the serialized request and response bytes.
+#
+#  Latencies go into HDR-style histograms: buckets are exact for small values
+#  and grow with the value so that every bucket is within about 1% of the
+#  values in it. Recording is a few integer operations, so the interceptors
+#  are cheap enough to leave on all the time. The summaries are printed when
+#  the process shuts down or when it receives SIGUSR1, e.g.,
+#
+#       kill -USR1 <pid of the server>
+
+import sys
+import time  # needed for timing measurements
+import signal  # needed to dump on demand
+import threading  # needed to protect the histograms
+
+import grpc   # for gRPC
+
+##################################
+#  HDR-style latency histogram
+##################################
+class Histogram ():
+  """ Log-linear histogram of integer values (microseconds for us) """
+
+  # values below 2^SUB_BITS get a bucket each; above that every power of
+  # two range is split into 2^(SUB_BITS-1) buckets, i.e., about 1% precision
+  SUB_BITS = 7
+  SUB_COUNT = 1 << SUB_BITS
+  HALF_COUNT = SUB_COUNT >> 1
+  MAX_BITS = 40  # about 12 days in microseconds; larger values are clamped
+
+  def __init__ (self):
+    self.counts = [0] * (self.SUB_COUNT + (self.MAX_BITS - self.SUB_BITS) * self.HALF_COUNT)
+    self.total = 0
+    self.sum = 0
+    self.max = 0
+    self.lock = threading.Lock ()
+
+  # the bucket a value goes into
+  def index (self, value):
+    if value < self.SUB_COUNT:
+      return value
+    if value >> self.MAX_BITS:
+      return len (self.counts) - 1
+    # the top SUB_BITS bits of the value pick the bucket within its range
+    shift = value.bit_length () - self.SUB_BITS
+    return self.SUB_COUNT + (shift - 1) * self.HALF_COUNT + (value >> shift) - self.HALF_COUNT
+
+  # the range of values in a bucket
+  def bucket_range (self, i):
+    if i < self.SUB_COUNT:
+      return i, i + 1
+    shift = (i - self.SUB_COUNT) // self.HALF_COUNT + 1
+    low = (self.HALF_COUNT + (i - self.SUB_COUNT) % self.HALF_COUNT) << shift
+    return low, low + (1 << shift)
+
+  def record (self, value):
+    value = max (0, int (value))
+    with self.lock:
+      self.counts[self.index (value)] += 1
+      self.total += 1
+      self.sum += value
+      if value > self.max:
+        self.max = value
+
+  # the value below which the given percentage (0-100) of values lie. This
+  # is the middle of the bucket, so it is within about 1% of the real one.
+  def percentile (self, p):
+    if not self.total:
+      return 0
+    target = max (1, int (self.total * p / 100.0 + 0.5))
+    seen = 0
+    for i, count in enumerate (self.counts):
+      seen += count
+      if seen >= target:
+        low, high = self.bucket_range (i)
+        return min (self.max, (low + high - 1) // 2)
+    return self.max
+
+  def summary (self):
+    if not self.total:
+      return "no samples"
+    return "n {}, mean {:.1f}, p50 {}, p90 {}, p99 {}, p99.9 {}, max {}".format (
+      self.total, self.sum / self.total, self.percentile (50), self.percentile (90),
+      self.percentile (99), self.percentile (99.9), self.max)
+
+##################################
+#  Statistics of all methods
+##################################
+class MethodStats ():
+  """ Latency histograms and byte counts of one RPC method """
+
+  def __init__ (self):
+    self.queue = Histogram ()
+    self.handler = Histogram ()
+    self.total = Histogram ()
+    self.req_bytes = 0
+    self.resp_bytes = 0
+    self.lock = threading.Lock ()
+
+  # account for serialized bytes going either way
+  def add_bytes (self, req_bytes=0, resp_bytes=0):
+    with self.lock:
+      self.req_bytes += req_bytes
+      self.resp_bytes += resp_bytes
+
+class RpcStats ():
+  """ Statistics of every RPC method we have seen """
+
+  def __init__ (self, name):
+    self.name = name  # say, client or server
+    self.methods = {}
+    self.lock = threading.Lock ()
+
+  # the stats of the given method, created the first time around
+  def method (self, method_name):
+    stats = self.methods.get (method_name)
+    if stats is None:
+      with self.lock:
+        stats = self.methods.setdefault (method_name, MethodStats ())
+    return stats
+
+  # Print the summaries. This may run in a signal handler while a histogram
+  # is being updated, so it reads them without taking their locks (a summary
+  # may then be off by a sample, which is fine).
+  def dump (self, file=sys.stdout):
+    print ("------ {} RPC stats (latencies in usecs) ------".format (self.name), file=file)
+    for method_name, stats in list (self.methods.items ()):
+      print ("{}: request bytes {}, response bytes {}".format (method_name, stats.req_bytes, stats.resp_bytes), file=file)
+      for kind in ("queue", "handler", "total"):
+        histogram = getattr (stats, kind)
+        if histogram.total:
+          print ("  {:>8}: {}".format (kind, histogram.summary ()), file=file)
+    file.flush ()
+
+  # dump the stats whenever we get SIGUSR1. Must be called from the main thread.
+  def dump_on_signal (self, signum=signal.SIGUSR1):
+    signal.signal (signum, lambda signum, frame: self.dump ())
+
+# elapsed microseconds since the given perf_counter reading
+def usecs_since (start):
+  return (time.perf_counter () - start) * 1e6
+
+##################################
+#  Server interceptors
+##################################
+
+# wrap the (de)serializers of a method handler to count bytes
+def count_bytes (handler, stats):
+  deserialize = handler.request_deserializer
+  serialize = handler.response_serializer
+
+  def request_deserializer (buf):
+    stats.add_bytes (req_bytes=len (buf))
+    return deserialize (buf) if deserialize else buf
+
+  def response_serializer (msg):
+    buf = serialize (msg) if serialize else msg
+    stats.add_bytes (resp_bytes=len (buf))
+    return buf
+
+  return handler._replace (request_deserializer=request_deserializer, response_serializer=response_serializer)
+
+# wrap a synchronous method handler so that its behavior records the timings
+def timed_handler (handler, stats, arrival):
+
+  # record when the handler is done
+  def done (start):
+    stats.handler.record (usecs_since (start))
+    stats.total.record (usecs_since (arrival))
+
+  if handler.unary_unary or handler.stream_unary:
+    behavior = handler.unary_unary or handler.stream_unary
+
+    def timed (request, context):
+      start = time.perf_counter ()
+      stats.queue.record ((start - arrival) * 1e6)
+      try:
+        return behavior (request, context)
+      finally:
+        done (start)
+
+    field = "unary_unary" if handler.unary_unary else "stream_unary"
+  else:
+    behavior = handler.unary_stream or handler.stream_stream
+
+    # a streaming response is done once the generator is exhausted
+    def timed (request, context):
+      start = time.perf_counter ()
+      stats.queue.record ((start - arrival) * 1e6)
+      try:
+        yield from behavior (request, context)
+      finally:
+        done (start)
+
+    field = "unary_stream" if handler.unary_stream else "stream_stream"
+
+  return count_bytes (handler, stats)._replace (**{field: timed})
+
+class ServerStatsInterceptor (grpc.ServerInterceptor):
+  """ Records per-method latencies and sizes on a threaded server """
+
+  def __init__ (self, stats):
+    self.stats = stats
+
+  # this is invoked as soon as an RPC arrives, before it is handed to a thread
+  def intercept_service (self, continuation, handler_call_details):
+    arrival = time.perf_counter ()
+    handler = continuation (handler_call_details)
+    if handler is None:
+      return None
+    return timed_handler (handler, self.stats.method (handler_call_details.method), arrival)
+
+# wrap an async method handler so that its behavior records the timings
+def async_timed_handler (handler, stats, arrival):
+
+  def done (start):
+    stats.handler.record (usecs_since (start))
+    stats.total.record (usecs_since (arrival))
+
+  if handler.unary_unary or handler.stream_unary:
+    behavior = handler.unary_unary or handler.stream_unary
+
+    async def timed (request, context):
+      start = time.perf_counter ()
+      stats.queue.record ((start - arrival) * 1e6)
+      try:
+        return await behavior (request, context)
+      finally:
+        done (start)
+
+    field = "unary_unary" if handler.unary_unary else "stream_unary"
+  else:
+    behavior = handler.unary_stream or handler.stream_stream
+
+    async def timed (request, context):
+      start = time.perf_counter ()
+      stats.queue.record ((start - arrival) * 1e6)
+      try:
+        async for response in behavior (request, context):
+          yield response
+      finally:
+        done (start)
+
+    field = "unary_stream" if handler.unary_stream else "stream_stream"
+
+  return count_bytes (handler, stats)._replace (**{field: timed})
+
+class AsyncServerStatsInterceptor (grpc.aio.ServerInterceptor):
+  """ Records per-method latencies and sizes on an async server """
+
+  def __init__ (self, stats):
+    self.stats = stats
+
+  async def intercept_service (self, continuation, handler_call_details):
+    arrival = time.perf_counter ()
+    handler = await continuation (handler_call_details)
+    if handler is None:
+      return None
+    return async_timed_handler (handler, self.stats.method (handler_call_details.method), arrival)
+
+##################################
+#  Client interceptor
+##################################
+
+# count the requests of a client stream as they are pulled by gRPC
+def counted_requests (request_iterator, stats):
+  for request in request_iterator:
+    stats.add_bytes (req_bytes=request.ByteSize ())
+    yield request
+
+class CountedResponses ():
+  """ Counts the responses of a server stream while passing on the call """
+
+  def __init__ (self, call, stats):
+    self.call = call
+    self.stats = stats
+
+  def __iter__ (self):
+    return self
+
+  def __next__ (self):
+    response = next (self.call)
+    self.stats.add_bytes (resp_bytes=response.ByteSize ())
+    return response
+
+  # everything else (cancel, code, add_done_callback etc.) goes to the call
+  def __getattr__ (self, attr):
+    return getattr (self.call, attr)
+
+class ClientStatsInterceptor (grpc.UnaryUnaryClientInterceptor,
+                              grpc.StreamUnaryClientInterceptor,
+                              grpc.StreamStreamClientInterceptor):
+  """ Records per-method latencies and sizes on a client channel """
+
+  def __init__ (self, stats):
+    self.stats = stats
+
+  # Record the latency once the call is done, whether it was made blocking
+  # or as a future. The client does not get to see the serialized bytes, so
+  # we count the size the messages serialize to.
+  def on_done (self, call, stats, start):
+    def done (call):
+      stats.total.record (usecs_since (start))
+      if call.code () == grpc.StatusCode.OK:
+        stats.add_bytes (resp_bytes=call.result ().ByteSize ())
+    call.add_done_callback (done)
+    return call
+
+  def intercept_unary_unary (self, continuation, client_call_details, request):
+    stats = self.stats.method (client_call_details.method)
+    stats.add_bytes (req_bytes=request.ByteSize ())
+    start = time.perf_counter ()
+    return self.on_done (continuation (client_call_details, request), stats, start)
+
+  def intercept_stream_unary (self, continuation, client_call_details, request_iterator):
+    stats = self.stats.method (client_call_details.method)
+    start = time.perf_counter ()
+    return self.on_done (continuation (client_call_details, counted_requests (request_iterator, stats)), stats, start)
+
+  def intercept_stream_stream (self, continuation, client_call_details, request_iterator):
+    stats = self.stats.method (client_call_details.method)
+    start = time.perf_counter ()
+    call = continuation (client_call_details, counted_requests (request_iterator, stats))
+    call.add_done_callback (lambda call: stats.total.record (usecs_since (start)))
+    return CountedResponses (call, stats)
@@ -13,7 +13,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0cschema.proto\"A\n\x07Request\x12\x0e\n\x06seq_no\x18\x01 \x01(\r\x12\n\n\x02ts\x18\x02 \x01(\x01\x12\x0c\n\x04name\x18\x03 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x04 \x03(\r\"\n\n\x08Response2/\n\x0c\x44ummyService\x12\x1f\n\x06method\x12\x08.Request\x1a\t.Response\"\x00\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0cschema.proto\"S\n\x07Request\x12\x0e\n\x06seq_no\x18\x01 \x01(\r\x12\n\n\x02ts\x18\x02 \x01(\x01\x12\x0c\n\x04name\x18\x03 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x04 \x03(\r\x12\x10\n\x08\x64\x61ta_raw\x18\x05 \x01(\x0c\"\n\n\x08Response\"\'\n\x0c\x42\x61tchRequest\x12\x17\n\x05items\x18\x01 \x03(\x0b\x32\x08.Request\"<\n\x03\x41\x63k\x12\r\n\x05\x63ount\x18\x01 \x01(\r\x12\x13\n\x0blast_seq_no\x18\x02 \x01(\r\x12\x11\n\tnum_bytes\x18\x03 \x01(\x04\x32\xa0\x01\n\x0c\x44ummyService\x12\x1f\n\x06method\x12\x08.Request\x1a\t.Response\"\x00\x12#\n\rstream_method\x12\x08.Request\x1a\x04.Ack\"\x00(\x01\x12#\n\x0b\x62idi_method\x12\x08.Request\x1a\x04.Ack\"\x00(\x01\x30\x01\x12%\n\x0c\x62\x61tch_method\x12\r.BatchRequest\x1a\x04.Ack\"\x00\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -22,9 +22,13 @@ if _descriptor._USE_C_DESCRIPTORS == False:
 
   DESCRIPTOR._options = None
   _globals['_REQUEST']._serialized_start=16
-  _globals['_REQUEST']._serialized_end=81
-  _globals['_RESPONSE']._serialized_start=83
-  _globals['_RESPONSE']._serialized_end=93
-  _globals['_DUMMYSERVICE']._serialized_start=95
-  _globals['_DUMMYSERVICE']._serialized_end=142
+  _globals['_REQUEST']._serialized_end=99
+  _globals['_RESPONSE']._serialized_start=101
+  _globals['_RESPONSE']._serialized_end=111
+  _globals['_BATCHREQUEST']._serialized_start=113
+  _globals['_BATCHREQUEST']._serialized_end=152
+  _globals['_ACK']._serialized_start=154
+  _globals['_ACK']._serialized_end=214
+  _globals['_DUMMYSERVICE']._serialized_start=217
+  _globals['_DUMMYSERVICE']._serialized_end=377
 # @@protoc_insertion_point(module_scope)
@@ -1,22 +1,40 @@
 from google.protobuf.internal import containers as _containers
 from google.protobuf import descriptor as _descriptor
 from google.protobuf import message as _message
-from typing import ClassVar as _ClassVar, Iterable as _Iterable, Optional as _Optional
+from typing import ClassVar as _ClassVar, Iterable as _Iterable, Mapping as _Mapping, Optional as _Optional, Union as _Union
 
 DESCRIPTOR: _descriptor.FileDescriptor
 
 class Request(_message.Message):
-    __slots__ = ["seq_no", "ts", "name", "data"]
+    __slots__ = ["seq_no", "ts", "name", "data", "data_raw"]
     SEQ_NO_FIELD_NUMBER: _ClassVar[int]
     TS_FIELD_NUMBER: _ClassVar[int]
     NAME_FIELD_NUMBER: _ClassVar[int]
     DATA_FIELD_NUMBER: _ClassVar[int]
+    DATA_RAW_FIELD_NUMBER: _ClassVar[int]
     seq_no: int
     ts: float
     name: str
     data: _containers.RepeatedScalarFieldContainer[int]
-    def __init__(self, seq_no: _Optional[int] = ..., ts: _Optional[float] = ..., name: _Optional[str] = ..., data: _Optional[_Iterable[int]] = ...) -> None: ...
+    data_raw: bytes
+    def __init__(self, seq_no: _Optional[int] = ..., ts: _Optional[float] = ..., name: _Optional[str] = ..., data: _Optional[_Iterable[int]] = ..., data_raw: _Optional[bytes] = ...) -> None: ...
 
 class Response(_message.Message):
     __slots__ = []
     def __init__(self) -> None: ...
+
+class BatchRequest(_message.Message):
+    __slots__ = ["items"]
+    ITEMS_FIELD_NUMBER: _ClassVar[int]
+    items: _containers.RepeatedCompositeFieldContainer[Request]
+    def __init__(self, items: _Optional[_Iterable[_Union[Request, _Mapping]]] = ...) -> None: ...
+
+class Ack(_message.Message):
+    __slots__ = ["count", "last_seq_no", "num_bytes"]
+    COUNT_FIELD_NUMBER: _ClassVar[int]
+    LAST_SEQ_NO_FIELD_NUMBER: _ClassVar[int]
+    NUM_BYTES_FIELD_NUMBER: _ClassVar[int]
+    count: int
+    last_seq_no: int
+    num_bytes: int
+    def __init__(self, count: _Optional[int] = ..., last_seq_no: _Optional[int] = ..., num_bytes: _Optional[int] = ...) -> None: ...
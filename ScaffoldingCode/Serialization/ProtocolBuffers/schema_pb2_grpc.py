@@ -29,6 +29,21 @@ class DummyServiceStub(object):
                 request_serializer=schema__pb2.Request.SerializeToString,
                 response_deserializer=schema__pb2.Response.FromString,
                 )
+        self.stream_method = channel.stream_unary(
+                '/DummyService/stream_method',
+                request_serializer=schema__pb2.Request.SerializeToString,
+                response_deserializer=schema__pb2.Ack.FromString,
+                )
+        self.bidi_method = channel.stream_stream(
+                '/DummyService/bidi_method',
+                request_serializer=schema__pb2.Request.SerializeToString,
+                response_deserializer=schema__pb2.Ack.FromString,
+                )
+        self.batch_method = channel.unary_unary(
+                '/DummyService/batch_method',
+                request_serializer=schema__pb2.BatchRequest.SerializeToString,
+                response_deserializer=schema__pb2.Ack.FromString,
+                )
 
 
 class DummyServiceServicer(object):
@@ -50,6 +65,30 @@ class DummyServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def stream_method(self, request_iterator, context):
+        """client streaming: the client sends a whole stream of requests and the
+        server acknowledges all of them once the stream ends
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def bidi_method(self, request_iterator, context):
+        """bidirectional streaming: the client sends a stream of requests and the
+        server sends back periodic cumulative acknowledgements as they arrive
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def batch_method(self, request, context):
+        """batching: a single unary call carrying many requests, all of which
+        the server acknowledges at once
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_DummyServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -58,6 +97,21 @@ def add_DummyServiceServicer_to_server(servicer, server):
                     request_deserializer=schema__pb2.Request.FromString,
                     response_serializer=schema__pb2.Response.SerializeToString,
             ),
+            'stream_method': grpc.stream_unary_rpc_method_handler(
+                    servicer.stream_method,
+                    request_deserializer=schema__pb2.Request.FromString,
+                    response_serializer=schema__pb2.Ack.SerializeToString,
+            ),
+            'bidi_method': grpc.stream_stream_rpc_method_handler(
+                    servicer.bidi_method,
+                    request_deserializer=schema__pb2.Request.FromString,
+                    response_serializer=schema__pb2.Ack.SerializeToString,
+            ),
+            'batch_method': grpc.unary_unary_rpc_method_handler(
+                    servicer.batch_method,
+                    request_deserializer=schema__pb2.BatchRequest.FromString,
+                    response_serializer=schema__pb2.Ack.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'DummyService', rpc_method_handlers)
@@ -94,3 +148,54 @@ class DummyService(object):
             schema__pb2.Response.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def stream_method(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(request_iterator, target, '/DummyService/stream_method',
+            schema__pb2.Request.SerializeToString,
+            schema__pb2.Ack.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def bidi_method(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(request_iterator, target, '/DummyService/bidi_method',
+            schema__pb2.Request.SerializeToString,
+            schema__pb2.Ack.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def batch_method(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/DummyService/batch_method',
+            schema__pb2.BatchRequest.SerializeToString,
+            schema__pb2.Ack.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
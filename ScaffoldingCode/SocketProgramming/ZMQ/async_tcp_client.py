@@ -0,0 +1,151 @@
+# Sample code for CS4283-5283
+# Vanderbilt University
+# Instructor: Aniruddha Gokhale
+# Created: Fall 2023
+#
+# The asyncio version of tcp_client.py. Instead of one REQ socket we run many
+# sessions (-s), each a coroutine with a REQ socket of its own that sends its
+# requests one at a time, all on a single event loop in a single thread. The
+# sockets come from a zmq.asyncio context, whose send and recv are coroutines
+# that we "await"; while one session waits for its reply the others run. Talk
+# to async_tcp_server.py (or tcp_server.py in router mode), e.g.,
+#
+#      python3 async_tcp_server.py -w 0.05 --metrics_port 8000
+#      python3 async_tcp_client.py -s 500 -i 20 --metrics_port 8001
+#
+# At the end we report the throughput and the latency percentiles. With
+# --metrics_port the same event loop also serves our counters over HTTP.
+#
+# Note: my default indentation is now set to 2 (in other snippets, it
+# used to be 4)
+
+# import the needed packages
+import sys    # for system exception
+import time   # for timing
+import asyncio # for the event loop
+import argparse # for argument parsing
+import zmq    # this package must be imported for ZMQ to work
+import zmq.asyncio # for ZMQ sockets on asyncio
+
+## the following is our file
+from metrics import serve_metrics, percentile  # metrics endpoint and percentiles
+
+##################################
+# A client session
+##################################
+
+# one session: a REQ socket sending its requests one at a time
+async def session (context, connect_string, args, metrics, latencies):
+  try:
+    socket = context.socket (zmq.REQ)
+    socket.setsockopt (zmq.LINGER, 0)
+    socket.connect (connect_string)
+  except zmq.ZMQError as err:
+    print ("ZeroMQ Error connecting REQ socket: {}".format (err))
+    return
+  except:
+    print ("Some exception occurred connecting REQ socket {}".format (sys.exc_info()[0]))
+    return
+
+  metrics["sessions_active"] += 1
+  try:
+    for i in range (args.iters):
+      start_time = time.perf_counter ()
+      await socket.send (b"HelloWorld")
+      # a REQ socket cannot send again before it got its reply, so if the
+      # reply does not come, this session is done
+      await asyncio.wait_for (socket.recv (), args.timeout)
+      latencies.append (time.perf_counter () - start_time)
+      metrics["replies_total"] += 1
+
+      if args.interval_ms:
+        await asyncio.sleep (args.interval_ms / 1000.0)
+  except asyncio.TimeoutError:
+    print ("No reply within {} secs, session giving up".format (args.timeout))
+    metrics["sessions_timed_out"] += 1
+  except zmq.ZMQError as err:
+    print ("ZeroMQ Error sending/receiving: {}".format (err))
+  except:
+    print ("Some exception occurred receiving/sending {}".format (sys.exc_info()[0]))
+  metrics["sessions_active"] -= 1
+  socket.close ()
+
+##################################
+# Driver program
+##################################
+async def driver (args):
+  metrics = {"sessions_active": 0, "sessions_timed_out": 0, "replies_total": 0}
+
+  try:
+    # every ZMQ session requires a context, and all our sessions share this one
+    print ("Obtain the ZMQ asyncio context")
+    context = zmq.asyncio.Context ()
+  except zmq.ZMQError as err:
+    print ("ZeroMQ Error: {}".format (err))
+    return
+  except:
+    print ("Some exception occurred getting context {}".format (sys.exc_info()[0]))
+    return
+
+  server = await serve_metrics (metrics, args.metrics_port, args.metrics_intf) if args.metrics_port else None
+
+  connect_string = "tcp://" + args.addr + ":" + str (args.port)
+  print ("{} sessions connecting to {}, sending {} Hello messages each".format (args.sessions, connect_string, args.iters))
+
+  latencies = []
+  start_time = time.perf_counter ()
+  await asyncio.gather (*[session (context, connect_string, args, metrics, latencies) for k in range (args.sessions)])
+  end_time = time.perf_counter ()
+
+  latencies.sort ()
+  print ("{} replies in {:.3f} secs, i.e., {:.1f} msgs/sec".format (len (latencies), end_time-start_time, len (latencies)/(end_time-start_time)))
+  print ("latency (msecs): min {:.3f}, p50 {:.3f}, p90 {:.3f}, p99 {:.3f}, p99.9 {:.3f}, max {:.3f}".format (
+    latencies[0]*1e3 if latencies else 0.0,
+    percentile (latencies, 50)*1e3, percentile (latencies, 90)*1e3,
+    percentile (latencies, 99)*1e3, percentile (latencies, 99.9)*1e3,
+    latencies[-1]*1e3 if latencies else 0.0))
+
+  if server:
+    server.close ()
+  context.term ()
+
+##################################
+# Command line parsing
+##################################
+def parseCmdLineArgs ():
+  # parse the command line
+  parser = argparse.ArgumentParser ()
+
+  # add optional arguments
+  parser.add_argument ("-a", "--addr", default="127.0.0.1", help="IP Address to connect to (default: localhost i.e., 127.0.0.1)")
+  parser.add_argument ("-i", "--iters", type=int, default=10, help="Number of iterations per session (default: 10)")
+  parser.add_argument ("-p", "--port", type=int, default=5555, help="Port that server is listening on (default: 5555)")
+  parser.add_argument ("-s", "--sessions", type=int, default=100, help="Number of concurrent sessions, each with its own REQ socket (default: 100)")
+  parser.add_argument ("--interval_ms", type=float, default=0, help="Msecs each session sleeps between its requests (default: 0)")
+  parser.add_argument ("-t", "--timeout", type=float, default=10.0, help="A session gives up if no reply comes for this many secs (default: 10)")
+  parser.add_argument ("--metrics_port", type=int, default=None, help="Serve metrics over HTTP on this port")
+  parser.add_argument ("--metrics_intf", default="127.0.0.1", help="Interface to serve metrics on (default: 127.0.0.1, i.e., local clients only)")
+  args = parser.parse_args ()
+
+  return args
+
+#------------------------------------------
+# main function
+def main ():
+  """ Main program """
+
+  print("Demo program for asyncio TCP Client with ZeroMQ")
+
+  # first parse the command line args
+  parsed_args = parseCmdLineArgs ()
+
+  # start the driver code on an event loop
+  asyncio.run (driver (parsed_args))
+
+#----------------------------------------------
+if __name__ == '__main__':
+  # here we just print the version numbers
+  print("Current libzmq version is %s" % zmq.zmq_version())
+  print("Current pyzmq version is %s" % zmq.pyzmq_version())
+
+  main ()
@@ -0,0 +1,171 @@
+# Sample code for CS4283-5283
+# Vanderbilt University
+# Instructor: Aniruddha Gokhale
+# Created: Fall 2023
+#
+# The asyncio version of the ROUTER server in tcp_server.py. The sockets come
+# from a zmq.asyncio context, whose send and recv are coroutines that we
+# "await". While a coroutine waits, the event loop runs the others, so a single
+# thread can have thousands of requests in progress without a thread per
+# request or a heap of due replies as in tcp_server.py's router mode.
+#
+# Every request becomes a task of its own that does its 'work' (a random sleep
+# averaging -w secs) and then sends the reply. The replies echo all the frames
+# before the payload, i.e., the client identity that ROUTER adds and whatever
+# the client put in front of its payload, so both REQ clients (an empty
+# delimiter frame) and DEALER clients (a request ID frame) can talk to us.
+#
+# With --metrics_port the same event loop also serves our counters over HTTP
+# in the plain text format of Prometheus, e.g.,
+#
+#      curl localhost:8000/metrics
+#
+# Note: my default indentation is now set to 2 (in other snippets, it
+# used to be 4)
+
+# import the needed packages
+import sys    # for system exception
+import random # for the random work times
+import asyncio # for the event loop
+import argparse # for argument parsing
+import zmq    # this package must be imported for ZMQ to work
+import zmq.asyncio # for ZMQ sockets on asyncio
+
+## the following is our file
+from metrics import serve_metrics  # metrics endpoint
+
+##################################
+# Request handling
+##################################
+
+# do the work for one request and reply to it
+async def serve_request (socket, frames, args, metrics):
+  metrics["requests_in_progress"] += 1
+  try:
+    await asyncio.sleep (random.uniform (0, 2*args.work))
+    await socket.send_multipart (frames[:-1] + [b"World"])
+    metrics["replies_total"] += 1
+  except zmq.ZMQError as err:
+    print ("ZeroMQ Error sending: {}".format (err))
+  except asyncio.CancelledError:
+    raise  # Ctrl-C, which is not an error
+  except:
+    print ("Some exception occurred sending {}".format (sys.exc_info()[0]))
+  metrics["requests_in_progress"] -= 1
+
+# receive requests and start a task for every one of them
+async def router_loop (socket, args, metrics):
+  clients = set ()
+  tasks = set ()  # the event loop only keeps weak references to tasks
+  print ("server waiting for requests")
+  while True:
+    try:
+      frames = await socket.recv_multipart ()
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error receiving: {}".format (err))
+      return
+    except asyncio.CancelledError:
+      raise  # Ctrl-C, which is not an error
+    except:
+      print ("Some exception occurred receiving {}".format (sys.exc_info()[0]))
+      return
+
+    metrics["requests_total"] += 1
+    clients.add (frames[0])
+    metrics["clients_seen"] = len (clients)
+    task = asyncio.create_task (serve_request (socket, frames, args, metrics))
+    tasks.add (task)
+    task.add_done_callback (tasks.discard)
+
+##################################
+# Driver program
+##################################
+async def driver (args):
+  metrics = {"requests_total": 0, "replies_total": 0, "requests_in_progress": 0, "clients_seen": 0}
+
+  try:
+    # every ZMQ session requires a context. The asyncio one hands us sockets
+    # whose send and recv we await.
+    print ("Obtain the ZMQ asyncio context")
+    context = zmq.asyncio.Context ()
+  except zmq.ZMQError as err:
+    print ("ZeroMQ Error obtaining context: {}".format (err))
+    return
+  except:
+    print ("Some exception occurred getting context {}".format (sys.exc_info()[0]))
+    return
+
+  try:
+    # ROUTER lets us receive the next request before we reply to the last one
+    print ("Obtain the ROUTER type socket")
+    socket = context.socket (zmq.ROUTER)
+  except zmq.ZMQError as err:
+    print ("ZeroMQ Error obtaining ROUTER socket: {}".format (err))
+    return
+  except:
+    print ("Some exception occurred getting ROUTER socket {}".format (sys.exc_info()[0]))
+    return
+
+  try:
+    bind_string = "tcp://" + args.intf + ":" + str (args.port)
+    print ("TCP server will be binding on {}".format (bind_string))
+    socket.bind (bind_string)
+  except zmq.ZMQError as err:
+    print ("ZeroMQ Error binding ROUTER socket: {}".format (err))
+    socket.close ()
+    return
+  except:
+    print ("Some exception occurred binding ROUTER socket {}".format (sys.exc_info()[0]))
+    socket.close ()
+    return
+
+  server = await serve_metrics (metrics, args.metrics_port, args.metrics_intf) if args.metrics_port else None
+  try:
+    await router_loop (socket, args, metrics)
+  finally:
+    # we also get here on Ctrl-C, when asyncio cancels us
+    print ("served {requests_total} requests from {clients_seen} clients, replied to {replies_total}".format (**metrics))
+    if server:
+      server.close ()
+    socket.close ()
+
+##################################
+# Command line parsing
+##################################
+def parseCmdLineArgs ():
+  # parse the command line
+  parser = argparse.ArgumentParser ()
+
+  # add optional arguments
+  parser.add_argument ("-i", "--intf", default="*", help="Interface to bind to (default: *)")
+  parser.add_argument ("-p", "--port", type=int, default=5555, help="Port to bind to (default: 5555)")
+  parser.add_argument ("-w", "--work", type=float, default=1.0, help="Mean secs of 'work' per request, which takes a random time (default: 1)")
+  parser.add_argument ("--metrics_port", type=int, default=None, help="Serve metrics over HTTP on this port")
+  parser.add_argument ("--metrics_intf", default="127.0.0.1", help="Interface to serve metrics on (default: 127.0.0.1, i.e., local clients only)")
+  args = parser.parse_args ()
+
+  return args
+
+#------------------------------------------
+# main function
+def main ():
+  """ Main program """
+
+  print("Demo program for asyncio TCP Server with ZeroMQ")
+
+  # first parse the command line args
+  parsed_args = parseCmdLineArgs ()
+
+  # start the driver code on an event loop, until Ctrl-C
+  try:
+    asyncio.run (driver (parsed_args))
+  except KeyboardInterrupt:
+    pass
+
+#----------------------------------------------
+if __name__ == '__main__':
+  # here we just print the version numbers
+  print("Current libzmq version is %s" % zmq.zmq_version())
+  print("Current pyzmq version is %s" % zmq.pyzmq_version())
+
+  main ()
@@ -0,0 +1,38 @@
+# Sample code for CS4283-5283
+# Vanderbilt University
+# Instructor: Aniruddha Gokhale
+# Created: Fall 2023
+#
+# Helpers shared by async_tcp_server.py and async_tcp_client.py: the HTTP
+# endpoint serving their counters and the percentiles of their latencies.
+#
+# The counters are a dict of name to value, served in the plain text format
+# of Prometheus, i.e., one "name value" per line, e.g.,
+#
+#      curl localhost:8000/metrics
+#
+# Note: my default indentation is now set to 2 (in other snippets, it
+# used to be 4)
+
+# import the needed packages
+import asyncio # for the event loop
+
+# Serve the metrics over HTTP on the given interface and port, from the
+# running event loop. It is a minimal HTTP/1.0 server that answers every
+# request with the same page. By default only local clients can reach it.
+async def serve_metrics (metrics, port, intf="127.0.0.1"):
+  async def handle (reader, writer):
+    await reader.readuntil (b"\r\n\r\n")  # we answer whatever is asked
+    body = "".join ("{} {}\n".format (name, value) for name, value in metrics.items ())
+    writer.write ("HTTP/1.0 200 OK\r\nContent-Type: text/plain\r\nContent-Length: {}\r\n\r\n{}".format (len (body), body).encode ())
+    await writer.drain ()
+    writer.close ()
+
+  print ("Serving metrics on http://{}:{}/metrics".format (intf, port))
+  return await asyncio.start_server (handle, intf, port)
+
+# the given percentile (0-100) of an already sorted list of values
+def percentile (values, p):
+  if not values:
+    return 0.0
+  return values[min (len (values)-1, int (len (values) * p / 100.0))]
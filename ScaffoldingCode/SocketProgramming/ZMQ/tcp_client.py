@@ -13,15 +13,127 @@
 # want to try, just replace REQ by CLIENT here (and correspondingly, in
 # the tcp_server.py, replace REP by SERVER)
 #
+# REQ-REP allows exactly one outstanding request per socket, so every
+# request costs a full round trip plus the server's work. With "-m dealer" we
+# use a DEALER socket instead, which talks to a ROUTER server (see
+# tcp_server.py) and lets us keep a window of requests in flight. Each
+# request carries a request ID in a header frame, which the server echoes in
+# its reply, so we can match replies arriving out of order to their requests.
+# At the end we report the throughput and the latency percentiles.
+#
 # Note: my default indentation is now set to 2 (in other snippets, it
 # used to be 4)
 
 # import the needed packages
 import sys    # for system exception
 import time   # for sleep
+import struct # for the request ID header
 import argparse # for argument parsing
 import zmq    # this package must be imported for ZMQ to work
 
+# the request ID header frame is a 64-bit unsigned int in network order
+REQ_ID = struct.Struct ("!Q")
+
+##################################
+# REQ-REP client loop
+##################################
+def reqrep_loop (socket, args):
+  # since we are a client, we actively send something to the server
+  print ("client sending Hello messages for specified num of iterations")
+  for i in range (args.iters):
+    try:
+      #  Wait for next request from client
+      print ("Send a HelloWorld")
+      socket.send (b"HelloWorld")
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error sending: {}".format (err))
+      socket.close ()
+      return
+    except:
+      print ("Some exception occurred receiving/sending {}".format (sys.exc_info()[0]))
+      socket.close ()
+      return
+
+    try:
+      # receive a reply
+      print ("Waiting to receive")
+      message = socket.recv ()
+      print ("Received reply in iteration {} is {}".format (i, message))
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error receiving: {}".format (err))
+      socket.close ()
+      return
+    except:
+      print ("Some exception occurred receiving/sending {}".format (sys.exc_info()[0]))
+      socket.close ()
+      return
+
+##################################
+# DEALER client loop
+##################################
+
+# the given percentile (0-100) of an already sorted list of values
+def percentile (values, p):
+  if not values:
+    return 0.0
+  return values[min (len (values)-1, int (len (values) * p / 100.0))]
+
+def dealer_loop (socket, args):
+  # Keep up to a window of requests in flight: send until the window is
+  # full, then take whichever reply comes next, which frees up a slot. We
+  # only print a summary at the end since printing every message would cost
+  # more than sending it.
+  in_flight = {}  # request ID -> time sent
+  latencies = []
+  out_of_order = 0  # replies that overtook an older request
+  next_id = 0
+
+  print ("client sending {} Hello messages with a window of {}".format (args.iters, args.window))
+  start_time = time.perf_counter ()
+  while next_id < args.iters or in_flight:
+    try:
+      # fill up the window
+      while next_id < args.iters and len (in_flight) < args.window:
+        in_flight[next_id] = time.perf_counter ()
+        socket.send_multipart ([REQ_ID.pack (next_id), b"HelloWorld"])
+        next_id += 1
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error sending: {}".format (err))
+      socket.close ()
+      return
+    except:
+      print ("Some exception occurred receiving/sending {}".format (sys.exc_info()[0]))
+      socket.close ()
+      return
+
+    try:
+      # receive the next reply, i.e., the request ID and the reply itself
+      if not socket.poll (args.timeout * 1000):
+        print ("No reply within {} secs, giving up with {} requests in flight".format (args.timeout, len (in_flight)))
+        break
+      header, message = socket.recv_multipart ()
+      req_id = REQ_ID.unpack (header)[0]
+      if req_id != min (in_flight):
+        out_of_order += 1
+      latencies.append (time.perf_counter () - in_flight.pop (req_id))
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error receiving: {}".format (err))
+      socket.close ()
+      return
+    except:
+      print ("Some exception occurred receiving/sending {}".format (sys.exc_info()[0]))
+      socket.close ()
+      return
+  end_time = time.perf_counter ()
+
+  latencies.sort ()
+  print ("{} replies in {:.3f} secs, i.e., {:.1f} msgs/sec; {} replies out of order".format (len (latencies), end_time-start_time, len (latencies)/(end_time-start_time), out_of_order))
+  print ("latency (msecs): min {:.3f}, p50 {:.3f}, p90 {:.3f}, p99 {:.3f}, p99.9 {:.3f}, max {:.3f}".format (
+    latencies[0]*1e3 if latencies else 0.0,
+    percentile (latencies, 50)*1e3, percentile (latencies, 90)*1e3,
+    percentile (latencies, 99)*1e3, percentile (latencies, 99.9)*1e3,
+    latencies[-1]*1e3 if latencies else 0.0))
+
 ##################################
 # Driver program
 ##################################
@@ -40,9 +152,9 @@ def driver (args):
   try:
     # The socket concept in ZMQ is far more advanced than the traditional socket in
     # networking. Each socket we obtain from the context object must be of a certain
-    # type. For TCP, we will use the REQ socket type (many other pairs are supported)
-    # and this is to be used on the client side.
-    socket = context.socket (zmq.REQ)
+    # type. For TCP, we will use the REQ socket type (many other pairs are supported,
+    # e.g., DEALER, which we use in dealer mode) and this is to be used on the client side.
+    socket = context.socket (zmq.DEALER if args.mode == "dealer" else zmq.REQ)
   except zmq.ZMQError as err:
     print ("ZeroMQ Error obtaining context: {}".format (err))
     return
@@ -65,35 +177,11 @@ def driver (args):
     socket.close ()
     return
 
-  # since we are a client, we actively send something to the server
-  print ("client sending Hello messages for specified num of iterations")
-  for i in range (args.iters):
-    try:
-      #  Wait for next request from client
-      print ("Send a HelloWorld")
-      socket.send (b"HelloWorld")
-    except zmq.ZMQError as err:
-      print ("ZeroMQ Error sending: {}".format (err))
-      socket.close ()
-      return
-    except:
-      print ("Some exception occurred receiving/sending {}".format (sys.exc_info()[0]))
-      socket.close ()
-      return
-
-    try:
-      # receive a reply
-      print ("Waiting to receive")
-      message = socket.recv ()
-      print ("Received reply in iteration {} is {}".format (i, message))
-    except zmq.ZMQError as err:
-      print ("ZeroMQ Error receiving: {}".format (err))
-      socket.close ()
-      return
-    except:
-      print ("Some exception occurred receiving/sending {}".format (sys.exc_info()[0]))
-      socket.close ()
-      return
+  # now talk to the server in the chosen mode
+  if args.mode == "dealer":
+    dealer_loop (socket, args)
+  else:
+    reqrep_loop (socket, args)
 
 ##################################
 # Command line parsing
@@ -106,6 +194,9 @@ def parseCmdLineArgs ():
   parser.add_argument ("-a", "--addr", default="127.0.0.1", help="IP Address to connect to (default: localhost i.e., 127.0.0.1)")
   parser.add_argument ("-i", "--iters", type=int, default=10, help="Number of iterations (default: 10")
   parser.add_argument ("-p", "--port", type=int, default=5555, help="Port that server is listening on (default: 5555)")
+  parser.add_argument ("-m", "--mode", choices=["reqrep", "dealer"], default="reqrep", help="REQ socket with one request at a time, or DEALER socket with a window of requests in flight (default: reqrep)")
+  parser.add_argument ("-w", "--window", type=int, default=16, help="Maximum number of requests in flight in dealer mode (default: 16)")
+  parser.add_argument ("-t", "--timeout", type=float, default=10.0, help="In dealer mode, give up if no reply comes for this many secs (default: 10)")
   args = parser.parse_args ()
 
   return args
@@ -15,15 +15,154 @@
 # We should be able to do this using the RADIO-DISH but
 # it is in draft stage and is not working properly
 #
+# With "-m pull" we use a PULL socket instead, which receives the stream of a
+# PUSH sender (see tcp_sender.py "-m push") without any responses. Every
+# window of -w secs we print the messages/sec and MB/sec received and our lag
+# behind the sender, i.e., how long ago the batches we received were sent.
+# Once the high water marks fill up, the lag is the time a message spends
+# queued, so larger high water marks (--hwm, our receive side) buy little
+# throughput at the cost of lag. When a run of the sender stops we print its
+# totals. Every run has an ID of its own, so runs are told apart even if a new
+# one starts while we are still working through the tail of the last one
+# (each sender has its own queue, and PULL takes turns between them). The lag
+# compares our clock with the sender's, so across machines it is only as good
+# as their clock sync.
+#
 # Note: my default indentation is now set to 2 (in other snippets, it
 # used to be 4)
 
 # import the needed packages
 import sys    # for system exception
 import time   # for sleep
+import struct # for the batch header
 import argparse # for argument parsing
 import zmq    # this package must be imported for ZMQ to work
 
+# the header of every batch in pull mode (see tcp_sender.py): the ID of the
+# run, the sequence number of its first message and the time it was sent
+HEADER = struct.Struct ("!IQd")
+
+##################################
+# REQ-REP loop
+##################################
+def reqrep_loop (socket, args):
+  # since we are a server, we service incoming clients forever
+  print ("Server now waiting to receive something")
+  while True:
+    try:
+      #  Wait for next request from client
+      message = socket.recv()
+      print("Received request: %s" % message)
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error receiving: {}".format (err))
+      socket.close ()
+      return
+    except:
+      print ("Some exception occurred receiving/sending {}".format (sys.exc_info()[0]))
+      socket.close ()
+      return
+
+    try:
+      #  send null response
+      socket.send (b"")
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error sending: {}".format (err))
+      socket.close ()
+      return
+    except:
+      print ("Some exception occurred receiving/sending {}".format (sys.exc_info()[0]))
+      socket.close ()
+      return
+
+##################################
+# PULL loop
+##################################
+
+# the given percentile (0-100) of an already sorted list of values
+def percentile (values, p):
+  if not values:
+    return 0.0
+  return values[min (len (values)-1, int (len (values) * p / 100.0))]
+
+# print the rates and lag over an interval
+def report (label, msgs, nbytes, lags, elapsed):
+  lags.sort ()
+  elapsed = max (elapsed, 1e-9)
+  print ("{}: {} msgs, {:.1f} msgs/sec, {:.1f} MB/sec; lag (msecs) p50 {:.3f}, p99 {:.3f}, max {:.3f}".format (
+    label, msgs, msgs/elapsed, nbytes/1e6/elapsed,
+    percentile (lags, 50)*1e3, percentile (lags, 99)*1e3, lags[-1]*1e3 if lags else 0.0))
+
+# the counts of one run of the sender
+class Run ():
+  def __init__ (self, run_id):
+    self.name = "run {:08x}".format (run_id)
+    self.expected = 0  # sequence number we expect next
+    self.lost = 0  # messages missing from the sequence
+    self.total_msgs = self.total_bytes = 0
+    self.total_lags = []
+    self.msgs = self.nbytes = 0  # over the current window
+    self.lags = []
+    self.start_time = self.window_start = self.last_time = time.perf_counter ()
+
+  # account for a batch of the given number of messages and bytes
+  def add (self, seq, msgs, nbytes, lag):
+    if seq != self.expected:
+      self.lost += seq - self.expected
+    self.expected = seq + msgs
+    self.msgs += msgs
+    self.nbytes += nbytes
+    self.lags.append (lag)
+    self.last_time = time.perf_counter ()
+
+  # close the current window: report it and add it to the totals
+  def close_window (self):
+    report (self.name + " window", self.msgs, self.nbytes, self.lags, time.perf_counter () - self.window_start)
+    self.total_msgs += self.msgs
+    self.total_bytes += self.nbytes
+    self.total_lags += self.lags
+    self.msgs = self.nbytes = 0
+    self.lags = []
+    self.window_start = time.perf_counter ()
+
+  # report the whole run. The totals do not count the time we waited to
+  # see that the run is over.
+  def finish (self):
+    report (self.name + " total", self.total_msgs + self.msgs, self.total_bytes + self.nbytes, self.total_lags + self.lags, self.last_time - self.start_time)
+    print ("{}: {} messages lost".format (self.name, self.lost))
+
+def pull_loop (socket, args):
+  print ("Receiver now waiting for a stream, reporting every {} secs".format (args.window))
+  runs = {}  # the runs in progress, by their ID
+  idle = max (1.0, 2*args.window)  # a run is over once nothing came for this long
+  try:
+    while True:
+      # with no runs in progress, we wait for the next one as long as it takes
+      if socket.poll (idle*1000 if runs else None):
+        # the parts of a multipart message arrive all together. We take them
+        # without copying, since all we need are the header and the sizes.
+        frames = socket.recv_multipart (copy=False)
+        now = time.time ()
+        run_id, seq, sent = HEADER.unpack_from (frames[0].buffer)
+
+        run = runs.get (run_id)
+        if run is None:
+          run = runs[run_id] = Run (run_id)
+          print ("New {} of a sender".format (run.name))
+        run.add (seq, len (frames), sum (len (frame) for frame in frames), now - sent)
+        if run.last_time - run.window_start < args.window:
+          continue
+        run.close_window ()
+
+      # once a window is over (or nothing came at all), finish the runs
+      # that went quiet
+      for run_id in [run_id for run_id, run in runs.items () if time.perf_counter () - run.last_time >= idle]:
+        runs.pop (run_id).finish ()
+  except zmq.ZMQError as err:
+    print ("ZeroMQ Error receiving: {}".format (err))
+  except:
+    print ("Some exception occurred receiving {}".format (sys.exc_info()[0]))
+  socket.close ()
+
 ##################################
 # Driver program
 ##################################
@@ -43,9 +182,12 @@ def driver (args):
     # The socket concept in ZMQ is far more advanced than the traditional socket in
     # networking. Each socket we obtain from the context object must be of a certain
     # type. For TCP, we will use REP for server side (many other pairs are supported
-    # in ZMQ for tcp.
-    print ("Obtain the REP type socket")
-    socket = context.socket (zmq.REP)
+    # in ZMQ for tcp, e.g., PULL, which we use in pull mode.
+    print ("Obtain the {} type socket".format ("PULL" if args.mode == "pull" else "REP"))
+    socket = context.socket (zmq.PULL if args.mode == "pull" else zmq.REP)
+    if args.mode == "pull":
+      # how many messages may be queued for us before the sender's queue fills
+      socket.setsockopt (zmq.RCVHWM, args.hwm)
   except zmq.ZMQError as err:
     print ("ZeroMQ Error obtaining REP socket: {}".format (err))
     return
@@ -69,33 +211,11 @@ def driver (args):
     socket.close ()
     return
 
-  # since we are a server, we service incoming clients forever
-  print ("Server now waiting to receive something")
-  while True:
-    try:
-      #  Wait for next request from client
-      message = socket.recv()
-      print("Received request: %s" % message)
-    except zmq.ZMQError as err:
-      print ("ZeroMQ Error receiving: {}".format (err))
-      socket.close ()
-      return
-    except:
-      print ("Some exception occurred receiving/sending {}".format (sys.exc_info()[0]))
-      socket.close ()
-      return
-
-    try:
-      #  send null response
-      socket.send (b"")
-    except zmq.ZMQError as err:
-      print ("ZeroMQ Error sending: {}".format (err))
-      socket.close ()
-      return
-    except:
-      print ("Some exception occurred receiving/sending {}".format (sys.exc_info()[0]))
-      socket.close ()
-      return
+  # now receive in the chosen mode
+  if args.mode == "pull":
+    pull_loop (socket, args)
+  else:
+    reqrep_loop (socket, args)
 
 ##################################
 # Command line parsing
@@ -107,6 +227,9 @@ def parseCmdLineArgs ():
   # add optional arguments
   parser.add_argument ("-i", "--intf", default="*", help="Interface to bind to (default: *)")
   parser.add_argument ("-p", "--port", type=int, default=5555, help="Port to bind to (default: 5555)")
+  parser.add_argument ("-m", "--mode", choices=["reqrep", "pull"], default="reqrep", help="REP socket sending a null response to every message, or PULL socket receiving a oneway stream (default: reqrep)")
+  parser.add_argument ("-w", "--window", type=float, default=1.0, help="In pull mode, secs per measurement window (default: 1)")
+  parser.add_argument ("--hwm", type=int, default=1000, help="In pull mode, the receive high water mark in (multipart) messages (default: 1000)")
   args = parser.parse_args ()
 
   return args
@@ -15,15 +15,101 @@
 # We should be able to do actual oneway using the RADIO-DISH but
 # it is in draft stage and does not work properly.
 #
+# With "-m push" we use a PUSH socket instead, which talks to a PULL socket
+# (see tcp_receiver.py "-m pull") and is truly oneway: there is no response,
+# so we can keep sending until the socket's send high water mark (--hwm
+# messages queued for the receiver) is reached, at which point send blocks
+# until the receiver catches up. This gives us the raw transport throughput
+# as a baseline before any serialization. We send messages of -s bytes for a
+# timed window of -d secs, optionally -b of them at a time as the parts of a
+# multipart message, which ZMQ sends and delivers as a unit. The first part of
+# every batch starts with a header holding a random ID of this run, the
+# sequence number of its first message and the time it was sent, which the
+# receiver uses to tell runs apart, to check that nothing was lost and to
+# measure its lag behind us.
+#
 # Note: my default indentation is now set to 2 (in other snippets, it
 # used to be 4)
 
 # import the needed packages
 import sys    # for system exception
 import time   # for sleep
+import struct # for the batch header
+import random # for the run ID
 import argparse # for argument parsing
 import zmq    # this package must be imported for ZMQ to work
 
+# the header of every batch in push mode: the ID of the run, the sequence
+# number of its first message and the time it was sent (secs since the epoch)
+HEADER = struct.Struct ("!IQd")
+
+##################################
+# REQ-REP loop
+##################################
+def reqrep_loop (socket, args):
+  # since we are a client, we actively send something to the server
+  print ("client sending Hello messages for specified num of iterations")
+  for i in range (args.iters):
+    try:
+      #  Wait for next request from client
+      print ("Send a HelloWorld")
+      socket.send (b"HelloWorld")
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error sending: {}".format (err))
+      socket.close ()
+      return
+    except:
+      print ("Some exception occurred receiving/sending {}".format (sys.exc_info()[0]))
+      socket.close ()
+      return
+
+    try:
+      #  Here we wait for the null response
+      print ("Expecting a null response")
+      socket.recv ()  # no need to even receive it in any buffer
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error receiving: {}".format (err))
+      socket.close ()
+      return
+    except:
+      print ("Some exception occurred receiving/sending {}".format (sys.exc_info()[0]))
+      socket.close ()
+      return
+
+##################################
+# PUSH loop
+##################################
+def push_loop (socket, args):
+  # The payloads are built once: the first part of a batch is the header
+  # plus padding up to the message size, the other parts are just filler.
+  size = max (args.size, HEADER.size)
+  padding = bytes (size - HEADER.size)
+  rest = [bytes (size)] * (args.batch - 1)
+
+  run_id = random.getrandbits (32)
+  print ("sender pushing {} byte messages in batches of {} for {} secs, run {:08x}".format (size, args.batch, args.duration, run_id))
+  seq = 0
+  start_time = time.perf_counter ()
+  end_time = start_time + args.duration
+  try:
+    while time.perf_counter () < end_time:
+      socket.send_multipart ([HEADER.pack (run_id, seq, time.time ()) + padding] + rest)
+      seq += args.batch
+  except zmq.ZMQError as err:
+    print ("ZeroMQ Error sending: {}".format (err))
+  except:
+    print ("Some exception occurred sending {}".format (sys.exc_info()[0]))
+  elapsed = time.perf_counter () - start_time
+
+  # what we report is the rate at which we handed the messages to ZMQ. Once
+  # the high water mark is reached, that is the rate of the receiver.
+  print ("sent {} messages ({:.1f} MB) in {:.3f} secs, i.e., {:.1f} msgs/sec, {:.1f} MB/sec".format (
+    seq, seq*size/1e6, elapsed, seq/elapsed, seq*size/1e6/elapsed))
+
+  # closing waits until the queued messages are delivered (the default linger)
+  print ("waiting for the queued messages to be delivered")
+  socket.close ()
+
 ##################################
 # Driver program
 ##################################
@@ -42,9 +128,12 @@ def driver (args):
   try:
     # The socket concept in ZMQ is far more advanced than the traditional socket in
     # networking. Each socket we obtain from the context object must be of a certain
-    # type. For TCP, we will use the REQ socket type (many other pairs are supported)
-    # and this is to be used on the client side.
-    socket = context.socket (zmq.REQ)
+    # type. For TCP, we will use the REQ socket type (many other pairs are supported,
+    # e.g., PUSH, which we use in push mode) and this is to be used on the client side.
+    socket = context.socket (zmq.PUSH if args.mode == "push" else zmq.REQ)
+    if args.mode == "push":
+      # how many messages may be queued for the receiver before send blocks
+      socket.setsockopt (zmq.SNDHWM, args.hwm)
   except zmq.ZMQError as err:
     print ("ZeroMQ Error obtaining REQ socket: {}".format (err))
     return
@@ -67,34 +156,11 @@ def driver (args):
     socket.close ()
     return
 
-  # since we are a client, we actively send something to the server
-  print ("client sending Hello messages for specified num of iterations")
-  for i in range (args.iters):
-    try:
-      #  Wait for next request from client
-      print ("Send a HelloWorld")
-      socket.send (b"HelloWorld")
-    except zmq.ZMQError as err:
-      print ("ZeroMQ Error sending: {}".format (err))
-      socket.close ()
-      return
-    except:
-      print ("Some exception occurred receiving/sending {}".format (sys.exc_info()[0]))
-      socket.close ()
-      return
-
-    try:
-      #  Here we wait for the null response
-      print ("Expecting a null response")
-      socket.recv ()  # no need to even receive it in any buffer
-    except zmq.ZMQError as err:
-      print ("ZeroMQ Error receiving: {}".format (err))
-      socket.close ()
-      return
-    except:
-      print ("Some exception occurred receiving/sending {}".format (sys.exc_info()[0]))
-      socket.close ()
-      return
+  # now send in the chosen mode
+  if args.mode == "push":
+    push_loop (socket, args)
+  else:
+    reqrep_loop (socket, args)
 
 ##################################
 # Command line parsing
@@ -107,7 +173,16 @@ def parseCmdLineArgs ():
   parser.add_argument ("-a", "--addr", default="127.0.0.1", help="IP Address to connect to (default: localhost i.e., 127.0.0.1)")
   parser.add_argument ("-i", "--iters", type=int, default=10, help="Number of iterations (default: 10")
   parser.add_argument ("-p", "--port", type=int, default=5555, help="Port that server is listening on (default: 5555)")
+  parser.add_argument ("-m", "--mode", choices=["reqrep", "push"], default="reqrep", help="REQ socket waiting for a null response to every message, or PUSH socket streaming oneway (default: reqrep)")
+  parser.add_argument ("-s", "--size", type=int, default=64, help="In push mode, bytes per message; at least the {} byte header (default: 64)".format (HEADER.size))
+  parser.add_argument ("-b", "--batch", type=int, default=1, help="In push mode, messages sent together as one multipart message (default: 1)")
+  parser.add_argument ("-d", "--duration", type=float, default=10.0, help="In push mode, secs to keep sending for (default: 10)")
+  parser.add_argument ("--hwm", type=int, default=1000, help="In push mode, the send high water mark in (multipart) messages (default: 1000)")
   args = parser.parse_args ()
+  if args.batch < 1:
+    parser.error ("the batch (-b) must be at least 1 message")
+  if args.duration <= 0:
+    parser.error ("the duration (-d) must be positive")
 
   return args
     
@@ -13,15 +13,317 @@
 # want to try, just replace REP by SERVER here (and correspondingly, in
 # the tcp_client.py, replace REQ by CLIENT)
 #
+# With "-m router" the server uses a ROUTER socket instead, which talks to
+# DEALER clients (see tcp_client.py). Unlike REP, a ROUTER socket does not
+# force us to reply to one request before we receive the next, so many
+# requests can be in progress at once and be answered in whatever order they
+# complete. Every request carries the client's identity (added by ROUTER) and
+# a request ID header frame chosen by the client, which we echo back so that
+# the client can match the reply to its request.
+#
+# With "-m broker" the ROUTER socket facing the clients (the frontend) only
+# brokers the requests: it hands each one to the least recently used of a
+# pool of workers (threads or, with --procs, processes) via a second ROUTER
+# socket (the backend), and passes the worker's reply back to the client.
+# A worker announces itself with a READY message and, after that, every reply
+# tells the broker that the worker is free again. Since a Python process is
+# limited by the GIL to about one core, CPU-heavy work (--cpu) needs worker
+# processes to use all the cores. Every worker keeps its own stats, which are
+# printed when we shut down with Ctrl-C.
+#
 # Note: my default indentation is now set to 2 (in other snippets, it
 # used to be 4)
 
 # import the needed packages
 import sys    # for system exception
 import time   # for sleep
+import heapq  # for the replies that are not due yet
+import random # for the random work times
+import signal # for stopping worker processes
+import threading # for worker threads
+import collections # for the queue of free workers
+import multiprocessing # for worker processes
 import argparse # for argument parsing
 import zmq    # this package must be imported for ZMQ to work
 
+# what a worker sends when it is ready for its first request
+READY = b"READY"
+
+##################################
+# REQ-REP server loop
+##################################
+def reqrep_loop (socket, args):
+  # since we are a server, we service incoming clients forever
+  print ("Server now waiting to receive something")
+  while True:
+    try:
+      #  Wait for next request from client
+      message = socket.recv()
+      print("Received request: %s" % message)
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error receiving: {}".format (err))
+      socket.close ()
+      return
+    except:
+      print ("Some exception occurred receiving/sending {}".format (sys.exc_info()[0]))
+      socket.close ()
+      return
+
+
+    #  Do some 'work'. In this case we just sleep.
+    time.sleep (args.work)
+
+    try:
+      #  Send reply back to client
+      print ("Send dummy reply")
+      socket.send (b"ACK")
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error sending: {}".format (err))
+      socket.close ()
+      return
+    except:
+      print ("Some exception occurred receiving/sending {}".format (sys.exc_info()[0]))
+      socket.close ()
+      return
+
+##################################
+# ROUTER server loop
+##################################
+def router_loop (socket, args):
+  # Rather than sleeping, which would hold up every other request, the 'work'
+  # of each request takes a random time between 0 and twice the work time,
+  # after which its reply is due. The replies that are not due yet wait in a
+  # heap ordered by due time, and we wait for new requests only until the next
+  # reply is due. Hence requests are in progress concurrently and their
+  # replies go out of order, as they would from a server whose requests take
+  # different times.
+  pending = []  # heap of (due time, arrival count, reply frames)
+  served = 0
+  poller = zmq.Poller ()
+  poller.register (socket, zmq.POLLIN)
+
+  print ("Server now waiting to receive something")
+  while True:
+    try:
+      # wait for requests until the next reply is due (or forever if none is)
+      timeout = None
+      if pending:
+        timeout = max (0, (pending[0][0] - time.perf_counter ()) * 1000)
+      if poller.poll (timeout):
+        # take every request that has arrived. Each one is the identity of
+        # the client, the request ID and the request itself.
+        while True:
+          try:
+            identity, req_id, message = socket.recv_multipart (zmq.NOBLOCK)
+          except zmq.Again:
+            break
+          due = time.perf_counter () + random.uniform (0, 2 * args.work)
+          heapq.heappush (pending, (due, served + len (pending), [identity, req_id, b"ACK"]))
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error receiving: {}".format (err))
+      socket.close ()
+      return
+    except:
+      print ("Some exception occurred receiving/sending {}".format (sys.exc_info()[0]))
+      socket.close ()
+      return
+
+    try:
+      #  Send back every reply that is due; the identity frame tells ROUTER
+      #  which client it goes to
+      now = time.perf_counter ()
+      while pending and pending[0][0] <= now:
+        socket.send_multipart (heapq.heappop (pending)[2])
+        served += 1
+        if served % 10000 == 0:
+          print ("Served {} requests, {} in progress".format (served, len (pending)))
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error sending: {}".format (err))
+      socket.close ()
+      return
+    except:
+      print ("Some exception occurred receiving/sending {}".format (sys.exc_info()[0]))
+      socket.close ()
+      return
+
+##################################
+# Broker workers
+##################################
+class Worker ():
+  """ A worker thread or process serving the requests the broker hands it """
+
+  def __init__ (self, num, args):
+    self.num = num
+    self.args = args
+    self.served = 0   # requests served
+    self.busy = 0.0   # secs spent working on them
+    self.start_time = time.perf_counter ()
+
+  # Do some 'work' for a random time between 0 and twice the work time.
+  # We either sleep or, to mimic CPU-heavy handlers (e.g., deserializing
+  # large messages), spin on the CPU.
+  def work (self):
+    duration = random.uniform (0, 2 * self.args.work)
+    if self.args.cpu:
+      end = time.perf_counter () + duration
+      while time.perf_counter () < end:
+        pass
+    else:
+      time.sleep (duration)
+
+  # serve requests from the broker until our context is terminated
+  def run (self, context, endpoint):
+    try:
+      # A REQ socket suits a worker: the broker sees our identity plus an
+      # empty delimiter frame on everything we send, and we get exactly one
+      # request at a time.
+      socket = context.socket (zmq.REQ)
+      socket.setsockopt (zmq.IDENTITY, "worker-{}".format (self.num).encode ())
+      socket.connect (endpoint)
+      socket.send (READY)
+    except zmq.ZMQError as err:
+      print ("ZeroMQ Error in worker {}: {}".format (self.num, err))
+      return
+
+    while True:
+      try:
+        # the request is the client's identity, whatever frames the client
+        # sent before its message (e.g., a request ID), and the message
+        frames = socket.recv_multipart ()
+      except zmq.ContextTerminated:
+        socket.close ()
+        return
+      except zmq.ZMQError as err:
+        print ("ZeroMQ Error receiving in worker {}: {}".format (self.num, err))
+        socket.close ()
+        return
+
+      start = time.perf_counter ()
+      self.work ()
+      self.busy += time.perf_counter () - start
+      self.served += 1
+
+      try:
+        # same envelope as the request, but our ACK in place of the message
+        socket.send_multipart (frames[:-1] + [b"ACK"])
+      except zmq.ZMQError as err:
+        print ("ZeroMQ Error sending in worker {}: {}".format (self.num, err))
+        socket.close ()
+        return
+
+  def report (self):
+    elapsed = time.perf_counter () - self.start_time
+    print ("Worker {}: served {} requests, busy {:.3f} secs ({:.1f}% of the time), {:.3f} msecs per request".format (
+      self.num, self.served, self.busy, 100.0*self.busy/elapsed, 1e3*self.busy/max (1, self.served)))
+
+# the entry point of a worker process. It has a context of its own, and on
+# Ctrl-C (which reaches the whole process group) or SIGTERM from the broker
+# it stops and reports its stats.
+def worker_process (num, args, endpoint):
+  signal.signal (signal.SIGTERM, signal.default_int_handler)
+  worker = Worker (num, args)
+  try:
+    worker.run (zmq.Context (), endpoint)
+  except KeyboardInterrupt:
+    pass
+  finally:
+    worker.report ()
+
+##################################
+# Broker loop
+##################################
+def broker_loop (context, frontend, args):
+  try:
+    # The backend is another ROUTER socket, which the workers connect to.
+    # Threads reach it in-process; processes over TCP on the loopback.
+    backend = context.socket (zmq.ROUTER)
+    if args.procs:
+      endpoint = "tcp://127.0.0.1:{}".format (backend.bind_to_random_port ("tcp://127.0.0.1"))
+    else:
+      endpoint = "inproc://workers"
+      backend.bind (endpoint)
+    print ("Broker backend bound on {}".format (endpoint))
+  except zmq.ZMQError as err:
+    print ("ZeroMQ Error binding backend socket: {}".format (err))
+    frontend.close ()
+    return
+
+  # A SIGTERM (say, a plain kill) stops us just like Ctrl-C does, so that
+  # we still stop our workers rather than leave them running as orphans
+  signal.signal (signal.SIGTERM, signal.default_int_handler)
+
+  # start the workers
+  print ("Start {} worker {}".format (args.workers, "processes" if args.procs else "threads"))
+  workers = []
+  for num in range (args.workers):
+    if args.procs:
+      # spawn rather than fork so that the workers do not inherit our context.
+      # Daemonic workers are also terminated if we exit some other way.
+      worker = multiprocessing.get_context ("spawn").Process (target=worker_process, args=(num, args, endpoint), daemon=True)
+    else:
+      worker = Worker (num, args)
+      threading.Thread (target=worker.run, args=(context, endpoint), daemon=True).start ()
+    workers.append (worker)
+  if args.procs:
+    for worker in workers:
+      worker.start ()
+
+  # The free workers, least recently used first. We only take requests from
+  # the frontend while there is a free worker to hand them to; until then
+  # they queue up in ZMQ.
+  free = collections.deque ()
+  dispatched = collections.Counter ()  # requests handed to each worker
+  replied = 0
+  backend_only = zmq.Poller ()
+  backend_only.register (backend, zmq.POLLIN)
+  both = zmq.Poller ()
+  both.register (backend, zmq.POLLIN)
+  both.register (frontend, zmq.POLLIN)
+
+  print ("Broker now waiting to receive something")
+  try:
+    while True:
+      events = dict ((both if free else backend_only).poll ())
+
+      if backend in events:
+        # the worker's identity, the empty delimiter and either READY or a
+        # reply for the client; either way, the worker is free again
+        frames = backend.recv_multipart ()
+        free.append (frames[0])
+        if frames[2:] != [READY]:
+          frontend.send_multipart (frames[2:])
+          replied += 1
+          if replied % 10000 == 0:
+            print ("Served {} requests, per worker {}".format (replied, dict (dispatched)))
+
+      if frontend in events and free:
+        # the client's identity plus whatever it sent goes to the least
+        # recently used worker
+        frames = frontend.recv_multipart ()
+        worker = free.popleft ()
+        backend.send_multipart ([worker, b""] + frames)
+        dispatched[worker.decode ()] += 1
+  except KeyboardInterrupt:
+    pass
+  except zmq.ZMQError as err:
+    print ("ZeroMQ Error in broker: {}".format (err))
+  except:
+    print ("Some exception occurred in broker {}".format (sys.exc_info()[0]))
+
+  # stop the workers and report their stats
+  print ("Broker served {} requests, per worker {}".format (replied, dict (dispatched)))
+  if args.procs:
+    for worker in workers:
+      if worker.is_alive ():
+        worker.terminate ()  # i.e., SIGTERM
+    for worker in workers:
+      worker.join ()
+  else:
+    for worker in workers:
+      worker.report ()
+  backend.close ()
+  frontend.close ()
+
 ##################################
 # Driver program
 ##################################
@@ -41,9 +343,9 @@ def driver (args):
     # The socket concept in ZMQ is far more advanced than the traditional socket in
     # networking. Each socket we obtain from the context object must be of a certain
     # type. For TCP, we will use REP for server side (many other pairs are supported
-    # in ZMQ for tcp.
-    print ("Obtain the REP type socket")
-    socket = context.socket (zmq.REP)
+    # in ZMQ for tcp, e.g., ROUTER, which is what we use in router and broker mode.
+    print ("Obtain the {} type socket".format ("REP" if args.mode == "reqrep" else "ROUTER"))
+    socket = context.socket (zmq.REP if args.mode == "reqrep" else zmq.ROUTER)
   except zmq.ZMQError as err:
     print ("ZeroMQ Error obtaining REP socket: {}".format (err))
     return
@@ -67,38 +369,13 @@ def driver (args):
     socket.close ()
     return
 
-  # since we are a server, we service incoming clients forever
-  print ("Server now waiting to receive something")
-  while True:
-    try:
-      #  Wait for next request from client
-      message = socket.recv()
-      print("Received request: %s" % message)
-    except zmq.ZMQError as err:
-      print ("ZeroMQ Error receiving: {}".format (err))
-      socket.close ()
-      return
-    except:
-      print ("Some exception occurred receiving/sending {}".format (sys.exc_info()[0]))
-      socket.close ()
-      return
-
-
-    #  Do some 'work'. In this case we just sleep.
-    time.sleep (1)
-
-    try:
-      #  Send reply back to client
-      print ("Send dummy reply")
-      socket.send (b"ACK")
-    except zmq.ZMQError as err:
-      print ("ZeroMQ Error sending: {}".format (err))
-      socket.close ()
-      return
-    except:
-      print ("Some exception occurred receiving/sending {}".format (sys.exc_info()[0]))
-      socket.close ()
-      return
+  # now serve the clients in the chosen mode
+  if args.mode == "router":
+    router_loop (socket, args)
+  elif args.mode == "broker":
+    broker_loop (context, socket, args)
+  else:
+    reqrep_loop (socket, args)
 
 ##################################
 # Command line parsing
@@ -110,6 +387,11 @@ def parseCmdLineArgs ():
   # add optional arguments
   parser.add_argument ("-i", "--intf", default="*", help="Interface to bind to (default: *)")
   parser.add_argument ("-p", "--port", type=int, default=5555, help="Port to bind to (default: 5555)")
+  parser.add_argument ("-m", "--mode", choices=["reqrep", "router", "broker"], default="reqrep", help="REP socket answering one request at a time, ROUTER socket answering many concurrently and out of order, or ROUTER socket brokering requests to a pool of workers (default: reqrep)")
+  parser.add_argument ("-w", "--work", type=float, default=1.0, help="Secs of 'work' per request; in router and broker mode, the mean of a random work time (default: 1)")
+  parser.add_argument ("-n", "--workers", type=int, default=4, help="Number of workers in broker mode (default: 4)")
+  parser.add_argument ("--procs", action="store_true", help="In broker mode, run the workers as processes rather than threads")
+  parser.add_argument ("--cpu", action="store_true", help="In broker mode, spin on the CPU for the work time rather than sleep")
   args = parser.parse_args ()
 
   return args